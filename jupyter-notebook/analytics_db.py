@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Persistent DuckDB Analytics Database
+Builds eightsleep.duckdb from the source CSVs inside DuckDB and exposes
+the demo queries as reusable functions
+"""
+
+import logging
+import os
+
+import duckdb
+
+from cleaning import CURRENCY, DATE, INTEGER, SCHEMAS, source_columns
+from data_access import file_sha256
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = 'eightsleep.duckdb'
+
+# Source fingerprints recorded at build time; a table is rebuilt when its source changes
+SOURCES_TABLE = '_sources'
+
+
+def quote(identifier):
+    """Quote a column name for DuckDB"""
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def column_expression(header, spec):
+    """SQL that cleans one raw VARCHAR column, mirroring 004_datasample_import_queries.sql"""
+    column = quote(header)
+    if spec.kind == CURRENCY:
+        return f"TRY_CAST(NULLIF(REPLACE(REPLACE({column}, '$', ''), ',', ''), '') AS DECIMAL(15,2))"
+    if spec.kind == INTEGER:
+        return f"TRY_CAST(NULLIF(REPLACE({column}, ',', ''), '') AS BIGINT)"
+    if spec.kind == DATE:
+        # ISO dates cast directly; exports use MM/DD/YYYY
+        return f"COALESCE(TRY_CAST({column} AS DATE), CAST(TRY_STRPTIME({column}, '%m/%d/%Y') AS DATE))"
+    return column
+
+
+def build_table_sql(table_name, path):
+    """CREATE OR REPLACE TABLE ... AS SELECT <cleaned columns> FROM read_csv(...)"""
+    columns = source_columns(path, table_name)
+    by_name = {spec.name: header for header, spec in columns.items()}
+    select = ',\n    '.join(
+        f"{column_expression(by_name[spec.name], spec)} AS {spec.name}"
+        for spec in SCHEMAS[table_name].columns if spec.name in by_name
+    )
+    return (f"CREATE OR REPLACE TABLE {table_name} AS\n"
+            f"SELECT\n    {select}\n"
+            f"FROM read_csv(?, header = true, all_varchar = true)")
+
+
+def source_fingerprint(path):
+    """(mtime_ns, size) of a source file"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def recorded_sources(con):
+    """table_name -> (path, mtime_ns, size, sha256) as of the last build"""
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SOURCES_TABLE} (
+            table_name VARCHAR PRIMARY KEY,
+            path VARCHAR,
+            mtime_ns BIGINT,
+            size BIGINT,
+            sha256 VARCHAR,
+            built_at TIMESTAMP DEFAULT current_timestamp
+        )
+    """)
+    rows = con.execute(f"SELECT table_name, path, mtime_ns, size, sha256 FROM {SOURCES_TABLE}").fetchall()
+    return {row[0]: row[1:] for row in rows}
+
+
+def needs_rebuild(path, recorded):
+    """True when the source file differs from the one the table was built from"""
+    if recorded is None:
+        return True
+    recorded_path, mtime_ns, size, sha256 = recorded
+    if recorded_path != os.path.abspath(path):
+        return True
+    if (mtime_ns, size) == source_fingerprint(path):
+        return False
+    return sha256 != file_sha256(path)
+
+
+def refresh(con, data_dir='.', force=False):
+    """Rebuild the tables whose source CSV changed; returns the rebuilt table names"""
+    recorded = recorded_sources(con)
+    rebuilt = []
+    for table_name, schema in SCHEMAS.items():
+        path = os.path.join(data_dir, schema.filename)
+        if not force and not needs_rebuild(path, recorded.get(table_name)):
+            continue
+        mtime_ns, size = source_fingerprint(path)
+        con.execute("BEGIN TRANSACTION")
+        try:
+            con.execute(build_table_sql(table_name, path), [path])
+            con.execute(f"INSERT OR REPLACE INTO {SOURCES_TABLE} (table_name, path, mtime_ns, size, sha256) "
+                        f"VALUES (?, ?, ?, ?, ?)",
+                        [table_name, os.path.abspath(path), mtime_ns, size, file_sha256(path)])
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        rows = con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        logger.info(f"Built {table_name} ({rows} rows) from {path}")
+        rebuilt.append(table_name)
+    return rebuilt
+
+
+def connect(db_path=DEFAULT_DB_PATH, data_dir='.', read_only=False):
+    """Open the analytics database, rebuilding any table whose source changed"""
+    if read_only:
+        return duckdb.connect(db_path, read_only=True)
+    con = duckdb.connect(db_path)
+    refresh(con, data_dir)
+    return con
+
+
+# ---- Analytical queries ----
+
+def channel_summary(con):
+    """Average monthly spend, visitors, orders and revenue per channel"""
+    return con.execute("""
+        SELECT
+            channel,
+            COUNT(*) as months,
+            AVG(spend) as avg_spend,
+            AVG(visitors) as avg_visitors,
+            AVG(last_click_orders) as avg_orders,
+            AVG(last_click_revenue) as avg_revenue
+        FROM channel_performance
+        GROUP BY channel
+        ORDER BY avg_revenue DESC
+    """).fetchdf()
+
+
+def monthly_trends(con, limit=10):
+    """Total spend, revenue and visitors per month across channels"""
+    return con.execute("""
+        SELECT
+            strftime(month, '%Y-%m') as month,
+            SUM(spend) as total_spend,
+            SUM(last_click_revenue) as total_revenue,
+            SUM(visitors) as total_visitors
+        FROM channel_performance
+        GROUP BY 1
+        ORDER BY 1
+        LIMIT ?
+    """, [limit]).fetchdf()
+
+
+def roi_analysis(con):
+    """ROI % per paid channel"""
+    return con.execute("""
+        SELECT
+            channel,
+            SUM(spend) as total_spend,
+            SUM(last_click_revenue) as total_revenue,
+            ROUND((SUM(last_click_revenue) - SUM(spend)) / SUM(spend) * 100, 2) as roi_percent
+        FROM channel_performance
+        WHERE spend > 0
+        GROUP BY channel
+        ORDER BY roi_percent DESC
+    """).fetchdf()
+
+
+def daily_metrics(con, limit=10):
+    """Average daily spend, orders and bookings per month"""
+    return con.execute("""
+        SELECT
+            strftime(date, '%Y-%m') as month,
+            ROUND(AVG(daily_spend), 2) as avg_daily_spend,
+            ROUND(AVG(orders), 2) as avg_daily_orders,
+            ROUND(AVG(bookings), 2) as avg_daily_bookings
+        FROM wbr_global_data
+        GROUP BY 1
+        ORDER BY 1
+        LIMIT ?
+    """, [limit]).fetchdf()
+
+
+def regional_summary(con, limit=15):
+    """Average orders and units per region and customer type"""
+    return con.execute("""
+        SELECT
+            region,
+            customer_type,
+            COUNT(*) as records,
+            ROUND(AVG(orders), 2) as avg_orders,
+            ROUND(AVG(units), 2) as avg_units
+        FROM wbr_regional_data
+        GROUP BY region, customer_type
+        ORDER BY region, customer_type
+        LIMIT ?
+    """, [limit]).fetchdf()
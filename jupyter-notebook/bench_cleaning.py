@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Cleaning Benchmark
+Compares the legacy two-pass str.replace cleaning with cleaning.read_table
+on a synthetic wbr_regional_data file
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from cleaning import read_table
+
+REGIONS = ['US', 'CA', 'GB', 'EU', 'AU', 'Other']
+CUSTOMER_TYPES = ['1. New Members', '2. Member Upgrades', '3. Subscription Renewals', '4. Exchanges']
+
+
+def write_synthetic_regional_csv(path, rows, chunk_rows=1_000_000, seed=0):
+    """Write a wbr_regional_data-shaped CSV ('$1,234' bookings, an empty trailing column)"""
+    rng = np.random.default_rng(seed)
+    # Sampling pre-formatted strings keeps generation fast for 10M rows
+    bookings_pool = np.array([f"${value:,}" for value in rng.integers(0, 250_000, 100_000)], dtype=object)
+    rows_per_day = len(REGIONS) * len(CUSTOMER_TYPES)
+    written = 0
+    with open(path, 'w') as f:
+        f.write('Date,Customer Type,Region,Bookings,Orders,Units,\n')
+        while written < rows:
+            n = min(chunk_rows, rows - written)
+            index = np.arange(written, written + n)
+            days = pd.Timestamp('2000-01-01') + pd.to_timedelta(index // rows_per_day, unit='D')
+            chunk = pd.DataFrame({
+                'Date': days.strftime('%m/%d/%Y'),
+                'Customer Type': np.array(CUSTOMER_TYPES, dtype=object)[index % len(CUSTOMER_TYPES)],
+                'Region': np.array(REGIONS, dtype=object)[(index // len(CUSTOMER_TYPES)) % len(REGIONS)],
+                'Bookings': bookings_pool[rng.integers(0, len(bookings_pool), n)],
+                'Orders': rng.integers(0, 90, n),
+                'Units': rng.integers(0, 95, n),
+                'Empty': '',
+            })
+            chunk.to_csv(f, header=False, index=False)
+            written += n
+
+
+def legacy_read_regional(path):
+    """The cleaning previously copy-pasted into each import script"""
+    df = pd.read_csv(path)
+    df = df.dropna(how='all', axis=1)
+    df['Bookings'] = df['Bookings'].astype(str).str.replace('$', '').str.replace(',', '')
+    df['Bookings'] = pd.to_numeric(df['Bookings'], errors='coerce')
+    df['Date'] = pd.to_datetime(df['Date']).dt.date
+    return df
+
+
+def time_call(func, *args):
+    """Return (result, seconds)"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CSV cleaning on synthetic regional data")
+    parser.add_argument('--rows', type=int, default=10_000_000, help="synthetic rows (default: 10M)")
+    parser.add_argument('--path', help="reuse/write the synthetic CSV here instead of a temp file")
+    args = parser.parse_args(argv)
+
+    path = args.path or os.path.join(tempfile.gettempdir(), f'wbr_regional_synthetic_{args.rows}.csv')
+    if not os.path.exists(path):
+        print(f"📝 Writing {args.rows:,} synthetic rows to {path}...")
+        _, seconds = time_call(write_synthetic_regional_csv, path, args.rows)
+        print(f"   done in {seconds:.1f}s ({os.path.getsize(path) / 1e6:,.0f} MB)")
+
+    legacy, legacy_seconds = time_call(legacy_read_regional, path)
+    rows = len(legacy)
+    del legacy
+    print(f"\n⏱️  Cleaning {rows:,} regional rows")
+    print(f"   legacy str.replace: {legacy_seconds:.2f}s ({rows / legacy_seconds:,.0f} rows/s)")
+    for engine in ('c', 'pyarrow'):
+        _, seconds = time_call(read_table, path, 'wbr_regional_data', None, engine)
+        print(f"   read_table(engine='{engine}'): {seconds:.2f}s ({rows / seconds:,.0f} rows/s, "
+              f"{legacy_seconds / seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Forecast Server Benchmark
+Concurrent POST /predict load against forecast_server.py, reporting
+client-side latency percentiles, throughput and the server's own metrics
+"""
+
+import argparse
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import numpy as np
+
+
+def request_bodies(requests, days, repeat, seed=0):
+    """JSON bodies: a `repeat` share drawn from 50 recurring plans (cache hits), the rest unique"""
+    rng = np.random.default_rng(seed)
+    recurring = rng.uniform(20_000, 60_000, size=(50, days)).round(2)
+    bodies = []
+    for _ in range(requests):
+        plan = recurring[rng.integers(len(recurring))] if rng.random() < repeat else rng.uniform(20_000, 60_000, days)
+        bodies.append(json.dumps({'spend': plan.tolist()}).encode())
+    return bodies
+
+
+def run_client(host, port, bodies):
+    """Send bodies over one keep-alive connection; returns per-request seconds"""
+    conn = http.client.HTTPConnection(host, port)
+    latencies = []
+    for body in bodies:
+        start = time.perf_counter()
+        conn.request('POST', '/predict', body, {'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}")
+    conn.close()
+    return latencies
+
+
+def get_json(host, port, path):
+    conn = http.client.HTTPConnection(host, port)
+    conn.request('GET', path)
+    data = json.loads(conn.getresponse().read())
+    conn.close()
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark forecast_server.py under concurrent requests")
+    parser.add_argument('--url', help="running server (default: start one in-process on a free port)")
+    parser.add_argument('--path', default="wbr_global_data.csv", help="global WBR CSV for the in-process server")
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=32, help="client connections")
+    parser.add_argument('--days', type=int, default=28, help="days per spend plan")
+    parser.add_argument('--repeat', type=float, default=0.5, help="share of requests repeating a recent plan")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.url:
+        url = urlparse(args.url)
+        host, port = url.hostname, url.port
+    else:
+        from forecast_server import ForecastService, make_server
+        server = make_server(ForecastService.from_csv(args.path), port=0)
+        host, port = server.server_address
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    bodies = request_bodies(args.requests, args.days, args.repeat)
+    batches = [bodies[i::args.concurrency] for i in range(args.concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = np.concatenate([np.asarray(lat) for lat in pool.map(lambda b: run_client(host, port, b), batches)])
+    elapsed = time.perf_counter() - start
+
+    p50, p90, p99 = np.percentile(latencies * 1000, [50, 90, 99])
+    print(f"\n⏱️  {len(latencies):,} requests, {args.concurrency} connections, {args.days}-day plans: "
+          f"{len(latencies) / elapsed:,.0f} req/s")
+    print(f"   client latency p50 {p50:.2f} ms, p90 {p90:.2f} ms, p99 {p99:.2f} ms, max {latencies.max() * 1000:.2f} ms")
+    metrics = get_json(host, port, '/metrics')
+    route = metrics['routes'].get('/predict', {})
+    print(f"   server latency p50 {route.get('p50_ms', 0):.2f} ms, p99 {route.get('p99_ms', 0):.2f} ms; "
+          f"cache hit rate {metrics['cache']['hit_rate']:.0%}")
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - End-to-End Import Benchmark
+Generates synthetic datasets in the three CSV formats and times each import
+path (Supabase upsert via the local stand-in, local COPY, local to_sql)
+against the local PostgreSQL database, appending results to a JSON Lines file
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from cleaning import SCHEMAS
+from data_access import clear_cache
+from import_local_data import LOCAL_DB_CONFIG
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'migrations'))
+
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+PATHS = ('supabase_upsert', 'local_copy', 'local_to_sql')
+
+DEFAULT_DSN = (f"postgresql://{LOCAL_DB_CONFIG['user']}:{LOCAL_DB_CONFIG['password']}"
+               f"@{LOCAL_DB_CONFIG['host']}:{LOCAL_DB_CONFIG['port']}/{LOCAL_DB_CONFIG['database']}")
+DEFAULT_OUTPUT = 'bench_import_results.jsonl'
+
+REGIONS = ['US', 'CA', 'GB', 'EU', 'AU', 'Other']
+CUSTOMER_TYPES = ['1. New Members', '2. Member Upgrades', '3. Subscription Renewals', '4. Exchanges']
+CHANNELS = ['YouTube Ads', 'FB Ads', 'Google Ads', 'Organic + Direct']
+
+# Dates must stay unique per natural key; beyond this many days extra customer types are added
+MAX_DAYS = 365 * 50
+START_DATE = pd.Timestamp('2000-01-01')
+
+ROLLUP_TABLES = ['rollup_channel_monthly', 'rollup_global_weekly', 'rollup_global_monthly',
+                 'rollup_regional_weekly', 'rollup_regional_monthly']
+
+
+# ---- Synthetic data ----
+
+def money(values):
+    """'$1,234' strings, as in the exports"""
+    return pd.Series(values).map('${:,}'.format)
+
+
+def regional_layout(rows):
+    """(days, customer types) giving at least `rows` unique (date, region, customer_type) keys"""
+    days = min(math.ceil(rows / (len(REGIONS) * len(CUSTOMER_TYPES))), MAX_DAYS)
+    n_types = max(len(CUSTOMER_TYPES), math.ceil(rows / (days * len(REGIONS))))
+    types = CUSTOMER_TYPES + [f"{i}. Segment {i}" for i in range(len(CUSTOMER_TYPES) + 1, n_types + 1)]
+    return days, types
+
+
+def write_regional_csv(path, rows, days, types, rng, chunk_rows=1_000_000):
+    """wbr_regional_data.csv with `rows` rows (and the export's empty trailing column)"""
+    per_day = len(REGIONS) * len(types)
+    types = np.array(types, dtype=object)
+    regions = np.array(REGIONS, dtype=object)
+    with open(path, 'w') as f:
+        f.write('Date,Customer Type,Region,Bookings,Orders,Units,\n')
+        for offset in range(0, rows, chunk_rows):
+            index = np.arange(offset, min(offset + chunk_rows, rows))
+            dates = START_DATE + pd.to_timedelta(index // per_day, unit='D')
+            pd.DataFrame({
+                'Date': dates.strftime('%m/%d/%Y'),
+                'Customer Type': types[index % len(types)],
+                'Region': regions[(index // len(types)) % len(REGIONS)],
+                'Bookings': money(rng.integers(0, 250_000, len(index))).values,
+                'Orders': rng.integers(0, 90, len(index)),
+                'Units': rng.integers(0, 95, len(index)),
+                'Empty': '',
+            }).to_csv(f, header=False, index=False)
+
+
+def write_synthetic_datasets(data_dir, rows, seed=0):
+    """Write the three CSVs for a `rows`-row regional table; returns rows per table"""
+    os.makedirs(data_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    days, types = regional_layout(rows)
+    write_regional_csv(os.path.join(data_dir, SCHEMAS['wbr_regional_data'].filename), rows, days, types, rng)
+
+    dates = pd.date_range(START_DATE, periods=days, freq='D')
+    pd.DataFrame({
+        'Date': dates.strftime('%m/%d/%Y'),
+        'Daily Spend': money(rng.integers(10_000, 80_000, days)).values,
+        'Orders': rng.integers(50, 200, days),
+        'Bookings': money(rng.integers(100_000, 600_000, days)).values,
+        'Visitors': pd.Series(rng.integers(10_000, 40_000, days)).map('{:,}'.format).values,
+    }).to_csv(os.path.join(data_dir, SCHEMAS['wbr_global_data'].filename), index=False)
+
+    months = pd.date_range(START_DATE, dates[-1], freq='MS')
+    channel = pd.DataFrame([(c, m) for m in months for c in CHANNELS], columns=['Channel', 'Month'])
+    n = len(channel)
+    pd.DataFrame({
+        'Channel': channel['Channel'],
+        'Spend': money(rng.integers(0, 500_000, n)).values,
+        'Month': channel['Month'].dt.strftime('%m/%d/%Y'),
+        'Visitors': rng.integers(10_000, 500_000, n),
+        'Last Click Add To Cart': rng.integers(0, 2_000, n),
+        'Last Click Orders': rng.integers(0, 500, n),
+        'Last Click Revenue': money(rng.integers(0, 4_000_000, n)).values,
+        'Last Click Email Captures': rng.integers(0, 40_000, n),
+        'Email capture conversions 30 day window': rng.integers(0, 700, n),
+        'Email capture conversions 60 day window': rng.integers(0, 700, n),
+    }).to_csv(os.path.join(data_dir, SCHEMAS['channel_performance'].filename), index=False)
+    return {'channel_performance': n, 'wbr_global_data': days, 'wbr_regional_data': rows}
+
+
+# ---- One benchmark run (in a fresh process) ----
+
+def reset_tables(dsn):
+    """Empty the source and rollup tables"""
+    import psycopg2
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {', '.join(list(SCHEMAS) + ROLLUP_TABLES)} RESTART IDENTITY")
+    conn.close()
+
+
+def table_counts(dsn):
+    """Rows per source table"""
+    import psycopg2
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cursor:
+        counts = {}
+        for table_name in SCHEMAS:
+            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+            counts[table_name] = cursor.fetchone()[0]
+    conn.close()
+    return counts
+
+
+def run_supabase_upsert(dsn, data_dir, options):
+    """import_data.py's concurrent upsert path against the Postgres-backed stand-in"""
+    import asyncio
+    import import_data
+    from local_supabase import AsyncLocalSupabase
+    client = AsyncLocalSupabase(dsn, latency=options['latency'], max_connections=options['concurrency'])
+    try:
+        stats = asyncio.run(import_data.import_all(client, options['batch_size'],
+                                                   concurrency=options['concurrency'],
+                                                   memory_limit=options['memory_limit'], data_dir=data_dir))
+    finally:
+        client.close()
+    return {stat.table: stat.seconds for stat in stats}
+
+
+def run_local(dsn, data_dir, loader, workers, memory_limit):
+    """import_local_data.py with the given loader, tables loaded concurrently"""
+    import import_local_data
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlalchemy import create_engine
+    engine = create_engine(dsn.replace('postgresql://', 'postgresql+psycopg2://', 1),
+                           pool_size=workers, max_overflow=0)
+
+    def timed(import_table):
+        start = time.perf_counter()
+        import_table(engine, loader=loader, memory_limit=memory_limit, data_dir=data_dir)
+        return time.perf_counter() - start
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {table_name: pool.submit(timed, import_table)
+                       for table_name, import_table in import_local_data.IMPORTERS.items()}
+            seconds = {table_name: future.result() for table_name, future in futures.items()}
+    finally:
+        engine.dispose()
+    return seconds
+
+
+def run_once(path, dsn, data_dir, options):
+    """Cold import of every table (CSV parse included); returns timings and peak RSS"""
+    import logging
+    logging.disable(logging.INFO)
+    reset_tables(dsn)
+    clear_cache(data_dir)
+
+    start = time.perf_counter()
+    if path == 'supabase_upsert':
+        seconds = run_supabase_upsert(dsn, data_dir, options)
+    else:
+        seconds = run_local(dsn, data_dir, path.split('_', 1)[1], options['workers'], options['memory_limit'])
+    total = time.perf_counter() - start
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak_rss *= 1024  # Linux reports KiB
+    return {'seconds': total, 'table_seconds': seconds, 'peak_rss_bytes': peak_rss, 'rows': table_counts(dsn)}
+
+
+def run_isolated(path, dsn, data_dir, options):
+    """run_once in a fresh interpreter so peak RSS covers this run only"""
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(run_once, (path, dsn, data_dir, options))
+
+
+# ---- Reporting ----
+
+def git_commit():
+    """Current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def append_result(output, record):
+    """Append one JSON line"""
+    with open(output, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the CSV import paths on synthetic data")
+    parser.add_argument('--dsn', default=DEFAULT_DSN, help="local PostgreSQL initialised from init-local-db.sql")
+    parser.add_argument('--sizes', default='10k,1m,10m', help=f"comma-separated, from {list(SIZES)}")
+    parser.add_argument('--paths', default=','.join(PATHS), help=f"comma-separated, from {list(PATHS)}")
+    parser.add_argument('--data-dir', default=os.path.join('bench_data'), help="where synthetic CSVs are kept")
+    parser.add_argument('--batch-size', type=int, default=1000, help="supabase_upsert rows per request")
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help="supabase_upsert requests in flight across all tables")
+    parser.add_argument('--workers', type=int, default=3, help="local_* tables loaded concurrently")
+    parser.add_argument('--memory-limit', type=int, default=256, help="MB per chunk of the streaming pipeline")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="seconds added per stand-in request to model the network round-trip")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="JSON Lines file results are appended to")
+    args = parser.parse_args(argv)
+
+    sizes = [s.strip().lower() for s in args.sizes.split(',')]
+    paths = [p.strip() for p in args.paths.split(',')]
+    for name in sizes:
+        if name not in SIZES:
+            parser.error(f"unknown size {name!r}")
+    for name in paths:
+        if name not in PATHS:
+            parser.error(f"unknown path {name!r}")
+
+    options = {'batch_size': args.batch_size, 'concurrency': args.concurrency, 'workers': args.workers,
+               'memory_limit': args.memory_limit * 2**20, 'latency': args.latency}
+    run_meta = {'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'commit': git_commit(),
+                'host': platform.node(), 'python': platform.python_version(), 'cpus': os.cpu_count(),
+                'options': options}
+
+    for size in sizes:
+        data_dir = os.path.join(args.data_dir, size)
+        marker = os.path.join(data_dir, 'rows.json')
+        if not os.path.exists(marker):
+            print(f"📝 Writing {size} synthetic dataset to {data_dir}...")
+            rows = write_synthetic_datasets(data_dir, SIZES[size])
+            with open(marker, 'w') as f:
+                json.dump(rows, f)
+
+        for path in paths:
+            print(f"⏱️  {size} / {path}...", flush=True)
+            result = run_isolated(path, args.dsn, os.path.abspath(data_dir), options)
+            rows = sum(result['rows'].values())
+            record = {**run_meta, 'size': size, 'path': path, 'rows': rows, 'table_rows': result['rows'],
+                      'seconds': round(result['seconds'], 3),
+                      'table_seconds': {t: round(s, 3) for t, s in result['table_seconds'].items()},
+                      'rows_per_second': round(rows / result['seconds'], 1),
+                      'peak_rss_mb': round(result['peak_rss_bytes'] / 1e6, 1)}
+            append_result(args.output, record)
+            print(f"   {rows:,} rows in {record['seconds']:.2f}s ({record['rows_per_second']:,.0f} rows/s), "
+                  f"peak RSS {record['peak_rss_mb']:,.0f} MB")
+
+    print(f"\n✅ Results appended to {os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
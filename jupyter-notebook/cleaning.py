@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Shared CSV Cleaning
+Declarative per-table schemas and vectorized parsers used by every import script
+"""
+
+import re
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from instrumentation import span
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:  # pandas-only fallback
+    pa = None
+
+# Column kinds understood by clean_table
+TEXT = 'text'
+DATE = 'date'
+CURRENCY = 'currency'
+INTEGER = 'integer'
+
+# Characters stripped from currency/number strings
+NUMBER_JUNK_PATTERN = r'[$,]'
+
+# Rows parsed up front to size the chunks of the streaming reader
+SAMPLE_ROWS = 10_000
+
+# Copies of a chunk alive at once on its way through read -> clean -> load
+PIPELINE_COPIES = 4
+
+MIN_CHUNK_ROWS = 1_000
+
+
+@dataclass(frozen=True)
+class ColumnSpec:
+    """One database column and the CSV headers it may appear under"""
+    name: str
+    kind: str
+    aliases: tuple = ()
+
+
+@dataclass(frozen=True)
+class TableSchema:
+    """Source file, natural key and typed columns of one table"""
+    table: str
+    filename: str
+    date_column: str
+    natural_key: tuple
+    columns: tuple = field(default_factory=tuple)
+
+    @property
+    def column_names(self):
+        return [column.name for column in self.columns]
+
+    def header_lookup(self):
+        """Map normalized CSV headers (names and aliases) to column specs"""
+        lookup = {}
+        for column in self.columns:
+            lookup[column.name] = column
+            for alias in column.aliases:
+                lookup[normalize_header(alias)] = column
+        return lookup
+
+
+SCHEMAS = {
+    'channel_performance': TableSchema(
+        table='channel_performance',
+        filename='channel_performance.csv',
+        date_column='month',
+        natural_key=('channel', 'month'),
+        columns=(
+            ColumnSpec('channel', TEXT),
+            ColumnSpec('spend', CURRENCY),
+            ColumnSpec('month', DATE),
+            ColumnSpec('visitors', INTEGER),
+            ColumnSpec('last_click_add_to_cart', INTEGER),
+            ColumnSpec('last_click_orders', INTEGER),
+            ColumnSpec('last_click_revenue', CURRENCY),
+            ColumnSpec('last_click_email_captures', INTEGER),
+            ColumnSpec('email_capture_conversions_30_day', INTEGER,
+                       ('Email capture conversions 30 day window', 'email_capture_conversion_30days_window')),
+            ColumnSpec('email_capture_conversions_60_day', INTEGER,
+                       ('Email capture conversions 60 day window', 'email_capture_conversion_60days_window',
+                        'email_capture_conversion_60days_windo')),
+        ),
+    ),
+    'wbr_global_data': TableSchema(
+        table='wbr_global_data',
+        filename='wbr_Global_data.csv',
+        date_column='date',
+        natural_key=('date',),
+        columns=(
+            ColumnSpec('date', DATE),
+            ColumnSpec('daily_spend', CURRENCY),
+            ColumnSpec('orders', INTEGER),
+            ColumnSpec('bookings', CURRENCY),
+            ColumnSpec('visitors', INTEGER),
+        ),
+    ),
+    'wbr_regional_data': TableSchema(
+        table='wbr_regional_data',
+        filename='wbr_regional_data.csv',
+        date_column='date',
+        natural_key=('date', 'region', 'customer_type'),
+        columns=(
+            ColumnSpec('date', DATE),
+            ColumnSpec('customer_type', TEXT),
+            ColumnSpec('region', TEXT),
+            ColumnSpec('bookings', CURRENCY),
+            ColumnSpec('orders', INTEGER),
+            ColumnSpec('units', INTEGER),
+        ),
+    ),
+}
+
+
+def normalize_header(name):
+    """'Last Click Add To Cart' -> 'last_click_add_to_cart'"""
+    return re.sub(r'[^0-9a-z]+', '_', str(name).strip().lower()).strip('_')
+
+
+def parse_currency(values):
+    """Parse '$1,234.50'-style strings to float64 in one vectorized pass"""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype('float64')
+    if pa is not None:
+        # Literal replaces on Arrow buffers are several times faster than a regex
+        strings = pa.array(values, type=pa.string(), from_pandas=True)
+        stripped = pc.replace_substring(pc.replace_substring(strings, '$', ''), ',', '')
+        stripped = pc.if_else(pc.equal(stripped, ''), pa.scalar(None, pa.string()), stripped)
+        try:
+            parsed = pc.cast(stripped, pa.float64())
+            return pd.Series(parsed.to_numpy(zero_copy_only=False), index=values.index, name=values.name)
+        except pa.ArrowInvalid:
+            # Stray text values; fall back to coercing them to NaN
+            return pd.to_numeric(pd.Series(stripped.to_pandas(), index=values.index, name=values.name),
+                                 errors='coerce')
+    return pd.to_numeric(values.str.replace(NUMBER_JUNK_PATTERN, '', regex=True), errors='coerce')
+
+
+def parse_integer(values):
+    """Parse counts to int64, or nullable Int64 when values are missing"""
+    if not pd.api.types.is_integer_dtype(values):
+        values = parse_currency(values)
+    if values.isna().any():
+        return values.astype('Int64')
+    return values.astype('int64')
+
+
+PARSERS = {
+    TEXT: lambda values: values,
+    DATE: pd.to_datetime,
+    CURRENCY: parse_currency,
+    INTEGER: parse_integer,
+}
+
+
+def rename_to_schema(df, table_name):
+    """Rename CSV headers to database columns and drop columns outside the schema"""
+    lookup = SCHEMAS[table_name].header_lookup()
+    rename = {}
+    for header in df.columns:
+        column = lookup.get(normalize_header(header))
+        if column is not None:
+            rename[header] = column.name
+    return df[list(rename)].rename(columns=rename)
+
+
+def clean_table(df, table_name, since=None):
+    """Rename, type and (optionally) date-filter a raw DataFrame of one source table.
+
+    Dates are parsed first so rows before `since` are dropped before the
+    more expensive numeric parsing.
+    """
+    schema = SCHEMAS[table_name]
+    with span('rename', rows=len(df)):
+        df = rename_to_schema(df, table_name)
+
+    with span('parse_dates', rows=len(df), column=schema.date_column):
+        df[schema.date_column] = pd.to_datetime(df[schema.date_column])
+    if since is not None:
+        with span('filter_since', rows=len(df)):
+            df = df[df[schema.date_column] >= pd.Timestamp(since)].copy()
+
+    for column in schema.columns:
+        if column.name in df.columns and column.kind != DATE:
+            with span(f'parse_{column.name}', rows=len(df), kind=column.kind):
+                df[column.name] = PARSERS[column.kind](df[column.name])
+    return df[[name for name in schema.column_names if name in df.columns]]
+
+
+def source_columns(path, table_name):
+    """CSV headers of a source file that belong to the table schema, mapped to their specs"""
+    lookup = SCHEMAS[table_name].header_lookup()
+    header = pd.read_csv(path, nrows=0).columns
+    return {name: lookup[normalize_header(name)] for name in header if normalize_header(name) in lookup}
+
+
+def arrow_convert_options(columns):
+    """Read only the schema columns, every one as a string"""
+    return pa_csv.ConvertOptions(include_columns=list(columns),
+                                 column_types={name: pa.string() for name in columns})
+
+
+def arrow_to_pandas(table):
+    """Arrow table/batch -> DataFrame with Arrow-backed string columns"""
+    return table.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get)
+
+
+def read_csv_arrow(path, columns):
+    """Parse the schema columns of a CSV with the multi-threaded pyarrow reader.
+
+    Every column is read as a string so thousands separators and '$' never
+    trip type inference; the Arrow-backed strings go straight into the parsers.
+    """
+    return arrow_to_pandas(pa_csv.read_csv(path, convert_options=arrow_convert_options(columns)))
+
+
+def read_table(path, table_name, since=None, engine='pyarrow'):
+    """Read a source CSV with typed dtypes and return the cleaned table.
+
+    Only schema columns are read (stray empty 'Unnamed' columns never reach
+    memory). With engine='pyarrow' the file is parsed by the pyarrow CSV
+    reader; with engine='c' counts are parsed by the C parser with
+    thousands=',' and currency columns are read as Arrow strings.
+    """
+    columns = source_columns(path, table_name)
+    if engine == 'pyarrow' and pa is not None:
+        with span('read_csv', table=table_name, engine='pyarrow') as s:
+            raw = read_csv_arrow(path, columns)
+            s.rows = len(raw)
+        return clean_table(raw, table_name, since)
+
+    dtype = {name: str for name, spec in columns.items() if spec.kind in (TEXT, DATE)}
+    if pa is not None:
+        # Arrow-backed strings go straight into parse_currency without a copy
+        dtype.update({name: 'string[pyarrow]' for name, spec in columns.items() if spec.kind == CURRENCY})
+    else:
+        dtype.update({name: str for name, spec in columns.items() if spec.kind == CURRENCY})
+    with span('read_csv', table=table_name, engine='c') as s:
+        df = pd.read_csv(path, usecols=list(columns), dtype=dtype, thousands=',')
+        s.rows = len(df)
+    return clean_table(df, table_name, since)
+
+
+def plan_chunks(path, table_name, memory_limit):
+    """(rows, CSV bytes) per chunk so one chunk's trip through read -> clean -> load stays under memory_limit bytes.
+
+    Sized from the first SAMPLE_ROWS rows; the rest of the file is never scanned up front.
+    """
+    columns = source_columns(path, table_name)
+    with span("plan_chunks", path=path):
+        sample = pd.read_csv(path, nrows=SAMPLE_ROWS, usecols=list(columns), dtype=str)
+        if sample.empty:
+            return MIN_CHUNK_ROWS, 1 << 20
+        raw_bytes = sample.memory_usage(deep=True, index=False).sum()
+        clean_bytes = clean_table(sample.copy(), table_name).memory_usage(deep=True, index=False).sum()
+    row_bytes = (raw_bytes + clean_bytes) / len(sample) * PIPELINE_COPIES
+    rows = max(MIN_CHUNK_ROWS, int(memory_limit // row_bytes))
+
+    with open(path, 'rb') as f:
+        f.readline()  # header
+        line_bytes = sum(len(f.readline()) for _ in range(len(sample))) / len(sample)
+    return rows, max(int(rows * line_bytes), 1 << 16)
+
+
+def iter_csv_chunks(path, table_name, memory_limit, since=None):
+    """Yield the cleaned table chunk by chunk, streaming the CSV so memory stays flat whatever the file size.
+
+    Chunks come from pyarrow's streaming CSV reader (pandas' chunked reader
+    without pyarrow); chunks left empty by `since` are skipped.
+    """
+    columns = source_columns(path, table_name)
+    rows, block_bytes = plan_chunks(path, table_name, memory_limit)
+    if pa is not None:
+        reader = pa_csv.open_csv(path, read_options=pa_csv.ReadOptions(block_size=block_bytes),
+                                 convert_options=arrow_convert_options(columns))
+        chunks = (arrow_to_pandas(batch) for batch in reader)
+    else:
+        chunks = iter(pd.read_csv(path, usecols=list(columns), dtype=str, chunksize=rows))
+    while True:
+        with span('read_csv', table=table_name, engine='stream') as s:
+            chunk = next(chunks, None)
+            s.rows = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            return
+        df = clean_table(chunk, table_name, since)
+        if len(df):
+            yield df
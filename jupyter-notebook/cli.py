@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Command Line Interface
+One entry point for importing, verifying, querying, forecasting, publishing
+forecasts, serving and benchmarking. The backend (supabase, local-postgres, duckdb) and the data
+folder come from eightsleep.toml; each subcommand imports only what it uses,
+so `python cli.py verify` starts without pandas, prophet or the Supabase SDK.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+from settings import BACKENDS, load_settings, postgres_dsn, postgres_url
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'migrations')
+
+QUERY_FORMATS = ('table', 'csv', 'json')
+
+# forecast subcommand -> (module, data argument, source table it reads, or None for the data folder)
+FORECASTS = {
+    'cv': ('forecasting', '--path', 'wbr_global_data'),
+    'optimize': ('spend_optimizer', '--path', 'wbr_global_data'),
+    'regional': ('hierarchical_forecast', '--data-dir', None),
+    'mmm': ('mmm', '--data-dir', None),
+    'pipeline': ('forecast_pipeline', '--path', 'wbr_global_data'),
+}
+
+BENCHMARKS = ('import', 'cleaning', 'server')
+
+# Subcommands whose remaining arguments go to another script -> positionals they take first
+PASSTHROUGH = {'import': 0, 'forecast': 1, 'publish': 0, 'serve': 0, 'bench': 1}
+
+GLOBAL_OPTIONS = ('--config', '--backend', '--data-dir')
+
+
+def with_default(argv, option, value):
+    """argv plus `option value` unless the caller already passed the option"""
+    if any(arg == option or arg.startswith(option + '=') for arg in argv):
+        return list(argv)
+    return [option, value, *argv]
+
+
+def configure_supabase(settings):
+    """migrations/import_data.py pointed at the configured Supabase project"""
+    sys.path.insert(0, MIGRATIONS_DIR)
+    import import_data
+    import_data.SUPABASE_URL = settings['supabase']['url']
+    import_data.SUPABASE_KEY = settings['supabase']['key'] or import_data.SUPABASE_KEY
+    return import_data
+
+
+def split_passthrough(argv):
+    """(cli arguments, script arguments): argparse's REMAINDER drops flags that directly
+    follow a subcommand (`serve --port 1`), so they are split off before parsing"""
+    i = 0
+    while i < len(argv) and argv[i].startswith('-'):
+        i += 1 if '=' in argv[i] or argv[i] not in GLOBAL_OPTIONS else 2
+    if i >= len(argv) or argv[i] not in PASSTHROUGH:
+        return list(argv), None
+    end = i + 1 + PASSTHROUGH[argv[i]]
+    rest = argv[end:]
+    return list(argv[:end]), rest[1:] if rest[:1] == ['--'] else rest
+
+
+# ---- Subcommands ----
+
+def run_import(settings, args):
+    """Load the CSVs into the configured backend; extra arguments go to that backend's import script"""
+    data_dir = settings['paths']['data_dir']
+    backend = settings['backend']
+    if backend == 'duckdb':
+        import analytics_db
+        with analytics_db.connect(settings['duckdb']['path'], data_dir) as con:
+            for table_name, in con.execute(f"SELECT table_name FROM {analytics_db.SOURCES_TABLE} "
+                                           f"ORDER BY table_name").fetchall():
+                count = con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+                logger.info(f"  {table_name}: {count} rows")
+        return
+
+    argv = with_default(args.args, '--data-dir', data_dir)
+    if backend == 'local-postgres':
+        import import_local_data
+        import_local_data.LOCAL_DB_CONFIG.update(settings['local-postgres'])
+        import_local_data.main(argv)
+    else:
+        configure_supabase(settings).main(argv)
+
+
+def run_verify(settings, args):
+    """Row counts and sample rows of every table, in one round-trip"""
+    import verification
+    backend = settings['backend']
+    start = time.perf_counter()
+    if backend == 'local-postgres':
+        summary = verification.postgres_summary(postgres_dsn(settings), args.sample_rows)
+    elif backend == 'supabase':
+        summary = verification.supabase_summary(settings['supabase']['url'], settings['supabase']['key'],
+                                                args.sample_rows)
+    else:
+        summary = verification.duckdb_summary(settings['duckdb']['path'], args.sample_rows)
+    if args.json:
+        import json
+        print(json.dumps(summary, indent=2, default=str))
+    else:
+        verification.log_import_summary(summary)
+        logger.info(f"\n✅ Verified {backend} in {time.perf_counter() - start:.3f}s")
+
+
+def fetch(settings, sql, limit):
+    """(column names, rows) of a SQL query on the duckdb or local-postgres backend"""
+    if settings['backend'] == 'duckdb':
+        import duckdb
+        with duckdb.connect(settings['duckdb']['path'], read_only=True) as con:
+            cursor = con.execute(sql)
+            return [d[0] for d in cursor.description], cursor.fetchmany(limit) if limit else cursor.fetchall()
+    if settings['backend'] == 'local-postgres':
+        import psycopg2
+        conn = psycopg2.connect(postgres_dsn(settings))
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(sql)
+                return [d.name for d in cursor.description], cursor.fetchmany(limit) if limit else cursor.fetchall()
+        finally:
+            conn.rollback()  # read-only use: never leave changes behind
+            conn.close()
+    raise SystemExit("query runs SQL directly, so it needs the duckdb or local-postgres backend")
+
+
+def print_rows(columns, rows, fmt):
+    if fmt == 'csv':
+        import csv
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    elif fmt == 'json':
+        import json
+        for row in rows:
+            print(json.dumps(dict(zip(columns, row)), default=str))
+    else:
+        cells = [[str(value) for value in row] for row in rows]
+        widths = [max([len(column)] + [len(row[i]) for row in cells]) for i, column in enumerate(columns)]
+        print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+        print('  '.join('-' * width for width in widths))
+        for row in cells:
+            print('  '.join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def run_query(settings, args):
+    """Run a SQL query and print the result"""
+    sql = args.sql if args.sql != '-' else sys.stdin.read()
+    columns, rows = fetch(settings, sql, args.limit)
+    print_rows(columns, rows, args.format)
+
+
+def data_path(settings, table_name=None):
+    """The configured data folder, or a source table's CSV in it under the name the importers read"""
+    if table_name is None:
+        return settings['paths']['data_dir']
+    from data_access import source_path
+    return source_path(table_name, settings['paths']['data_dir'])
+
+
+def run_forecast(settings, args):
+    """Run a forecast script with the configured data folder"""
+    import importlib
+    module_name, option, table_name = FORECASTS[args.model]
+    module = importlib.import_module(module_name)
+    module.main(with_default(args.args, option, data_path(settings, table_name)))
+
+
+def run_publish(settings, args):
+    """Write the CAC forecast run (scenarios, daily forecasts, CV metrics) into the backend's forecast tables"""
+    backend = settings['backend']
+    if backend == 'duckdb':
+        raise SystemExit("publish writes to the forecast_* tables, so it needs the local-postgres or supabase backend")
+    import forecast_writer
+    argv = with_default(args.args, '--path', data_path(settings, 'wbr_global_data'))
+    if backend == 'local-postgres':
+        argv = with_default(argv, '--dsn', postgres_url(settings))
+    else:
+        configure_supabase(settings)
+    forecast_writer.main(with_default(argv, '--backend', backend))
+
+
+def run_bench(settings, args):
+    """Run a benchmark; the import benchmark targets the configured local PostgreSQL"""
+    if args.benchmark == 'import':
+        import bench_import
+        bench_import.main(with_default(args.args, '--dsn', postgres_url(settings)))
+    elif args.benchmark == 'cleaning':
+        import bench_cleaning
+        bench_cleaning.main(args.args)
+    else:
+        import bench_forecast_server
+        bench_forecast_server.main(with_default(args.args, '--path', data_path(settings, 'wbr_global_data')))
+
+
+def run_serve(settings, args):
+    """Serve forecasts over HTTP from the configured data folder"""
+    import forecast_server
+    forecast_server.main(with_default(args.args, '--path', data_path(settings, 'wbr_global_data')))
+
+
+def run_config(settings, args):
+    """Print the effective settings (secrets masked)"""
+    for section, values in settings.items():
+        if not isinstance(values, dict):
+            print(f"{section} = {values!r}")
+            continue
+        print(f"[{section}]")
+        for key, value in values.items():
+            shown = '***' if key in ('key', 'password') and value else value
+            print(f"  {key} = {shown!r}")
+
+
+# ---- CLI ----
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="EightSleep business case toolkit")
+    parser.add_argument('--config', help="settings file (default: $EIGHTSLEEP_CONFIG or ./eightsleep.toml)")
+    parser.add_argument('--backend', choices=BACKENDS, help="override the configured backend")
+    parser.add_argument('--data-dir', help="override the configured folder holding the source CSVs")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('import', help="load the CSVs into the backend")
+    command.add_argument('args', nargs=argparse.REMAINDER, help="passed on to the backend's import script")
+    command.set_defaults(run=run_import)
+
+    command = commands.add_parser('verify', help="row counts and sample rows of every table")
+    command.add_argument('--sample-rows', type=int, default=3)
+    command.add_argument('--json', action='store_true', help="print the summary as JSON")
+    command.set_defaults(run=run_verify)
+
+    command = commands.add_parser('query', help="run SQL on the duckdb or local-postgres backend")
+    command.add_argument('sql', help="query text, or - to read it from stdin")
+    command.add_argument('--format', choices=QUERY_FORMATS, default='table')
+    command.add_argument('--limit', type=int, default=1000, help="rows to print (0 = all)")
+    command.set_defaults(run=run_query)
+
+    command = commands.add_parser('forecast', help="CAC cross-validation, spend optimizer, regional forecast, MMM or the cached CAC pipeline")
+    command.add_argument('model', choices=sorted(FORECASTS))
+    command.add_argument('args', nargs=argparse.REMAINDER, help="passed on to the forecast script")
+    command.set_defaults(run=run_forecast)
+
+    command = commands.add_parser('publish', help="write the CAC forecast run into the backend's forecast tables")
+    command.add_argument('args', nargs=argparse.REMAINDER, help="passed on to forecast_writer.py")
+    command.set_defaults(run=run_publish)
+
+    command = commands.add_parser('serve', help="HTTP forecast API with the model kept warm")
+    command.add_argument('args', nargs=argparse.REMAINDER, help="passed on to forecast_server.py")
+    command.set_defaults(run=run_serve)
+
+    command = commands.add_parser('bench', help="import, cleaning or forecast server benchmark")
+    command.add_argument('benchmark', choices=BENCHMARKS)
+    command.add_argument('args', nargs=argparse.REMAINDER, help="passed on to the benchmark script")
+    command.set_defaults(run=run_bench)
+
+    command = commands.add_parser('config', help="show the effective settings")
+    command.set_defaults(run=run_config)
+    return parser
+
+
+def main(argv=None):
+    argv, passthrough = split_passthrough(sys.argv[1:] if argv is None else argv)
+    args = build_parser().parse_args(argv)
+    if passthrough is not None:
+        args.args = passthrough
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    settings = load_settings(args.config)
+    if args.backend:
+        settings['backend'] = args.backend
+    if args.data_dir:
+        settings['paths']['data_dir'] = args.data_dir
+    args.run(settings, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Data Access Layer
+Parses each source CSV once and serves later loads from a typed Parquet cache
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+import pandas as pd
+
+from cleaning import SCHEMAS, iter_csv_chunks, plan_chunks, read_table
+from instrumentation import span
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # no cache without pyarrow; every load parses the CSV
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# Cache directory, relative to the folder holding the CSVs
+CACHE_DIR_NAME = '.parquet_cache'
+
+# Bump when cleaning output changes so stale caches are rebuilt
+CACHE_VERSION = 1
+
+# Default ceiling (bytes) for one chunk's trip through the streaming pipeline
+DEFAULT_MEMORY_LIMIT = 256 * 1024 * 1024
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Hex SHA-256 of a file, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_path(table_name, data_dir='.', filename=None):
+    """Path of a table's source CSV"""
+    return os.path.join(data_dir, filename or SCHEMAS[table_name].filename)
+
+
+def cache_paths(table_name, path):
+    """(parquet path, metadata path) of a source file's cache entry"""
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+    stem = f"{table_name}-{os.path.basename(path)}"
+    return os.path.join(cache_dir, stem + '.parquet'), os.path.join(cache_dir, stem + '.json')
+
+
+def read_metadata(meta_path):
+    """Cache metadata, or None if missing/unreadable"""
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_cache_fresh(path, meta):
+    """True when the cached Parquet was built from the current contents of path.
+
+    An unchanged mtime and size are trusted; otherwise the file is hashed so a
+    touched-but-identical file still hits the cache.
+    """
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        return False
+    stat = os.stat(path)
+    if meta['mtime_ns'] == stat.st_mtime_ns and meta['size'] == stat.st_size:
+        return True
+    return meta['sha256'] == file_sha256(path)
+
+
+def build_cache(table_name, path):
+    """Parse and clean a CSV with the pyarrow engine and write it to the Parquet cache"""
+    parquet_path, meta_path = cache_paths(table_name, path)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    stat = os.stat(path)
+    sha256 = file_sha256(path)
+
+    df = read_table(path, table_name, engine='pyarrow')
+    # Write to a temp file first so readers never see a half-written cache
+    with span('write_cache', rows=len(df), table=table_name):
+        df.to_parquet(parquet_path + '.tmp', index=False)
+    os.replace(parquet_path + '.tmp', parquet_path)
+    write_metadata(meta_path, path, stat, sha256, len(df))
+    logger.info(f"Cached {len(df)} {table_name} rows to {parquet_path}")
+    return df
+
+
+def write_metadata(meta_path, path, stat, sha256, rows):
+    """Record which version of the source file a cache entry was built from"""
+    with open(meta_path, 'w') as f:
+        json.dump({'version': CACHE_VERSION, 'source': os.path.abspath(path), 'mtime_ns': stat.st_mtime_ns,
+                   'size': stat.st_size, 'sha256': sha256, 'rows': rows}, f, indent=2)
+
+
+def stream_cache(table_name, path, since=None, memory_limit=DEFAULT_MEMORY_LIMIT):
+    """Stream a CSV through the cleaner, yielding chunks and writing each one to the Parquet cache.
+
+    The cache is only moved into place once the whole file has been read.
+    """
+    parquet_path, meta_path = cache_paths(table_name, path)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    stat = os.stat(path)
+    sha256 = file_sha256(path)
+    date_column = SCHEMAS[table_name].date_column
+
+    writer = None
+    rows = 0
+    try:
+        for df in iter_csv_chunks(path, table_name, memory_limit):
+            with span('write_cache', rows=len(df), table=table_name):
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(parquet_path + '.tmp', table.schema)
+                # One row group per chunk, so cached reads stream at the same size
+                writer.write_table(table.cast(writer.schema))
+            rows += len(df)
+            if since is not None:
+                df = df[df[date_column] >= pd.Timestamp(since)]
+            if len(df):
+                yield df
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        return
+    os.replace(parquet_path + '.tmp', parquet_path)
+    write_metadata(meta_path, path, stat, sha256, rows)
+    logger.info(f"Cached {rows} {table_name} rows to {parquet_path}")
+
+
+def refresh_metadata(path, meta, meta_path):
+    """Record the new mtime of a touched-but-identical source file"""
+    stat = os.stat(path)
+    meta.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def load_table(table_name, data_dir='.', since=None, filename=None, use_cache=True):
+    """Load a cleaned source table, parsing its CSV only when it changed.
+
+    Cached tables are read memory-mapped from Parquet; `since` is pushed down
+    as a row filter on the table's date column.
+    """
+    path = source_path(table_name, data_dir, filename)
+    if not use_cache or pq is None:
+        return read_table(path, table_name, since)
+
+    parquet_path, meta_path = cache_paths(table_name, path)
+    meta = read_metadata(meta_path)
+    if not os.path.exists(parquet_path) or not is_cache_fresh(path, meta):
+        df = build_cache(table_name, path)
+        if since is None:
+            return df
+    elif meta['mtime_ns'] != os.stat(path).st_mtime_ns:
+        refresh_metadata(path, meta, meta_path)
+
+    filters = None
+    if since is not None:
+        filters = [(SCHEMAS[table_name].date_column, '>=', pd.Timestamp(since))]
+    with span('read_parquet', table=table_name) as s:
+        table = pq.read_table(parquet_path, memory_map=True, filters=filters)
+        # Keep text columns Arrow-backed, matching a fresh parse
+        df = table.to_pandas(types_mapper=arrow_string_dtype)
+        s.rows = len(df)
+    return df
+
+
+def iter_table(table_name, data_dir='.', since=None, filename=None, memory_limit=DEFAULT_MEMORY_LIMIT,
+               use_cache=True):
+    """Yield a cleaned source table in chunks that keep the pipeline under memory_limit bytes.
+
+    Unchanged tables stream from the Parquet cache; otherwise the CSV is
+    streamed through the cleaner and the cache is rebuilt along the way.
+    """
+    path = source_path(table_name, data_dir, filename)
+    if not use_cache or pq is None:
+        yield from iter_csv_chunks(path, table_name, memory_limit, since)
+        return
+
+    parquet_path, meta_path = cache_paths(table_name, path)
+    meta = read_metadata(meta_path)
+    if not os.path.exists(parquet_path) or not is_cache_fresh(path, meta):
+        yield from stream_cache(table_name, path, since, memory_limit)
+        return
+    if meta['mtime_ns'] != os.stat(path).st_mtime_ns:
+        refresh_metadata(path, meta, meta_path)
+
+    rows, _ = plan_chunks(path, table_name, memory_limit)
+    date_column = SCHEMAS[table_name].date_column
+    batches = pq.ParquetFile(parquet_path).iter_batches(batch_size=rows)
+    while True:
+        with span('read_parquet', table=table_name) as s:
+            batch = next(batches, None)
+            if batch is None:
+                return
+            df = batch.to_pandas(types_mapper=arrow_string_dtype)
+            if since is not None:
+                df = df[df[date_column] >= pd.Timestamp(since)]
+            s.rows = len(df)
+        if len(df):
+            yield df
+
+
+def arrow_string_dtype(arrow_type):
+    """types_mapper mapping Arrow strings to pandas' Arrow-backed string dtype"""
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype('pyarrow')
+    return None
+
+
+def clear_cache(data_dir='.'):
+    """Delete every cached Parquet file under data_dir"""
+    cache_dir = os.path.join(data_dir, CACHE_DIR_NAME)
+    if not os.path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        os.remove(os.path.join(cache_dir, name))
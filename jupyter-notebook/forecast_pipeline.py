@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Forecast Pipeline
+The CAC_Forecast.ipynb run (load, weekday stats, scenarios, model fit,
+prediction, intervals, CV, export) as a DAG of cached stages. A stage reruns
+only when its parameters, code (including the modules it calls) or inputs
+change; independent stages run in parallel.
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+import joblib
+import pandas as pd
+
+import forecasting as fc
+import instrumentation
+import model_store
+from data_access import file_sha256
+from instrumentation import in_context, span
+from scenario_simulation import DEFAULT_SAMPLES, ResidualBootstrap, simulate_scenarios
+from weekday_stats import WeekdayStats
+
+logger = logging.getLogger(__name__)
+
+# Stage outputs live here, relative to the working directory
+PIPELINE_CACHE_DIR = ".pipeline_cache"
+
+# Cache entries kept per stage; older ones are deleted when the stage writes a new one
+KEEP_ENTRIES = 5
+
+MODELS = ("auto", "prophet", "ridge")
+
+
+@dataclass
+class Stage:
+    """One pipeline step: func(*outputs of `inputs`, **params, **options).
+
+    The cache key covers the stage's name, params, function source, the
+    source files of the local `modules` it calls (stage functions are thin
+    wrappers, so the real code lives there), the content of `sources` files
+    and the output digests of its inputs; options
+    (e.g. worker counts) do not change the result and are left out. A stage
+    with writes=True returns the paths it wrote, and its cache entry only
+    counts while those files are unchanged.
+    """
+    name: str
+    func: callable
+    inputs: tuple = ()
+    params: dict = field(default_factory=dict)
+    options: dict = field(default_factory=dict)
+    sources: tuple = ()
+    modules: tuple = ()
+    writes: bool = False
+
+
+@dataclass
+class StageResult:
+    name: str
+    key: str
+    digest: str     # content hash of the output; part of the downstream keys
+    cached: bool
+    seconds: float
+
+
+# ---- Stages of the CAC forecast ----
+
+def load_stage(path):
+    return fc.load_history(path)
+
+
+def weekday_stats_stage(data, window_days):
+    return WeekdayStats.from_history(data, window_days=window_days)
+
+
+def scenarios_stage(data, stats, horizon, uplift):
+    return fc.build_scenarios(data, horizon=horizon, uplift=uplift, stats=stats)
+
+
+def fit_stage(data, model):
+    """(model name, fitted model); "auto" is Prophet, else Ridge when Prophet is not installed"""
+    if model in ("auto", "prophet"):
+        try:
+            return "Prophet", model_store.load_or_fit_prophet(data)
+        except ImportError:
+            if model == "prophet":
+                raise
+    return "Ridge", model_store.load_or_fit_ridge(data)
+
+
+def model_engine(fitted, data, dates):
+    """Batched scenario engine of a fit_stage model over `dates`"""
+    name, model = fitted
+    if name == "Prophet":
+        return fc.ProphetScenarioEngine(model, dates)
+    return fc.RidgeScenarioEngine(data, dates, model=model)
+
+
+def predict_stage(fitted, data, scenarios):
+    """(per-scenario daily predictions, scenario summary)"""
+    preds = fc.predict_scenarios(model_engine(fitted, data, fc.spend_matrix(scenarios)[0]), scenarios)
+    return preds, fc.summarize(preds, len(next(iter(scenarios.values()))))
+
+
+def intervals_stage(fitted, data, scenarios, samples, seed):
+    engine = model_engine(fitted, data, fc.spend_matrix(scenarios)[0])
+    sim = simulate_scenarios(engine, scenarios, ResidualBootstrap.from_engine(engine, data), samples, seed)
+    return sim.summary()
+
+
+def cv_stage(data, horizon, period, initial, workers=None):
+    """(performance metrics, metrics by horizon, fold times)"""
+    # Fork from a clean server process: forking this thread while another stage
+    # holds an import lock (e.g. mid `import prophet`) can deadlock the workers
+    cv, fold_times = fc.cross_validate(data, horizon, period, initial, workers=workers,
+                                       mp_context=multiprocessing.get_context("forkserver"))
+    with span("cv_metrics", rows=len(cv)):
+        pm, acc_by_h = fc.cv_metrics(cv)
+    return pm, acc_by_h, fold_times
+
+
+def export_stage(data, predicted, intervals, out_dir):
+    """The notebook's CSVs: loaded data, daily forecast per scenario and the two summaries"""
+    preds, summary = predicted
+    forecast_df = pd.concat([df.assign(Scenario=scen) for scen, df in preds.items()], ignore_index=True)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for filename, df in (("loaded_data.csv", data), ("forecast_daily.csv", forecast_df),
+                         ("scenario_summary.csv", summary), ("scenario_summary_intervals.csv", intervals)):
+        paths.append(os.path.join(out_dir, filename))
+        df.to_csv(paths[-1], index=False)
+    return paths
+
+
+def export_cv_stage(cv, out_dir):
+    pm, acc_by_h, _ = cv
+    os.makedirs(out_dir, exist_ok=True)
+    fc.save_cv_metrics(pm, acc_by_h, out_dir)
+    return [os.path.join(out_dir, "prophet_cv_metrics.csv"), os.path.join(out_dir, "prophet_cv_metrics_by_horizon.csv")]
+
+
+def module_sha256(name):
+    """SHA-256 of a local module's source file"""
+    return file_sha256(importlib.util.find_spec(name).origin)
+
+
+def forecast_stages(path="wbr_global_data.csv", horizon=28, uplift=0.20, window_days=28, model="auto",
+                    samples=DEFAULT_SAMPLES, seed=0, cv_horizon=fc.CV_HORIZON, cv_period=fc.CV_PERIOD,
+                    cv_initial=fc.CV_INITIAL, out_dir=".", workers=None):
+    """The CAC_Forecast.ipynb stages with the notebook's defaults"""
+    if model not in MODELS:
+        raise ValueError(f"model must be one of {MODELS}, got {model!r}")
+    # forecasting imports weekday_stats, so stages calling it depend on both
+    forecast = ("forecasting", "weekday_stats")
+    return [
+        Stage("load", load_stage, sources=(path,), options={"path": path}, modules=forecast + ("data_access",)),
+        Stage("weekday_stats", weekday_stats_stage, ("load",), {"window_days": window_days},
+              modules=("weekday_stats",)),
+        Stage("scenarios", scenarios_stage, ("load", "weekday_stats"), {"horizon": horizon, "uplift": uplift},
+              modules=forecast),
+        Stage("fit", fit_stage, ("load",), {"model": model}, modules=forecast + ("model_store",)),
+        Stage("predict", predict_stage, ("fit", "load", "scenarios"), modules=forecast),
+        Stage("intervals", intervals_stage, ("fit", "load", "scenarios"), {"samples": samples, "seed": seed},
+              modules=forecast + ("scenario_simulation",)),
+        Stage("cv", cv_stage, ("load",), {"horizon": cv_horizon, "period": cv_period, "initial": cv_initial},
+              options={"workers": workers}, modules=forecast),
+        Stage("export", export_stage, ("load", "predict", "intervals"), {"out_dir": out_dir}, writes=True),
+        Stage("export_cv", export_cv_stage, ("cv",), {"out_dir": out_dir}, writes=True, modules=forecast),
+    ]
+
+
+# ---- Runner ----
+
+class Pipeline:
+    """Runs a DAG of stages on a thread pool, reusing cached outputs by content key"""
+
+    def __init__(self, stages, cache_dir=PIPELINE_CACHE_DIR, workers=None, keep=KEEP_ENTRIES):
+        self.stages = {}
+        for stage in stages:  # a stage may only use stages listed before it, so the DAG has no cycles
+            missing = [name for name in stage.inputs if name not in self.stages]
+            if missing:
+                raise ValueError(f"stage {stage.name!r} uses {missing}, which are not defined before it")
+            self.stages[stage.name] = stage
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.keep = keep
+        self.results = {}
+        self.outputs = {}
+
+    def cache_path(self, name, key):
+        return os.path.join(self.cache_dir, f"{name}-{key[:16]}")
+
+    def stage_key(self, stage):
+        payload = {"stage": stage.name, "params": stage.params, "code": inspect.getsource(stage.func),
+                   "modules": {name: module_sha256(name) for name in stage.modules},
+                   "sources": [file_sha256(path) for path in stage.sources],
+                   "inputs": [self.results[name].digest for name in stage.inputs]}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def read_manifest(self, stage, key):
+        """Manifest of a usable cache entry, or None"""
+        path = self.cache_path(stage.name, key)
+        try:
+            with open(path + ".json") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("key") != key or not os.path.exists(path + ".joblib"):
+            return None
+        for path, sha256 in manifest.get("files", {}).items():
+            if not os.path.exists(path) or file_sha256(path) != sha256:
+                return None
+        return manifest
+
+    def output(self, name):
+        """Output of a stage of the last run, loaded from the cache if it was not computed"""
+        if name not in self.outputs:
+            self.outputs[name] = joblib.load(self.cache_path(name, self.results[name].key) + ".joblib")
+        return self.outputs[name]
+
+    def run_stage(self, stage, force):
+        key = self.stage_key(stage)
+        manifest = None if force else self.read_manifest(stage, key)
+        if manifest is not None:
+            os.utime(self.cache_path(stage.name, key) + ".json")  # most recently used, for prune
+            logger.info(f"  {stage.name}: cached ({key[:12]})")
+            return StageResult(stage.name, key, manifest["digest"], True, 0.0)
+
+        inputs = [self.output(name) for name in stage.inputs]
+        start = time.perf_counter()
+        with span(stage.name, stage=stage.name):
+            output = stage.func(*inputs, **{**stage.params, **stage.options})
+        seconds = time.perf_counter() - start
+        digest = joblib.hash(output)
+        path = self.cache_path(stage.name, key)
+        model_store.write_atomic(path + ".joblib", lambda tmp: joblib.dump(output, tmp))
+        files = {p: file_sha256(p) for p in output} if stage.writes else {}
+
+        def write(tmp):
+            with open(tmp, "w") as f:
+                json.dump({"key": key, "digest": digest, "seconds": round(seconds, 3), "files": files}, f, indent=2)
+        model_store.write_atomic(path + ".json", write)
+        self.prune(stage.name)
+        self.outputs[stage.name] = output
+        logger.info(f"  {stage.name}: ran in {seconds:.2f}s")
+        return StageResult(stage.name, key, digest, False, seconds)
+
+    def prune(self, name):
+        """Delete all but the `keep` most recently used cache entries of a stage"""
+        pattern = re.compile(rf"{re.escape(name)}-[0-9a-f]{{16}}\.json")
+        manifests = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if pattern.fullmatch(f)]
+        manifests.sort(key=os.path.getmtime, reverse=True)
+        for manifest in manifests[max(self.keep, 1):]:
+            entry = manifest[:-len(".json")]
+            for path in (manifest, entry + ".joblib"):
+                if os.path.exists(path):
+                    os.remove(path)
+            logger.info(f"  {name}: pruned cache entry {os.path.basename(entry)}")
+
+    def needed(self, targets):
+        """Names of the targets and every stage they depend on"""
+        needed, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in self.stages:
+                raise ValueError(f"unknown stage {name!r}; stages are {list(self.stages)}")
+            if name not in needed:
+                needed.add(name)
+                todo.extend(self.stages[name].inputs)
+        return needed
+
+    def run(self, targets=None, force=()):
+        """Run `targets` (default: all stages) and their inputs; `force` reruns those stages even if cached.
+
+        A stage starts as soon as all its inputs are resolved, so branches
+        such as cv and predict run concurrently. Returns {name: StageResult}.
+        """
+        pending = self.needed(targets or self.stages)
+        self.needed(force)  # reject unknown stage names
+        self.results, self.outputs = {}, {}
+        with span("pipeline", rows=len(pending)), ThreadPoolExecutor(max_workers=self.workers) as pool:
+            running = {}
+            while pending or running:
+                for name in [n for n in self.stages if n in pending]:
+                    if all(i in self.results for i in self.stages[name].inputs):
+                        pending.discard(name)
+                        running[pool.submit(in_context(self.run_stage), self.stages[name], name in force)] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.results[running.pop(future)] = future.result()
+        return {name: self.results[name] for name in self.stages if name in self.results}
+
+
+def clear_cache(cache_dir=PIPELINE_CACHE_DIR):
+    """Delete every cached stage output"""
+    if not os.path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        os.remove(os.path.join(cache_dir, name))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless CAC forecast: the CAC_Forecast.ipynb stages, cached")
+    parser.add_argument('--path', default="wbr_global_data.csv", help="global WBR CSV (default: %(default)s)")
+    parser.add_argument('--horizon', type=int, default=28, help="days to forecast (default: %(default)s)")
+    parser.add_argument('--uplift', type=float, default=0.20, help="spend increase of the +X%% scenarios")
+    parser.add_argument('--model', choices=MODELS, default="auto")
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help="bootstrap samples for the intervals")
+    parser.add_argument('--out-dir', default=".", help="where to write the CSVs")
+    parser.add_argument('--workers', type=int, help="CV process pool size (default: one per CPU)")
+    parser.add_argument('--only', action='append', metavar='STAGE', help="run this stage and its inputs (repeatable)")
+    parser.add_argument('--force', action='append', default=[], metavar='STAGE',
+                        help="rerun this stage even if cached (repeatable)")
+    parser.add_argument('--cache-dir', default=PIPELINE_CACHE_DIR)
+    parser.add_argument('--keep', type=int, default=KEEP_ENTRIES, help="cache entries kept per stage (default: %(default)s)")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    instrumentation.configure_from_args(args)
+    stages = forecast_stages(args.path, args.horizon, args.uplift, model=args.model, samples=args.samples,
+                             out_dir=args.out_dir, workers=args.workers)
+    pipeline = Pipeline(stages, args.cache_dir, keep=args.keep)
+    start = time.perf_counter()
+    results = pipeline.run(args.only, set(args.force))
+    elapsed = time.perf_counter() - start
+
+    ran = [r.name for r in results.values() if not r.cached]
+    print(f"\n🧮 {len(results)} stages in {elapsed:.2f}s: {len(ran)} ran ({', '.join(ran) or 'none'}), "
+          f"{len(results) - len(ran)} cached")
+    if "predict" in results:
+        print(pipeline.output("predict")[1].to_string(index=False))
+    instrumentation.finish(args)
+
+
+if __name__ == "__main__":
+    main()
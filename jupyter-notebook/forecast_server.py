@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Forecast Server
+Local HTTP API over the fitted CAC model: the model and its trend/seasonality
+are loaded once at start-up, requests are scored with the batched scenario
+engine and repeated spend plans are answered from an LRU cache
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+import forecasting as fc
+from forecast_pipeline import MODELS, fit_stage, model_engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Longest spend plan accepted; the engine's trend/seasonality cover this many days
+MAX_DAYS = 365
+
+# Encoded responses kept in the LRU cache
+CACHE_ITEMS = 4096
+
+# Latencies kept per route for the percentiles in /metrics
+LATENCY_WINDOW = 10_000
+
+# Largest request body accepted, in bytes
+MAX_BODY_BYTES = 1 << 20
+
+
+class BadRequest(ValueError):
+    """Invalid request; answered with 400 and the message"""
+
+
+class LatencyStats:
+    """Request count and latency percentiles per route over the last `window` requests"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def record(self, route, seconds, status):
+        with self.lock:
+            stats = self.routes.setdefault(route, {'count': 0, 'errors': 0, 'latencies': np.zeros(self.window)})
+            stats['latencies'][stats['count'] % self.window] = seconds
+            stats['count'] += 1
+            stats['errors'] += status >= 400
+
+    def summary(self):
+        with self.lock:
+            out = {}
+            for route, stats in self.routes.items():
+                latencies = stats['latencies'][:min(stats['count'], self.window)] * 1000
+                p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+                out[route] = {'count': stats['count'], 'errors': stats['errors'], 'mean_ms': latencies.mean(),
+                              'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99, 'max_ms': latencies.max()}
+            return out
+
+
+class ForecastService:
+    """Scores spend plans over the days following the history with one warm engine"""
+
+    def __init__(self, data, fitted, max_days=MAX_DAYS, cache_items=CACHE_ITEMS):
+        self.data = data
+        self.model_name = fitted[0]
+        self.max_days = max_days
+        self.dates = pd.date_range(start=data["ds"].max() + pd.Timedelta(days=1), periods=max_days)
+        self.engine = model_engine(fitted, data, self.dates)
+        self.cache_items = cache_items
+        self.cache = OrderedDict()
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    @classmethod
+    def from_csv(cls, path="wbr_global_data.csv", model="auto", **kwargs):
+        """Load the history and the stored fit (fitted and stored on first use)"""
+        data = fc.load_history(path)
+        return cls(data, fit_stage(data, model), **kwargs)
+
+    def cached(self, key, compute):
+        """Encoded response for key, computed and stored on a miss"""
+        with self.lock:
+            body = self.cache.get(key)
+            if body is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return body
+            self.misses += 1
+        body = compute()
+        with self.lock:
+            self.cache[key] = body
+            if len(self.cache) > self.cache_items:
+                self.cache.popitem(last=False)
+        return body
+
+    def score(self, names, spend):
+        """Response body for named (N, H) spend plans starting the day after the history"""
+        days = spend.shape[1]
+        # Predictions are per day, so the first H columns of a zero-padded plan are the H-day prediction
+        orders = self.engine.predict(np.pad(spend, ((0, 0), (0, self.max_days - days))))[:, :days]
+        plans = []
+        for name, plan, daily in zip(names, spend, orders):
+            total_spend, total_orders = float(plan.sum()), float(daily.sum())
+            plans.append({'name': name, 'total_spend': total_spend, 'orders': total_orders,
+                          'cac': total_spend / total_orders if total_orders > 0 else None,
+                          'daily_orders': daily.tolist()})
+        return json.dumps({'model': self.model_name, 'start': str(self.dates[0].date()), 'days': days,
+                           'plans': plans}).encode()
+
+    def spend_plans(self, payload):
+        """(names, (N, H) float array) from {"spend": [...]} or {"spend": [[...], ...], "names": [...]}"""
+        if not isinstance(payload, dict) or 'spend' not in payload:
+            raise BadRequest('body must be a JSON object with a "spend" list')
+        try:
+            spend = np.array(payload['spend'], dtype=float, ndmin=2)
+        except (TypeError, ValueError):
+            raise BadRequest('"spend" must be a list of numbers or a list of equal-length lists') from None
+        if spend.ndim != 2 or spend.shape[1] == 0:
+            raise BadRequest('"spend" must be a list of numbers or a list of equal-length lists')
+        if spend.shape[1] > self.max_days:
+            raise BadRequest(f'at most {self.max_days} days per plan, got {spend.shape[1]}')
+        if not np.isfinite(spend).all() or (spend < 0).any():
+            raise BadRequest('spend must be finite and >= 0')
+        names = payload.get('names')
+        if names is None:
+            names = [f'plan_{i}' for i in range(len(spend))]
+        elif not isinstance(names, list):
+            raise BadRequest('"names" must be a list with one name per plan')
+        if len(names) != len(spend):
+            raise BadRequest(f'{len(names)} names for {len(spend)} plans')
+        return [str(name) for name in names], spend
+
+    def predict(self, payload):
+        names, spend = self.spend_plans(payload)
+        key = ('predict', tuple(names), spend.shape, spend.tobytes())
+        return self.cached(key, lambda: self.score(names, spend))
+
+    def scenarios(self, horizon=28, uplift=0.20):
+        """The notebook's Baseline / +X% Flat / +X% Smart scenarios"""
+        if not 0 < horizon <= self.max_days:
+            raise BadRequest(f'horizon must be between 1 and {self.max_days}')
+        if not np.isfinite(uplift):
+            raise BadRequest('uplift must be a finite number')
+
+        def compute():
+            scen_dict = fc.build_scenarios(self.data, horizon=horizon, uplift=uplift)
+            spend = fc.spend_matrix(scen_dict)[1]
+            # Same checks as spend_plans: an uplift below -100% gives negative spend
+            if not np.isfinite(spend).all() or (spend < 0).any():
+                raise BadRequest(f'uplift {uplift:g} gives negative or non-finite spend')
+            return self.score(list(scen_dict), spend)
+        return self.cached(('scenarios', horizon, uplift), compute)
+
+    def health(self):
+        return json.dumps({'status': 'ok', 'model': self.model_name, 'history_end': str(self.data["ds"].max().date()),
+                           'max_days': self.max_days}).encode()
+
+    def metrics(self, latency):
+        with self.lock:
+            cache = {'items': len(self.cache), 'hits': self.hits, 'misses': self.misses,
+                     'hit_rate': self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0}
+        return json.dumps({'uptime_seconds': time.time() - self.started, 'cache': cache,
+                           'routes': latency.summary()}).encode()
+
+
+# ---- HTTP ----
+
+class ForecastHandler(BaseHTTPRequestHandler):
+    """GET /health, /metrics, /scenarios?horizon=&uplift=; POST /predict"""
+    protocol_version = 'HTTP/1.1'  # keep-alive, so clients reuse connections
+    # Headers and body go out as separate writes; with Nagle on, the body waits for the
+    # client's delayed ACK (~40 ms) on every keep-alive request
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        service = self.server.service
+        if url.path == '/health':
+            self.respond(url.path, service.health)
+        elif url.path == '/metrics':
+            self.respond(url.path, lambda: service.metrics(self.server.latency))
+        elif url.path == '/scenarios':
+            self.respond(url.path, lambda: service.scenarios(self.number(query, 'horizon', 28, int),
+                                                             self.number(query, 'uplift', 0.20, float)))
+        else:
+            self.respond(url.path, None)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        self.respond(path, (lambda: self.server.service.predict(self.read_json())) if path == '/predict' else None)
+
+    @staticmethod
+    def number(query, name, default, kind):
+        try:
+            return kind(query.get(name, default))
+        except ValueError:
+            raise BadRequest(f'{name} must be a number') from None
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            raise BadRequest(f'body larger than {MAX_BODY_BYTES} bytes')
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            raise BadRequest('body is not valid JSON') from None
+
+    def respond(self, route, handle):
+        """Send handle()'s JSON body, 400 for BadRequest, 404 without a handler; record the latency"""
+        start = time.perf_counter()
+        status = HTTPStatus.OK
+        try:
+            if handle is None:
+                status, body = HTTPStatus.NOT_FOUND, json.dumps({'error': f'no route {route}'}).encode()
+                route = 'unknown'
+            else:
+                body = handle()
+        except BadRequest as e:
+            status, body = HTTPStatus.BAD_REQUEST, json.dumps({'error': str(e)}).encode()
+        except Exception as e:
+            logger.exception(f"Error serving {self.path}")
+            status, body = HTTPStatus.INTERNAL_SERVER_ERROR, json.dumps({'error': str(e)}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.latency.record(route, time.perf_counter() - start, status)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class ForecastHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # socketserver's default listen backlog of 5 resets bursts of new connections
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Threaded HTTP server for a ForecastService (port 0 picks a free port)"""
+    server = ForecastHTTPServer((host, port), ForecastHandler)
+    server.service = service
+    server.latency = LatencyStats()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve CAC forecasts over HTTP from a warm in-process model")
+    parser.add_argument('--path', default="wbr_global_data.csv", help="global WBR CSV (default: %(default)s)")
+    parser.add_argument('--model', choices=MODELS, default="auto")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-days', type=int, default=MAX_DAYS, help="longest spend plan accepted")
+    parser.add_argument('--cache-items', type=int, default=CACHE_ITEMS, help="responses kept in the LRU cache")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    start = time.perf_counter()
+    service = ForecastService.from_csv(args.path, args.model, max_days=args.max_days, cache_items=args.cache_items)
+    server = make_server(service, args.host, args.port)
+    print(f"🚀 {service.model_name} model ready in {time.perf_counter() - start:.2f}s; "
+          f"serving on http://{args.host}:{server.server_address[1]} (POST /predict, GET /scenarios, /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(service.metrics(server.latency).decode())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Forecast Write-back
+Loads a forecast run (scenario summaries, daily forecasts, CV metrics) into the
+forecast_* tables of migrations/008_create_forecast_tables.sql, tagged with a run
+id: COPY in one transaction locally, concurrent batched upserts on Supabase
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+
+import pandas as pd
+
+import instrumentation
+from forecast_pipeline import MODELS, PIPELINE_CACHE_DIR, Pipeline, forecast_stages
+from instrumentation import span
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'migrations')
+
+# Complete runs kept by complete_forecast_run(); older ones are deleted with their rows
+KEEP_RUNS = 30
+
+BACKENDS = ('local-postgres', 'supabase')
+
+# Columns and primary key of each per-run table, in load order
+FORECAST_TABLES = {
+    'forecast_scenarios': (('run_id', 'scenario', 'horizon_days', 'total_spend', 'pred_orders', 'projected_cac',
+                            'pred_orders_p10', 'pred_orders_p50', 'pred_orders_p90',
+                            'projected_cac_p10', 'projected_cac_p50', 'projected_cac_p90'),
+                           ('run_id', 'scenario')),
+    'forecast_daily': (('run_id', 'scenario', 'date', 'weekday', 'spend', 'pred_orders'),
+                       ('run_id', 'scenario', 'date')),
+    'forecast_cv_metrics': (('run_id', 'horizon_days', 'mse', 'rmse', 'mae', 'mape', 'mdape', 'smape', 'coverage'),
+                            ('run_id', 'horizon_days')),
+}
+
+
+@dataclass
+class ForecastRun:
+    """A forecast_runs row and the per-run table frames, ready to load"""
+    run_id: str
+    run: dict
+    tables: dict  # table name -> DataFrame with the table's columns
+
+    @property
+    def rows(self):
+        return sum(len(df) for df in self.tables.values())
+
+
+def snake_case(name):
+    """PredOrders_P10 -> pred_orders_p10"""
+    return re.sub(r'(?<=[a-z0-9])(?=[A-Z])', '_', name).lower().replace('__', '_')
+
+
+def table_frame(table_name, df, run_id):
+    """df restricted/reindexed to the table's columns, tagged with run_id"""
+    columns = FORECAST_TABLES[table_name][0]
+    return df.assign(run_id=run_id).reindex(columns=list(columns)).reset_index(drop=True)
+
+
+def forecast_run(data, preds, summary, intervals=None, cv_metrics=None, model=None, params=None, run_id=None):
+    """Build a ForecastRun from the notebook/pipeline outputs.
+
+    preds: {scenario: ds/weekday/spend/pred_orders frame}; summary: fc.summarize();
+    intervals: scenario_simulation summary (adds the P10/P50/P90 columns);
+    cv_metrics: prophet performance_metrics frame.
+    """
+    run_id = run_id or str(uuid.uuid4())
+    scenarios = (intervals if intervals is not None else summary).rename(columns=snake_case)
+    daily = pd.concat([df.assign(scenario=name) for name, df in preds.items()], ignore_index=True)
+    daily = daily.rename(columns={'ds': 'date'})
+    daily['date'] = daily['date'].dt.date
+    daily['weekday'] = daily['weekday'].astype(str)
+    tables = {'forecast_scenarios': table_frame('forecast_scenarios', scenarios, run_id),
+              'forecast_daily': table_frame('forecast_daily', daily, run_id)}
+    if cv_metrics is not None:
+        metrics = cv_metrics.assign(horizon_days=cv_metrics['horizon'].dt.days)
+        # performance_metrics' rolling window can repeat a horizon day; keep its last value
+        metrics = metrics.drop_duplicates('horizon_days', keep='last')
+        tables['forecast_cv_metrics'] = table_frame('forecast_cv_metrics', metrics, run_id)
+
+    first_day = daily['date'].min()
+    run = {'run_id': run_id, 'status': 'loading', 'model': model,
+           'history_start': data['ds'].min().date(), 'history_end': data['ds'].max().date(),
+           'forecast_start': first_day, 'horizon_days': int(daily.groupby('scenario').size().max()),
+           'params': json.dumps(params or {}, default=str)}
+    return ForecastRun(run_id, run, tables)
+
+
+# ---- Local PostgreSQL: one transaction ----
+
+def write_local(engine, run, keep=KEEP_RUNS):
+    """Insert the run, COPY its rows and mark it complete (pruning old runs) in one transaction"""
+    from import_local_data import copy_dataframe
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cursor:
+            with span('insert_run'):
+                columns = list(run.run)
+                cursor.execute(f"INSERT INTO forecast_runs ({', '.join(columns)}) "
+                               f"VALUES ({', '.join(['%s'] * len(columns))})", [run.run[c] for c in columns])
+            for table_name, df in run.tables.items():
+                with span('copy', rows=len(df), table=table_name):
+                    copy_dataframe(cursor, table_name, df)
+            with span('complete_run'):
+                cursor.execute("SELECT complete_forecast_run(%s, %s)", (run.run_id, keep))
+                pruned = cursor.fetchone()[0]
+        with span('commit'):
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return pruned
+
+
+# ---- Supabase: batched upserts, visible once complete ----
+
+async def write_supabase(supabase, run, keep=KEEP_RUNS, batch_size=None, concurrency=None):
+    """Insert the run as 'loading', upsert its tables concurrently, then mark it complete.
+
+    PostgREST runs each request in its own transaction, so the latest_* views
+    only pick the run up after complete_forecast_run(); a failed write stays
+    'loading' and is pruned by a later run.
+    """
+    sys.path.insert(0, MIGRATIONS_DIR)
+    from import_data import DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY, to_json_value, upsert_dataframe
+    batch_size = batch_size or DEFAULT_BATCH_SIZE
+    concurrency = concurrency or DEFAULT_CONCURRENCY
+    limiter = asyncio.Semaphore(concurrency)
+
+    with span('insert_run'):
+        await supabase.table('forecast_runs').insert({k: to_json_value(v) for k, v in run.run.items()}).execute()
+    with span('upsert', rows=run.rows):
+        await asyncio.gather(*(upsert_dataframe(supabase, table_name, df, batch_size, concurrency=concurrency,
+                                                limiter=limiter, key_columns=FORECAST_TABLES[table_name][1])
+                               for table_name, df in run.tables.items()))
+    with span('complete_run'):
+        response = await supabase.rpc('complete_forecast_run', {'p_run_id': run.run_id, 'p_keep': keep}).execute()
+    return response.data
+
+
+# ---- CLI ----
+
+def pipeline_run(args):
+    """Outputs of the forecast pipeline (cached stages are reused) as a ForecastRun"""
+    stages = forecast_stages(args.path, args.horizon, args.uplift, model=args.model, out_dir=args.out_dir)
+    pipeline = Pipeline(stages, args.cache_dir)
+    targets = ['predict', 'intervals'] + ([] if args.no_cv else ['cv'])
+    pipeline.run(targets)
+    preds, summary = pipeline.output('predict')
+    params = {'path': os.path.basename(args.path), 'horizon': args.horizon, 'uplift': args.uplift,
+              'stage_keys': {name: result.key[:16] for name, result in pipeline.results.items()}}
+    return forecast_run(pipeline.output('load'), preds, summary, pipeline.output('intervals'),
+                        None if args.no_cv else pipeline.output('cv')[0], pipeline.output('fit')[0], params)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the CAC forecast run into the forecast_* tables")
+    parser.add_argument('--backend', choices=BACKENDS, default='local-postgres')
+    parser.add_argument('--dsn', help="local PostgreSQL URL (default: import_local_data.LOCAL_DB_CONFIG)")
+    parser.add_argument('--path', default="wbr_global_data.csv", help="global WBR CSV (default: %(default)s)")
+    parser.add_argument('--horizon', type=int, default=28)
+    parser.add_argument('--uplift', type=float, default=0.20)
+    parser.add_argument('--model', choices=MODELS, default="auto")
+    parser.add_argument('--no-cv', action='store_true', help="skip cross-validation and the metrics table")
+    parser.add_argument('--keep', type=int, default=KEEP_RUNS, help="complete runs kept (default: %(default)s)")
+    parser.add_argument('--batch-size', type=int, help="Supabase rows per upsert request")
+    parser.add_argument('--concurrency', type=int, help="Supabase requests in flight")
+    parser.add_argument('--out-dir', default=".", help="pipeline CSV folder (as for forecast_pipeline.py)")
+    parser.add_argument('--cache-dir', default=PIPELINE_CACHE_DIR)
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    instrumentation.configure_from_args(args)
+    run = pipeline_run(args)
+    start = time.perf_counter()
+    with span('write', rows=run.rows, backend=args.backend):
+        if args.backend == 'local-postgres':
+            if args.dsn:
+                from sqlalchemy import create_engine
+                engine = create_engine(args.dsn.replace('postgresql://', 'postgresql+psycopg2://', 1))
+            else:
+                from import_local_data import create_local_db_engine
+                engine = create_local_db_engine(pool_size=1)
+            pruned = write_local(engine, run, args.keep)
+        else:
+            sys.path.insert(0, MIGRATIONS_DIR)
+            from import_data import create_supabase_client
+            pruned = asyncio.run(_write_supabase(create_supabase_client, run, args))
+    seconds = time.perf_counter() - start
+
+    counts = ', '.join(f"{name} {len(df)}" for name, df in run.tables.items())
+    print(f"\n✅ Wrote forecast run {run.run_id} ({counts} rows) to {args.backend} in {seconds:.2f}s; "
+          f"pruned {pruned} old run(s)")
+    instrumentation.finish(args)
+
+
+async def _write_supabase(create_client, run, args):
+    supabase = await create_client()
+    return await write_supabase(supabase, run, args.keep, args.batch_size, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
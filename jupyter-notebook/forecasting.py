@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - CAC Forecasting
+Spend scenarios, order models, a batched scenario engine and a parallel
+rolling-origin cross-validation runner for CAC_Forecast.ipynb
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+from data_access import load_table
+from instrumentation import span
+from weekday_stats import WEEKDAYS, WeekdayStats
+
+logger = logging.getLogger(__name__)
+
+# Options of the global Prophet model; part of every CV cache key
+PROPHET_PARAMS = {"weekly_seasonality": True, "yearly_seasonality": True}
+REGRESSORS = ("spend",)
+
+# Rolling-origin CV windows used by the notebook
+CV_HORIZON = "28 days"
+CV_PERIOD = "14 days"
+CV_INITIAL = "400 days"
+
+# Per-fold forecasts are cached here, keyed on training data + model params
+CV_CACHE_DIR = ".cv_cache"
+
+CV_BACKENDS = ("processes", "prophet", "serial")
+
+
+# ---- Data & scenarios ----
+
+def load_history(path="wbr_global_data.csv"):
+    """Daily ds/spend/orders/cac history from the global WBR export"""
+    df = load_table("wbr_global_data", filename=path)
+    df.columns = [c.lower() for c in df.columns]
+    df["ds"] = pd.to_datetime(df["date"])
+    df = df.sort_values("ds")
+    data = df.rename(columns={"daily_spend": "spend"})[["ds", "spend", "orders"]].copy()
+    data["spend"] = pd.to_numeric(data["spend"], errors="coerce").clip(lower=0)
+    data["orders"] = pd.to_numeric(data["orders"], errors="coerce").clip(lower=0)
+    data["cac"] = np.where(data["orders"] > 0, data["spend"] / data["orders"], np.nan)
+    return data.reset_index(drop=True)
+
+
+def weekday_weights(data):
+    """Inverse median CAC per weekday, normalized to sum to 1"""
+    return WeekdayStats.from_history(data).wmap()
+
+
+def baseline_spend(data, days=28):
+    """Median spend per weekday over the last `days` days"""
+    return WeekdayStats.from_history(data, window_days=days).base_spend()
+
+
+def weekday_labels(dow):
+    """Categorical day names for dayofweek codes (0 = Monday)"""
+    return pd.Categorical.from_codes(dow, categories=WEEKDAYS)
+
+
+def build_scenarios(data, horizon=28, uplift=0.20, stats=None):
+    """Baseline, flat +uplift and weekday-weighted ("smart") +uplift spend plans.
+
+    Pass a WeekdayStats kept up to date with data to skip rescanning the history.
+    """
+    stats = stats or WeekdayStats.from_history(data)
+    future = pd.DataFrame({"ds": pd.date_range(start=data["ds"].max() + pd.Timedelta(days=1), periods=horizon)})
+    dow = future["ds"].dt.dayofweek.to_numpy()
+    future["weekday"] = weekday_labels(dow)
+
+    # Per-weekday arrays indexed by dayofweek code instead of mapping day-name strings
+    base_spend = stats.spend_medians()[dow]
+    scenA = future.copy(); scenA["spend"] = base_spend
+    scenB = future.copy(); scenB["spend"] = base_spend * (1 + uplift)
+    totB = scenB["spend"].sum()
+    daily_w = stats.weights()[dow]; daily_w = daily_w / daily_w.sum()
+    scenC = future.copy(); scenC["spend"] = totB * daily_w
+    label = f"+{uplift:.0%}"
+    return {"Baseline": scenA, f"{label} Flat": scenB, f"{label} Smart": scenC}
+
+
+# ---- Models ----
+
+def make_prophet(params=None):
+    """Unfitted Prophet model with the spend regressor"""
+    from prophet import Prophet
+    m = Prophet(**(params or PROPHET_PARAMS))
+    for name in REGRESSORS:
+        m.add_regressor(name)
+    return m
+
+
+def fit_prophet(history, params=None):
+    """Fit Prophet on orders (y) with spend as a regressor"""
+    m = make_prophet(params)
+    with span("fit", rows=len(history), model="prophet"):
+        m.fit(history.rename(columns={"orders": "y"})[["ds", "y", *REGRESSORS]])
+    return m
+
+
+def spend_matrix(scen_dict):
+    """(N scenarios, H days) spend array; all scenarios must share the same dates"""
+    frames = list(scen_dict.values())
+    dates = frames[0]["ds"].reset_index(drop=True)
+    for f in frames[1:]:
+        if not f["ds"].reset_index(drop=True).equals(dates):
+            raise ValueError("all scenarios must cover the same dates")
+    return dates, np.vstack([f["spend"].to_numpy(dtype=float) for f in frames])
+
+
+class ProphetScenarioEngine:
+    """Scores many spend plans over fixed dates with a fitted Prophet model.
+
+    Trend and seasonality are computed once with spend held at its training
+    mean; each plan then only adds the (linear) spend regressor term, so N
+    plans cost one matrix expression instead of N m.predict() calls.
+    """
+
+    def __init__(self, m, dates):
+        from prophet.utilities import regressor_coefficients
+        self.m = m
+        self.dates = pd.Series(pd.to_datetime(dates)).reset_index(drop=True)
+        coefs = regressor_coefficients(m).set_index("regressor")
+        base = pd.DataFrame({"ds": self.dates})
+        for name in m.extra_regressors:
+            base[name] = coefs.loc[name, "center"]
+        # Regressors at their center contribute 0, leaving trend + seasonality only
+        with span("predict_components", rows=len(base)):
+            df = m.setup_dataframe(base)
+            self.trend = np.asarray(m.predict_trend(df), dtype=float)
+            seasonal = m.predict_seasonal_components(df)
+        self.multiplicative = seasonal["multiplicative_terms"].to_numpy()
+        self.additive = seasonal["additive_terms"].to_numpy()
+        self.center = coefs.loc["spend", "center"]
+        self.coef = coefs.loc["spend", "coef"]
+        self.mode = coefs.loc["spend", "regressor_mode"]
+
+    def at(self, dates):
+        """Same model scoring other dates (e.g. the history, for residuals)"""
+        return ProphetScenarioEngine(self.m, dates)
+
+    def predict(self, spend):
+        """Predicted daily orders, shape (N, H), for an (N, H) or (H,) spend array"""
+        effect = self.coef * (np.atleast_2d(np.asarray(spend, dtype=float)) - self.center)
+        if self.mode == "additive":
+            yhat = self.trend * (1 + self.multiplicative) + self.additive + effect
+        else:
+            yhat = self.trend * (1 + self.multiplicative + effect) + self.additive
+        return yhat.clip(min=0)
+
+
+def ridge_time_features(ds, origin):
+    """Days since `origin` plus Tuesday..Sunday indicators"""
+    trend = (ds - origin).dt.days.to_numpy(dtype=float)
+    dow = ds.dt.dayofweek.to_numpy()
+    return np.column_stack([trend] + [dow == d for d in range(1, 7)]).astype(float)
+
+
+def fit_ridge(history, alpha=1.0):
+    """Fit the fallback Ridge model: log1p(orders) ~ trend + weekday + log1p(spend)"""
+    from sklearn.linear_model import Ridge
+    X = np.column_stack([ridge_time_features(history["ds"], history["ds"].min()),
+                         np.log1p(history["spend"].to_numpy(dtype=float))])
+    y = np.log1p(history["orders"].to_numpy(dtype=float))  # variance stabilization
+    with span("fit", rows=len(history), model="ridge"):
+        return Ridge(alpha=alpha).fit(X, y)
+
+
+class RidgeScenarioEngine:
+    """Scores many spend plans over fixed dates with the fallback Ridge model.
+
+    The trend/weekday part of the prediction is computed once per horizon;
+    spend plans only add coef * log1p(spend).
+    """
+
+    def __init__(self, history, dates, alpha=1.0, model=None):
+        self.model = model if model is not None else fit_ridge(history, alpha)
+        self.history = history
+        self.dates = pd.Series(pd.to_datetime(dates)).reset_index(drop=True)
+        *time_coef, self.coef = self.model.coef_
+        self.base = (self.model.intercept_
+                     + ridge_time_features(self.dates, history["ds"].min()) @ np.asarray(time_coef))
+
+    def at(self, dates):
+        """Same model scoring other dates (e.g. the history, for residuals)"""
+        return RidgeScenarioEngine(self.history, dates, model=self.model)
+
+    def predict(self, spend):
+        """Predicted daily orders, shape (N, H), for an (N, H) or (H,) spend array"""
+        log_spend = np.log1p(np.atleast_2d(np.asarray(spend, dtype=float)))
+        return np.expm1(self.base + self.coef * log_spend).clip(min=0)
+
+
+def score_spend(engine, spend):
+    """Total spend, predicted orders and projected CAC of each spend plan (rows of `spend`)"""
+    spend = np.atleast_2d(np.asarray(spend, dtype=float))
+    orders = engine.predict(spend).sum(axis=1)
+    total = spend.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cac = np.where(orders > 0, total / orders, np.nan)
+    return pd.DataFrame({"TotalSpend": total, "PredOrders": orders, "ProjectedCAC": cac})
+
+
+def predict_scenarios(engine, scen_dict):
+    """Scenario frames with a pred_orders column, from one batched engine.predict"""
+    _, spend = spend_matrix(scen_dict)
+    with span("predict", rows=spend.size, scenarios=len(spend)):
+        pred = engine.predict(spend)
+    out = {}
+    for i, (k, f) in enumerate(scen_dict.items()):
+        o = f.copy()
+        o["pred_orders"] = pred[i]
+        out[k] = o
+    return out
+
+
+def predict_orders_prophet(m, scen_dict):
+    """Predicted orders per scenario from a fitted Prophet model; returns (preds, m, "Prophet")"""
+    dates, _ = spend_matrix(scen_dict)
+    return predict_scenarios(ProphetScenarioEngine(m, dates), scen_dict), m, "Prophet"
+
+
+def predict_orders_reg(history, scen_dict, model=None):
+    """Predicted orders per scenario from the fallback Ridge model (fitted unless given);
+    returns (preds, model, "Ridge")"""
+    dates, _ = spend_matrix(scen_dict)
+    engine = RidgeScenarioEngine(history, dates, model=model)
+    return predict_scenarios(engine, scen_dict), engine.model, "Ridge"
+
+
+def summarize(preds, horizon):
+    """Total spend, predicted orders and projected CAC per scenario"""
+    rows = []
+    for k, d in preds.items():
+        tot_spend = d["spend"].sum()
+        tot_orders = d["pred_orders"].sum()
+        cac = tot_spend / tot_orders if tot_orders > 0 else np.nan
+        rows.append({"Scenario": k, "HorizonDays": horizon, "TotalSpend": round(tot_spend, 2),
+                     "PredOrders": round(tot_orders, 1), "ProjectedCAC": round(cac, 2)})
+    return pd.DataFrame(rows).sort_values("Scenario")
+
+
+# ---- Cross-validation ----
+
+def cv_frame(data):
+    """Prophet-style ds/y/regressor frame"""
+    return data.rename(columns={"orders": "y"})[["ds", "y", *REGRESSORS]].reset_index(drop=True)
+
+
+def cv_cutoffs(df, horizon=CV_HORIZON, period=CV_PERIOD, initial=CV_INITIAL):
+    """Rolling-origin cutoffs, identical to prophet.diagnostics.cross_validation"""
+    from prophet.diagnostics import generate_cutoffs
+    return generate_cutoffs(df, pd.Timedelta(horizon), pd.Timedelta(initial), pd.Timedelta(period))
+
+
+def fold_key(rows, cutoff, horizon, params):
+    """Cache key of one fold: hash of its train + test rows, cutoff, horizon and model params"""
+    import prophet
+    digest = hashlib.sha256(pd.util.hash_pandas_object(rows, index=False).values.tobytes())
+    digest.update(json.dumps({"cutoff": str(cutoff), "horizon": str(pd.Timedelta(horizon)),
+                              "params": params, "regressors": REGRESSORS,
+                              "prophet": prophet.__version__}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def run_fold(df, cutoff, horizon, params, cache_dir=None):
+    """Fit and forecast one fold; returns (forecast, seconds, cached)"""
+    start = time.perf_counter()
+    horizon = pd.Timedelta(horizon)
+    train = df[df["ds"] <= cutoff]
+    cache_path = None
+    if cache_dir:
+        rows = df[df["ds"] <= cutoff + horizon]
+        cache_path = os.path.join(cache_dir, fold_key(rows, cutoff, horizon, params) + ".parquet")
+        if os.path.exists(cache_path):
+            return pd.read_parquet(cache_path), time.perf_counter() - start, True
+
+    # cmdstanpy logs every fit at INFO; keep worker output readable
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+    m = make_prophet(params)
+    with span("cv_fold", rows=len(train), cutoff=str(cutoff)):
+        m.fit(train)
+        test = df[(df["ds"] > cutoff) & (df["ds"] <= cutoff + horizon)].reset_index(drop=True)
+        fc = m.predict(test[["ds", *REGRESSORS]])
+    out = fc[["ds", "yhat", "yhat_lower", "yhat_upper"]].assign(y=test["y"].values, cutoff=cutoff)
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        out.to_parquet(cache_path + ".tmp", index=False)
+        os.replace(cache_path + ".tmp", cache_path)
+    return out, time.perf_counter() - start, False
+
+
+def cross_validate(data, horizon=CV_HORIZON, period=CV_PERIOD, initial=CV_INITIAL,
+                   backend="processes", workers=None, cache_dir=CV_CACHE_DIR, params=None, mp_context=None):
+    """Rolling-origin CV of the Prophet model, one fit per cutoff.
+
+    backend="processes" spreads folds over a process pool and caches each
+    fold's forecast; "prophet" delegates to prophet's own
+    cross_validation(parallel="processes"); "serial" runs folds in order.
+    mp_context is passed to the process pool (e.g. forkserver when called
+    from a thread).
+    Returns (cv, fold_times) where cv matches prophet's cross_validation output.
+    """
+    if backend not in CV_BACKENDS:
+        raise ValueError(f"backend must be one of {CV_BACKENDS}, got {backend!r}")
+    params = params or PROPHET_PARAMS
+    df = cv_frame(data)
+
+    if backend == "prophet":
+        from prophet.diagnostics import cross_validation
+        start = time.perf_counter()
+        with span("cv", backend=backend):
+            m = make_prophet(params).fit(df)
+            cv = cross_validation(m, horizon=horizon, period=period, initial=initial, parallel="processes")
+        fold_times = pd.DataFrame({"cutoff": sorted(cv["cutoff"].unique())})
+        fold_times["seconds"] = np.nan  # prophet does not expose per-fold timings
+        fold_times["cached"] = False
+        logger.info(f"prophet cross_validation: {len(fold_times)} folds in {time.perf_counter() - start:.1f}s")
+        return cv, fold_times
+
+    cutoffs = cv_cutoffs(df, horizon, period, initial)
+    start = time.perf_counter()
+    with span("cv", rows=len(cutoffs), backend=backend):
+        if backend == "serial" or workers == 1:
+            results = [run_fold(df, cutoff, horizon, params, cache_dir) for cutoff in cutoffs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+                futures = [pool.submit(run_fold, df, cutoff, horizon, params, cache_dir) for cutoff in cutoffs]
+                results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    cv = pd.concat([forecast for forecast, _, _ in results], ignore_index=True)
+    fold_times = pd.DataFrame({"cutoff": cutoffs,
+                               "seconds": [seconds for _, seconds, _ in results],
+                               "cached": [cached for _, _, cached in results]})
+    logger.info(f"{len(cutoffs)} folds in {elapsed:.1f}s wall "
+                f"({fold_times['seconds'].sum():.1f}s fold time, {int(fold_times['cached'].sum())} cached)")
+    return cv, fold_times
+
+
+def cv_metrics(cv):
+    """(performance_metrics, mean rmse/mape/mae by horizon)"""
+    from prophet.diagnostics import performance_metrics
+    pm = performance_metrics(cv)  # columns include rmse, mape, mae, etc.
+    acc_by_h = pm[["horizon", "rmse", "mape", "mae"]].groupby("horizon", as_index=True).mean()
+    return pm, acc_by_h
+
+
+def save_cv_metrics(pm, acc_by_h, out_dir="."):
+    """Write prophet_cv_metrics.csv and prophet_cv_metrics_by_horizon.csv"""
+    pm.to_csv(os.path.join(out_dir, "prophet_cv_metrics.csv"), index=False)
+    acc_by_h.reset_index().to_csv(os.path.join(out_dir, "prophet_cv_metrics_by_horizon.csv"), index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rolling-origin cross-validation of the CAC forecast model")
+    parser.add_argument('--path', default="wbr_global_data.csv", help="global WBR CSV (default: %(default)s)")
+    parser.add_argument('--backend', choices=CV_BACKENDS, default="processes")
+    parser.add_argument('--workers', type=int, help="process pool size (default: one per CPU)")
+    parser.add_argument('--horizon', default=CV_HORIZON)
+    parser.add_argument('--period', default=CV_PERIOD)
+    parser.add_argument('--initial', default=CV_INITIAL)
+    parser.add_argument('--no-cache', action='store_true', help="refit every fold instead of reusing cached folds")
+    parser.add_argument('--out-dir', default=".", help="where to write the metrics CSVs")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    instrumentation.configure_from_args(args)
+    data = load_history(args.path)
+    cv, fold_times = cross_validate(data, args.horizon, args.period, args.initial, backend=args.backend,
+                                    workers=args.workers, cache_dir=None if args.no_cache else CV_CACHE_DIR)
+    with span("cv_metrics", rows=len(cv)):
+        pm, acc_by_h = cv_metrics(cv)
+    save_cv_metrics(pm, acc_by_h, args.out_dir)
+    instrumentation.finish(args)
+
+    print("\n⏱️  Per-fold wall time:")
+    print(fold_times.to_string(index=False))
+    print("\nAccuracy by horizon (mean across folds):")
+    print(acc_by_h)
+    overall = pm[["rmse", "mape", "mae"]].mean().to_dict()
+    print("\nOverall CV means:", {k: round(v, 4) for k, v in overall.items()})
+
+
+if __name__ == "__main__":
+    main()
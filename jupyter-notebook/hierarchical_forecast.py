@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Hierarchical Regional Forecast
+Fits one Prophet model per region x customer type series (plus the region,
+customer type and total aggregates) across a process pool and reconciles
+the forecasts so every level adds up
+"""
+
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+from data_access import load_table
+from instrumentation import span
+from wbr_store import WbrCube
+
+logger = logging.getLogger(__name__)
+
+# Per-series model: same seasonality as the global CAC model, no spend regressor
+# (spend is not broken down by region); uncertainty sampling is skipped for speed
+SERIES_PARAMS = {"weekly_seasonality": True, "yearly_seasonality": True, "uncertainty_samples": 0}
+
+METHODS = ("bottom_up", "ols", "wls", "mint")
+
+TOTAL = "Total"
+
+
+def bottom_series(regional, value="orders"):
+    """Daily `value` per (region, customer_type): dates x series, missing days as 0"""
+    cube = WbrCube.from_frame(regional, "date", dims=("region", "customer_type"), measures=(value,))
+    wide = cube.to_pandas(value)
+    # Only pairs that occur in the data become series
+    wide = wide.loc[:, cube.present.any(axis=0).reshape(-1)].fillna(0)
+    wide.index.name = None
+    return wide
+
+
+def summing_matrix(bottom_keys):
+    """(labels, S) where S maps bottom series to total, region, customer type and bottom rows"""
+    regions = sorted({region for region, _ in bottom_keys})
+    customer_types = sorted({customer_type for _, customer_type in bottom_keys})
+    labels = [("total", TOTAL, TOTAL)]
+    labels += [("region", region, TOTAL) for region in regions]
+    labels += [("customer_type", TOTAL, customer_type) for customer_type in customer_types]
+    labels += [("region_customer_type", region, customer_type) for region, customer_type in bottom_keys]
+
+    S = np.zeros((len(labels), len(bottom_keys)))
+    for i, (level, region, customer_type) in enumerate(labels):
+        for j, (bottom_region, bottom_type) in enumerate(bottom_keys):
+            S[i, j] = ((region in (TOTAL, bottom_region)) and (customer_type in (TOTAL, bottom_type)))
+    return labels, S
+
+
+def fit_series(key, ds, y, horizon, params):
+    """Fit one series; returns (key, in-sample yhat, forecast yhat, seconds)"""
+    from prophet import Prophet
+    # cmdstanpy logs every fit at INFO; keep worker output readable
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+    start = time.perf_counter()
+    m = Prophet(**params)
+    m.fit(pd.DataFrame({"ds": ds, "y": y}))
+    yhat = m.predict(m.make_future_dataframe(periods=horizon))["yhat"].to_numpy()
+    return key, yhat[:len(y)], yhat[len(y):], time.perf_counter() - start
+
+
+def base_forecasts(history, horizon, workers=None, params=None):
+    """Fit every column of `history` (dates x series) in a process pool.
+
+    Returns (fitted, forecast), each dates x series, plus per-series fit seconds.
+    """
+    params = params or SERIES_PARAMS
+    ds = history.index
+    fitted, forecast, seconds = {}, {}, {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fit_series, key, ds, history[key].to_numpy(), horizon, params)
+                   for key in history.columns]
+        for future in futures:
+            key, in_sample, ahead, fit_seconds = future.result()
+            fitted[key], forecast[key], seconds[key] = in_sample, ahead, fit_seconds
+    future_index = pd.date_range(ds.max() + pd.Timedelta(days=1), periods=horizon, freq="D")
+    return (pd.DataFrame(fitted, index=ds)[history.columns],
+            pd.DataFrame(forecast, index=future_index)[history.columns],
+            pd.Series(seconds)[history.columns])
+
+
+def shrink_covariance(residuals):
+    """Schäfer-Strimmer shrinkage of the residual covariance towards its diagonal"""
+    n = residuals.shape[0]
+    x = residuals - residuals.mean(axis=0)
+    cov = x.T @ x / n
+    sd = np.sqrt(np.diag(cov))
+    sd[sd == 0] = 1.0
+    xs = x / sd
+    corr = (xs.T @ xs) / n
+    v = ((xs ** 2).T @ (xs ** 2) - (xs.T @ xs) ** 2 / n) / (n * (n - 1))
+    np.fill_diagonal(v, 0)
+    off_diag = corr - np.diag(np.diag(corr))
+    denominator = (off_diag ** 2).sum()
+    lam = 1.0 if denominator == 0 else min(max(v.sum() / denominator, 0.0), 1.0)
+    return lam * np.diag(np.diag(cov)) + (1 - lam) * cov
+
+
+def reconcile(base, S, method="mint", residuals=None):
+    """Coherent forecasts S @ G @ base for base forecasts of shape (series, horizon).
+
+    bottom_up keeps the bottom-level forecasts; ols/wls/mint combine every level
+    using identity, residual-variance or shrunk residual-covariance weights.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+    n, m = S.shape
+    if method == "bottom_up":
+        return S @ base[n - m:]
+    if method == "ols":
+        W_inv = np.eye(n)
+    elif method == "wls":
+        W_inv = np.diag(1.0 / np.maximum(residuals.var(axis=0), 1e-9))
+    else:
+        W_inv = np.linalg.pinv(shrink_covariance(residuals))
+    G = np.linalg.solve(S.T @ W_inv @ S, S.T @ W_inv)
+    return S @ (G @ base)
+
+
+def forecast_regional(regional, value="orders", horizon=28, method="mint", workers=None):
+    """Long-format reconciled forecast of `value` for every level of the region x customer type hierarchy"""
+    bottom = bottom_series(regional, value)
+    labels, S = summing_matrix(list(bottom.columns))
+    all_series = pd.DataFrame(bottom.to_numpy() @ S.T, index=bottom.index,
+                              columns=pd.MultiIndex.from_tuples(labels))
+    # Bottom-up only needs the bottom models
+    history = all_series.iloc[:, -S.shape[1]:] if method == "bottom_up" else all_series
+
+    start = time.perf_counter()
+    with span("fit", rows=history.shape[1], model="prophet"):
+        fitted, forecast, seconds = base_forecasts(history, horizon, workers)
+    logger.info(f"Fitted {len(seconds)} series in {time.perf_counter() - start:.1f}s wall "
+                f"({seconds.sum():.1f}s of fit time)")
+
+    if method == "bottom_up":
+        reconciled = S @ forecast.to_numpy().T
+        base = np.full(reconciled.shape, np.nan)
+        base[-S.shape[1]:] = forecast.to_numpy().T
+    else:
+        residuals = (history - fitted).to_numpy()
+        base = forecast.to_numpy().T
+        with span("reconcile", rows=base.size, method=method):
+            reconciled = reconcile(base, S, method, residuals)
+
+    rows = []
+    for i, (level, region, customer_type) in enumerate(labels):
+        rows.append(pd.DataFrame({"ds": forecast.index, "level": level, "region": region,
+                                  "customer_type": customer_type, "metric": value,
+                                  "base": base[i], "forecast": reconciled[i]}))
+    return pd.concat(rows, ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconciled region x customer type forecast")
+    parser.add_argument('--data-dir', default=".", help="folder holding wbr_regional_data.csv")
+    parser.add_argument('--value', choices=("orders", "bookings", "units"), default="orders")
+    parser.add_argument('--horizon', type=int, default=28)
+    parser.add_argument('--method', choices=METHODS, default="mint")
+    parser.add_argument('--workers', type=int, help="process pool size (default: one per CPU)")
+    parser.add_argument('--output', default="regional_forecast.csv")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    instrumentation.configure_from_args(args)
+    regional = load_table("wbr_regional_data", args.data_dir)
+    result = forecast_regional(regional, args.value, args.horizon, args.method, args.workers)
+    result.to_csv(args.output, index=False)
+
+    totals = result[result["level"] == "total"]["forecast"].sum()
+    bottom = result[result["level"] == "region_customer_type"]["forecast"].sum()
+    print(f"\n✅ Wrote {len(result)} rows to {os.path.abspath(args.output)}")
+    print(f"   total {args.value} over {args.horizon} days: {totals:,.1f} (bottom series sum: {bottom:,.1f})")
+    instrumentation.finish(args)
+
+
+if __name__ == "__main__":
+    main()
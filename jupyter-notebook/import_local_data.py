@@ -5,28 +5,38 @@ Imports CSV data into local PostgreSQL database
 """
 
 import pandas as pd
+import numpy as np
+import argparse
+import io
 import os
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from sqlalchemy import create_engine, text
 import psycopg2
 
+from cleaning import SCHEMAS
+from data_access import DEFAULT_MEMORY_LIMIT, iter_table, load_table
+import instrumentation
+from instrumentation import in_context, span
+from settings import DEFAULTS
+from verification import log_import_summary
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Local PostgreSQL configuration
-LOCAL_DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5433,
-    'database': 'eightsleep_local',
-    'user': 'eightsleep_user',
-    'password': 'eightsleep_password'
-}
+LOCAL_DB_CONFIG = dict(DEFAULTS['local-postgres'])
 
-def create_local_db_engine():
-    """Create SQLAlchemy engine for local PostgreSQL"""
+# Tables loaded at once; each load holds one pooled connection
+DEFAULT_WORKERS = 3
+
+def create_local_db_engine(pool_size=DEFAULT_WORKERS):
+    """Create SQLAlchemy engine for local PostgreSQL, pooling up to pool_size connections"""
     connection_string = f"postgresql://{LOCAL_DB_CONFIG['user']}:{LOCAL_DB_CONFIG['password']}@{LOCAL_DB_CONFIG['host']}:{LOCAL_DB_CONFIG['port']}/{LOCAL_DB_CONFIG['database']}"
-    return create_engine(connection_string)
+    return create_engine(connection_string, pool_size=pool_size, max_overflow=0)
 
 def test_connection():
     """Test connection to local PostgreSQL"""
@@ -42,164 +52,239 @@ def test_connection():
         logger.info("Make sure to run: docker-compose -f docker-compose-local.yml up -d")
         return False
 
-def clean_currency_column(df, column_name):
-    """Clean currency columns by removing $ and , and converting to float"""
-    if column_name in df.columns:
-        df[column_name] = df[column_name].astype(str).str.replace('$', '').str.replace(',', '')
-        df[column_name] = pd.to_numeric(df[column_name], errors='coerce')
-    return df
+def get_incremental_start(engine, table_name, resync_days=0):
+    """First date to (re)load in incremental mode, or None if the table is empty.
+
+    The latest loaded period is always re-synced so partially loaded days and
+    months are completed; resync_days widens that window to catch restatements.
+    """
+    column = SCHEMAS[table_name].date_column
+    with engine.connect() as conn:
+        latest = conn.execute(text(f"SELECT MAX({column}) FROM {table_name}")).scalar()
+    if latest is None:
+        logger.info(f"  {table_name} is empty, loading full history")
+        return None
+    start = latest - timedelta(days=resync_days)
+    logger.info(f"  {table_name}: latest loaded {latest}, loading rows from {start}")
+    return start
+
+# Rows per in-memory CSV buffer streamed into COPY
+COPY_CHUNK_ROWS = 100_000
 
-def clean_numeric_column(df, column_name):
-    """Clean numeric columns by removing , and converting to int"""
-    if column_name in df.columns:
-        df[column_name] = df[column_name].astype(str).str.replace(',', '')
-        df[column_name] = pd.to_numeric(df[column_name], errors='coerce').astype('Int64')
+# Dashboard rollup refresh function per source table (see migrations/006_create_rollup_tables.sql)
+ROLLUP_FUNCTIONS = {
+    'channel_performance': 'refresh_channel_rollups',
+    'wbr_global_data': 'refresh_global_rollups',
+    'wbr_regional_data': 'refresh_regional_rollups',
+}
+
+def delete_statement(table_name, since=None):
+    """DELETE for every row, or only rows on or after since in incremental mode (psycopg2 paramstyle)"""
+    if since is None:
+        return f"DELETE FROM {table_name}", ()
+    return f"DELETE FROM {table_name} WHERE {SCHEMAS[table_name].date_column} >= %s", (since,)
+
+def rollup_statement(table_name, since=None):
+    """Recompute the rollups fed by a table from `since` (all periods when None)"""
+    return f"SELECT {ROLLUP_FUNCTIONS[table_name]}(%s::DATE)", (since,)
+
+def integral_floats_to_int(df):
+    """Cast float columns holding only whole numbers to Int64 so COPY can load them into INTEGER columns"""
+    df = df.copy()
+    for column in df.select_dtypes(include='float').columns:
+        values = df[column].to_numpy()
+        present = values[~np.isnan(values)]
+        if np.array_equal(present, np.floor(present)):
+            df[column] = df[column].astype('Int64')
     return df
 
-def import_channel_performance(engine):
+def copy_dataframe(cursor, table_name, df, chunk_rows=COPY_CHUNK_ROWS):
+    """Stream a DataFrame into a table with COPY ... FROM STDIN, one CSV buffer per chunk"""
+    df = integral_floats_to_int(df)
+    copy_sql = f"COPY {table_name} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)"
+    for start in range(0, len(df), chunk_rows):
+        buffer = io.StringIO()
+        df.iloc[start:start + chunk_rows].to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        cursor.copy_expert(copy_sql, buffer)
+
+def as_chunks(df):
+    """A DataFrame as a one-chunk list; an iterable of chunks as is"""
+    return [df] if isinstance(df, pd.DataFrame) else df
+
+def load_with_copy(engine, table_name, df, since=None, commit=True, refresh_rollups=True):
+    """Replace table rows using COPY; the DELETE, the load and the rollup refresh run in one transaction.
+
+    df may be a DataFrame or an iterable of chunks (see data_access.iter_table); returns the rows loaded.
+    """
+    rows = 0
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cursor:
+            with span('delete'):
+                cursor.execute(*delete_statement(table_name, since))
+            for chunk in as_chunks(df):
+                with span('copy', rows=len(chunk)):
+                    copy_dataframe(cursor, table_name, chunk)
+                rows += len(chunk)
+            if refresh_rollups:
+                with span('refresh_rollups'):
+                    cursor.execute(*rollup_statement(table_name, since))
+        with span('commit' if commit else 'rollback'):
+            if commit:
+                conn.commit()
+            else:
+                conn.rollback()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return rows
+
+def load_with_to_sql(engine, table_name, df, since=None, commit=True, refresh_rollups=True):
+    """Replace table rows using DataFrame.to_sql; the DELETE, the load and the rollup refresh run in one transaction.
+
+    df may be a DataFrame or an iterable of chunks; returns the rows loaded.
+    """
+    rows = 0
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            with span('delete'):
+                conn.exec_driver_sql(*delete_statement(table_name, since))
+            for chunk in as_chunks(df):
+                with span('insert', rows=len(chunk)):
+                    chunk.to_sql(table_name, conn, if_exists='append', index=False)
+                rows += len(chunk)
+            if refresh_rollups:
+                with span('refresh_rollups'):
+                    conn.exec_driver_sql(*rollup_statement(table_name, since))
+            with span('commit' if commit else 'rollback'):
+                if commit:
+                    transaction.commit()
+                else:
+                    transaction.rollback()
+        except Exception:
+            transaction.rollback()
+            raise
+    return rows
+
+LOADERS = {
+    'copy': load_with_copy,
+    'to_sql': load_with_to_sql,
+}
+
+def import_channel_performance(engine, since=None, loader='copy', refresh_rollups=True, memory_limit=DEFAULT_MEMORY_LIMIT,
+                               data_dir='.'):
     """Import channel performance data to local database"""
     logger.info("Importing channel performance data to local database...")
     
-    # Read CSV
-    df = pd.read_csv('channel_performance.csv')
-    
-    # Clean data
-    df = clean_currency_column(df, 'Spend')
-    df = clean_currency_column(df, 'Last Click Revenue')
-    df['Month'] = pd.to_datetime(df['Month']).dt.date
-    
-    # Rename columns to match database
-    df = df.rename(columns={
-        'Channel': 'channel',
-        'Spend': 'spend',
-        'Month': 'month',
-        'Visitors': 'visitors',
-        'Last Click Add To Cart': 'last_click_add_to_cart',
-        'Last Click Orders': 'last_click_orders',
-        'Last Click Revenue': 'last_click_revenue',
-        'Last Click Email Captures': 'last_click_email_captures',
-        'Email capture conversions 30 day window': 'email_capture_conversions_30_day',
-        'Email capture conversions 60 day window': 'email_capture_conversions_60_day'
-    })
+    # Stream the cleaned CSV in chunks under the memory ceiling, from the Parquet cache when unchanged
+    chunks = iter_table('channel_performance', data_dir, since, memory_limit=memory_limit)
     
-    # Clear existing data and insert new data
-    with engine.connect() as conn:
-        conn.execute(text("DELETE FROM channel_performance"))
-        conn.commit()
-    
-    # Insert data
-    df.to_sql('channel_performance', engine, if_exists='append', index=False)
-    logger.info(f"✅ Imported {len(df)} channel performance records to local database")
+    # Clear existing data (or the re-synced window), load new data and refresh rollups in one transaction
+    with span('channel_performance', loader=loader) as s:
+        rows = s.rows = LOADERS[loader](engine, 'channel_performance', chunks, since, refresh_rollups=refresh_rollups)
+    logger.info(f"✅ Imported {rows} channel performance records to local database")
 
-def import_wbr_global_data(engine):
+def import_wbr_global_data(engine, since=None, loader='copy', refresh_rollups=True, memory_limit=DEFAULT_MEMORY_LIMIT,
+                           data_dir='.'):
     """Import WBR global data to local database"""
     logger.info("Importing WBR global data to local database...")
     
-    # Read CSV
-    df = pd.read_csv('wbr_Global_data.csv')
-    
-    # Clean data
-    df = clean_currency_column(df, 'Daily Spend')
-    df = clean_currency_column(df, 'Bookings')
-    df['Date'] = pd.to_datetime(df['Date']).dt.date
-    df = clean_numeric_column(df, 'Visitors')
+    # Stream the cleaned CSV in chunks under the memory ceiling, from the Parquet cache when unchanged
+    chunks = iter_table('wbr_global_data', data_dir, since, memory_limit=memory_limit)
     
-    # Rename columns to match database
-    df = df.rename(columns={
-        'Date': 'date',
-        'Daily Spend': 'daily_spend',
-        'Orders': 'orders',
-        'Bookings': 'bookings',
-        'Visitors': 'visitors'
-    })
-    
-    # Clear existing data and insert new data
-    with engine.connect() as conn:
-        conn.execute(text("DELETE FROM wbr_global_data"))
-        conn.commit()
-    
-    # Insert data
-    df.to_sql('wbr_global_data', engine, if_exists='append', index=False)
-    logger.info(f"✅ Imported {len(df)} WBR global records to local database")
+    # Clear existing data (or the re-synced window), load new data and refresh rollups in one transaction
+    with span('wbr_global_data', loader=loader) as s:
+        rows = s.rows = LOADERS[loader](engine, 'wbr_global_data', chunks, since, refresh_rollups=refresh_rollups)
+    logger.info(f"✅ Imported {rows} WBR global records to local database")
 
-def import_wbr_regional_data(engine):
+def import_wbr_regional_data(engine, since=None, loader='copy', refresh_rollups=True, memory_limit=DEFAULT_MEMORY_LIMIT,
+                             data_dir='.'):
     """Import WBR regional data to local database"""
     logger.info("Importing WBR regional data to local database...")
     
-    # Read CSV
-    df = pd.read_csv('wbr_regional_data.csv')
-    
-    # Clean data - remove empty columns
-    df = df.dropna(how='all', axis=1)
-    
-    # Clean currency columns
-    df = clean_currency_column(df, 'Bookings')
-    
-    # Convert date
-    df['Date'] = pd.to_datetime(df['Date']).dt.date
-    
-    # Rename columns to match database
-    df = df.rename(columns={
-        'Date': 'date',
-        'Customer Type': 'customer_type',
-        'Region': 'region',
-        'Bookings': 'bookings',
-        'Orders': 'orders',
-        'Units': 'units'
-    })
+    # Stream the cleaned CSV in chunks under the memory ceiling, from the Parquet cache when unchanged
+    chunks = iter_table('wbr_regional_data', data_dir, since, memory_limit=memory_limit)
     
-    # Clear existing data and insert new data
-    with engine.connect() as conn:
-        conn.execute(text("DELETE FROM wbr_regional_data"))
-        conn.commit()
-    
-    # Insert data
-    df.to_sql('wbr_regional_data', engine, if_exists='append', index=False)
-    logger.info(f"✅ Imported {len(df)} WBR regional records to local database")
+    # Clear existing data (or the re-synced window), load new data and refresh rollups in one transaction
+    with span('wbr_regional_data', loader=loader) as s:
+        rows = s.rows = LOADERS[loader](engine, 'wbr_regional_data', chunks, since, refresh_rollups=refresh_rollups)
+    logger.info(f"✅ Imported {rows} WBR regional records to local database")
+
+IMPORTERS = {
+    'channel_performance': import_channel_performance,
+    'wbr_global_data': import_wbr_global_data,
+    'wbr_regional_data': import_wbr_regional_data,
+}
+
+def import_all(engine, since=None, loader='copy', refresh_rollups=True, workers=DEFAULT_WORKERS,
+               memory_limit=DEFAULT_MEMORY_LIMIT, data_dir='.'):
+    """Read, clean and load every table concurrently, one worker thread (and pooled connection) per table"""
+    since = since or {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(in_context(import_table), engine, since.get(table_name), loader, refresh_rollups, memory_limit,
+                               data_dir)
+                   for table_name, import_table in IMPORTERS.items()]
+        # Re-raise the first failure once every load has finished or rolled back
+        for future in futures:
+            future.result()
+
+def benchmark_loaders(engine, data_dir='.'):
+    """Time the COPY and to_sql loaders on every table; each run is rolled back"""
+    logger.info("Benchmarking loaders (changes are rolled back)...")
+    frames = {table_name: load_table(table_name, data_dir) for table_name in SCHEMAS}
+    for table_name, df in frames.items():
+        timings = {}
+        for name, loader in LOADERS.items():
+            start = time.perf_counter()
+            loader(engine, table_name, df, commit=False)
+            timings[name] = time.perf_counter() - start
+        speedup = timings['to_sql'] / timings['copy'] if timings['copy'] > 0 else float('inf')
+        logger.info(f"  {table_name} ({len(df)} rows): to_sql {timings['to_sql']:.3f}s, "
+                    f"COPY {timings['copy']:.3f}s ({speedup:.1f}x)")
 
 def verify_local_import(engine):
     """Verify the data import to local database"""
     logger.info("Verifying local data import...")
     
-    # Check row counts
-    with engine.connect() as conn:
-        channel_count = conn.execute(text("SELECT COUNT(*) FROM channel_performance")).fetchone()[0]
-        global_count = conn.execute(text("SELECT COUNT(*) FROM wbr_global_data")).fetchone()[0]
-        regional_count = conn.execute(text("SELECT COUNT(*) FROM wbr_regional_data")).fetchone()[0]
-    
-    logger.info(f"Channel Performance: {channel_count} rows")
-    logger.info(f"WBR Global Data: {global_count} rows")
-    logger.info(f"WBR Regional Data: {regional_count} rows")
-    
-    # Show sample data
-    logger.info("\nSample Channel Performance:")
-    with engine.connect() as conn:
-        sample = conn.execute(text("SELECT channel, spend, visitors FROM channel_performance LIMIT 3")).fetchall()
-        for row in sample:
-            logger.info(f"  {row[0]}: ${row[1]} - {row[2]} visitors")
-    
-    logger.info("\nSample WBR Global Data:")
-    with engine.connect() as conn:
-        sample = conn.execute(text("SELECT date, daily_spend, orders FROM wbr_global_data LIMIT 3")).fetchall()
-        for row in sample:
-            logger.info(f"  {row[0]}: ${row[1]} - {row[2]} orders")
-    
-    logger.info("\nSample WBR Regional Data:")
-    with engine.connect() as conn:
-        sample = conn.execute(text("SELECT date, customer_type, region, bookings FROM wbr_regional_data LIMIT 3")).fetchall()
-        for row in sample:
-            logger.info(f"  {row[0]} - {row[1]} - {row[2]}: ${row[3]}")
+    # Counts and samples for every table in one round-trip (see import_summary in init-local-db.sql)
+    with span('verify'), engine.connect() as conn:
+        summary = conn.execute(text("SELECT import_summary(3)")).scalar()
+    log_import_summary(summary)
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Import EightSleep CSV datasets into the local PostgreSQL database")
+    parser.add_argument('--data-dir', default='.', help="folder holding the source CSVs (default: current directory)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only load rows on or after the latest loaded date/month of each table")
+    parser.add_argument('--resync-days', type=int, default=0,
+                        help="with --incremental, also re-load this many days before the latest loaded date")
+    parser.add_argument('--loader', choices=sorted(LOADERS), default='copy',
+                        help="bulk load path (default: copy)")
+    parser.add_argument('--skip-rollups', action='store_true',
+                        help="do not refresh the dashboard rollup tables after loading")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"tables loaded concurrently (default: {DEFAULT_WORKERS})")
+    parser.add_argument('--memory-limit', type=int, default=DEFAULT_MEMORY_LIMIT // 2**20,
+                        help="MB one chunk may use on its way from CSV to database, per table "
+                             f"(default: {DEFAULT_MEMORY_LIMIT // 2**20})")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="compare the COPY and to_sql loaders without changing any data")
+    instrumentation.add_arguments(parser)
+    return parser.parse_args(argv)
 
-def main():
+def main(argv=None):
     """Main import function for local database"""
+    args = parse_args(argv)
+    instrumentation.configure_from_args(args)
     logger.info("Starting EightSleep data import to local PostgreSQL...")
     
     # Check if CSV files exist
-    required_files = [
-        'channel_performance.csv',
-        'wbr_Global_data.csv',
-        'wbr_regional_data.csv'
-    ]
+    required_files = [os.path.join(args.data_dir, schema.filename) for schema in SCHEMAS.values()]
     
     for file_path in required_files:
         if not os.path.exists(file_path):
@@ -212,12 +297,23 @@ def main():
     
     try:
         # Create engine
-        engine = create_local_db_engine()
+        engine = create_local_db_engine(pool_size=args.workers)
+        
+        if args.benchmark:
+            benchmark_loaders(engine, args.data_dir)
+            return
+        
+        # Work out where each table's delta starts
+        since = {table_name: None for table_name in SCHEMAS}
+        if args.incremental:
+            logger.info("Incremental mode: checking latest loaded dates...")
+            for table_name in SCHEMAS:
+                since[table_name] = get_incremental_start(engine, table_name, args.resync_days)
         
-        # Import all datasets to local database
-        import_channel_performance(engine)
-        import_wbr_global_data(engine)
-        import_wbr_regional_data(engine)
+        # Import all datasets to local database concurrently
+        with span('import'):
+            import_all(engine, since, args.loader, not args.skip_rollups, args.workers, args.memory_limit * 2**20,
+                       args.data_dir)
         
         # Verify import
         verify_local_import(engine)
@@ -231,6 +327,8 @@ def main():
     except Exception as e:
         logger.error(f"❌ Local import failed: {str(e)}")
         raise
+    finally:
+        instrumentation.finish(args)
 
 if __name__ == "__main__":
     main()
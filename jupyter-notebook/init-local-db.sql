@@ -24,7 +24,8 @@ CREATE TABLE IF NOT EXISTS channel_performance (
     email_capture_conversions_30_day INTEGER,
     email_capture_conversions_60_day INTEGER,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    CONSTRAINT uq_channel_performance_channel_month UNIQUE (channel, month)
 );
 
 -- Create indexes for better query performance
@@ -58,7 +59,8 @@ CREATE TABLE IF NOT EXISTS wbr_global_data (
     bookings DECIMAL(15,2),
     visitors INTEGER,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    CONSTRAINT uq_wbr_global_data_date UNIQUE (date)
 );
 
 -- Create indexes for better query performance
@@ -90,7 +92,8 @@ CREATE TABLE IF NOT EXISTS wbr_regional_data (
     orders INTEGER,
     units INTEGER,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    CONSTRAINT uq_wbr_regional_data_date_region_customer_type UNIQUE (date, region, customer_type)
 );
 
 -- Create indexes for better query performance
@@ -115,6 +118,299 @@ CREATE TRIGGER update_wbr_regional_data_updated_at
     FOR EACH ROW 
     EXECUTE FUNCTION update_updated_at_column();
 
+-- Rollup tables for dashboards (same as migrations/006_create_rollup_tables.sql)
+-- Channel KPIs by month
+CREATE TABLE IF NOT EXISTS rollup_channel_monthly (
+    month DATE NOT NULL,
+    channel VARCHAR(100) NOT NULL,
+    spend DECIMAL(15,2),
+    visitors BIGINT,
+    orders BIGINT,
+    revenue DECIMAL(15,2),
+    cac DECIMAL(15,2),
+    roi DECIMAL(15,4),
+    aov DECIMAL(15,2),
+    PRIMARY KEY (month, channel)
+);
+
+-- Global spend/orders/bookings by week and by month
+CREATE TABLE IF NOT EXISTS rollup_global_weekly (
+    week_start DATE PRIMARY KEY,
+    days INTEGER,
+    spend DECIMAL(15,2),
+    orders BIGINT,
+    bookings DECIMAL(15,2),
+    visitors BIGINT,
+    cac DECIMAL(15,2),
+    aov DECIMAL(15,2)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_global_monthly (
+    month DATE PRIMARY KEY,
+    days INTEGER,
+    spend DECIMAL(15,2),
+    orders BIGINT,
+    bookings DECIMAL(15,2),
+    visitors BIGINT,
+    cac DECIMAL(15,2),
+    aov DECIMAL(15,2)
+);
+
+-- Regional bookings/orders/units by region x customer type, by week and by month
+CREATE TABLE IF NOT EXISTS rollup_regional_weekly (
+    week_start DATE NOT NULL,
+    region VARCHAR(10) NOT NULL,
+    customer_type VARCHAR(100) NOT NULL,
+    bookings DECIMAL(15,2),
+    orders BIGINT,
+    units BIGINT,
+    aov DECIMAL(15,2),
+    PRIMARY KEY (week_start, region, customer_type)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_regional_monthly (
+    month DATE NOT NULL,
+    region VARCHAR(10) NOT NULL,
+    customer_type VARCHAR(100) NOT NULL,
+    bookings DECIMAL(15,2),
+    orders BIGINT,
+    units BIGINT,
+    aov DECIMAL(15,2),
+    PRIMARY KEY (month, region, customer_type)
+);
+
+-- Add comments for documentation
+COMMENT ON TABLE rollup_channel_monthly IS 'Monthly channel KPIs (CAC = spend/orders, ROI = revenue/spend, AOV = revenue/orders)';
+COMMENT ON TABLE rollup_global_weekly IS 'Weekly (Monday start) totals of wbr_global_data';
+COMMENT ON TABLE rollup_global_monthly IS 'Monthly totals of wbr_global_data';
+COMMENT ON TABLE rollup_regional_weekly IS 'Weekly (Monday start) totals of wbr_regional_data by region and customer type';
+COMMENT ON TABLE rollup_regional_monthly IS 'Monthly totals of wbr_regional_data by region and customer type';
+
+-- Refresh functions: recompute every period touching p_from or later (NULL = full rebuild)
+CREATE OR REPLACE FUNCTION refresh_channel_rollups(p_from DATE DEFAULT NULL)
+RETURNS VOID AS $$
+DECLARE
+    month_from DATE := COALESCE(date_trunc('month', p_from)::DATE, '-infinity'::DATE);
+BEGIN
+    DELETE FROM rollup_channel_monthly WHERE month >= month_from;
+    INSERT INTO rollup_channel_monthly (month, channel, spend, visitors, orders, revenue, cac, roi, aov)
+    SELECT
+        date_trunc('month', month)::DATE,
+        channel,
+        SUM(spend),
+        SUM(visitors),
+        SUM(last_click_orders),
+        SUM(last_click_revenue),
+        SUM(spend) / NULLIF(SUM(last_click_orders), 0),
+        SUM(last_click_revenue) / NULLIF(SUM(spend), 0),
+        SUM(last_click_revenue) / NULLIF(SUM(last_click_orders), 0)
+    FROM channel_performance
+    WHERE month >= month_from
+    GROUP BY 1, 2;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION refresh_global_rollups(p_from DATE DEFAULT NULL)
+RETURNS VOID AS $$
+DECLARE
+    week_from DATE := COALESCE(date_trunc('week', p_from)::DATE, '-infinity'::DATE);
+    month_from DATE := COALESCE(date_trunc('month', p_from)::DATE, '-infinity'::DATE);
+BEGIN
+    DELETE FROM rollup_global_weekly WHERE week_start >= week_from;
+    INSERT INTO rollup_global_weekly (week_start, days, spend, orders, bookings, visitors, cac, aov)
+    SELECT
+        date_trunc('week', date)::DATE,
+        COUNT(*),
+        SUM(daily_spend),
+        SUM(orders),
+        SUM(bookings),
+        SUM(visitors),
+        SUM(daily_spend) / NULLIF(SUM(orders), 0),
+        SUM(bookings) / NULLIF(SUM(orders), 0)
+    FROM wbr_global_data
+    WHERE date >= week_from
+    GROUP BY 1;
+
+    DELETE FROM rollup_global_monthly WHERE month >= month_from;
+    INSERT INTO rollup_global_monthly (month, days, spend, orders, bookings, visitors, cac, aov)
+    SELECT
+        date_trunc('month', date)::DATE,
+        COUNT(*),
+        SUM(daily_spend),
+        SUM(orders),
+        SUM(bookings),
+        SUM(visitors),
+        SUM(daily_spend) / NULLIF(SUM(orders), 0),
+        SUM(bookings) / NULLIF(SUM(orders), 0)
+    FROM wbr_global_data
+    WHERE date >= month_from
+    GROUP BY 1;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION refresh_regional_rollups(p_from DATE DEFAULT NULL)
+RETURNS VOID AS $$
+DECLARE
+    week_from DATE := COALESCE(date_trunc('week', p_from)::DATE, '-infinity'::DATE);
+    month_from DATE := COALESCE(date_trunc('month', p_from)::DATE, '-infinity'::DATE);
+BEGIN
+    DELETE FROM rollup_regional_weekly WHERE week_start >= week_from;
+    INSERT INTO rollup_regional_weekly (week_start, region, customer_type, bookings, orders, units, aov)
+    SELECT
+        date_trunc('week', date)::DATE,
+        region,
+        customer_type,
+        SUM(bookings),
+        SUM(orders),
+        SUM(units),
+        SUM(bookings) / NULLIF(SUM(orders), 0)
+    FROM wbr_regional_data
+    WHERE date >= week_from
+    GROUP BY 1, 2, 3;
+
+    DELETE FROM rollup_regional_monthly WHERE month >= month_from;
+    INSERT INTO rollup_regional_monthly (month, region, customer_type, bookings, orders, units, aov)
+    SELECT
+        date_trunc('month', date)::DATE,
+        region,
+        customer_type,
+        SUM(bookings),
+        SUM(orders),
+        SUM(units),
+        SUM(bookings) / NULLIF(SUM(orders), 0)
+    FROM wbr_regional_data
+    WHERE date >= month_from
+    GROUP BY 1, 2, 3;
+END;
+$$ language 'plpgsql';
+
+-- Initial build (no-op on an empty database)
+SELECT refresh_channel_rollups();
+SELECT refresh_global_rollups();
+SELECT refresh_regional_rollups();
+
+-- Import verification summary (same as migrations/007_create_import_summary_function.sql)
+CREATE OR REPLACE FUNCTION import_summary(p_sample_rows INTEGER DEFAULT 3)
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'channel_performance', json_build_object(
+            'count', (SELECT COUNT(*) FROM channel_performance),
+            'sample', (SELECT COALESCE(json_agg(s), '[]'::JSON) FROM (
+                SELECT channel, spend, visitors FROM channel_performance LIMIT p_sample_rows) s)
+        ),
+        'wbr_global_data', json_build_object(
+            'count', (SELECT COUNT(*) FROM wbr_global_data),
+            'sample', (SELECT COALESCE(json_agg(s), '[]'::JSON) FROM (
+                SELECT date, daily_spend, orders FROM wbr_global_data LIMIT p_sample_rows) s)
+        ),
+        'wbr_regional_data', json_build_object(
+            'count', (SELECT COUNT(*) FROM wbr_regional_data),
+            'sample', (SELECT COALESCE(json_agg(s), '[]'::JSON) FROM (
+                SELECT date, customer_type, region, bookings FROM wbr_regional_data LIMIT p_sample_rows) s)
+        )
+    );
+$$ language 'sql' STABLE;
+
+-- Forecast write-back tables (same as migrations/008_create_forecast_tables.sql)
+CREATE TABLE IF NOT EXISTS forecast_runs (
+    run_id UUID PRIMARY KEY,
+    status VARCHAR(20) NOT NULL DEFAULT 'loading' CHECK (status IN ('loading', 'complete')),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    completed_at TIMESTAMP WITH TIME ZONE,
+    model VARCHAR(20),
+    history_start DATE,
+    history_end DATE,
+    forecast_start DATE,
+    horizon_days INTEGER,
+    params JSONB
+);
+
+-- Scenario totals with bootstrapped P10/P50/P90 orders and CAC
+CREATE TABLE IF NOT EXISTS forecast_scenarios (
+    run_id UUID NOT NULL REFERENCES forecast_runs(run_id) ON DELETE CASCADE,
+    scenario VARCHAR(100) NOT NULL,
+    horizon_days INTEGER,
+    total_spend DECIMAL(15,2),
+    pred_orders DECIMAL(15,1),
+    projected_cac DECIMAL(15,2),
+    pred_orders_p10 DECIMAL(15,1),
+    pred_orders_p50 DECIMAL(15,1),
+    pred_orders_p90 DECIMAL(15,1),
+    projected_cac_p10 DECIMAL(15,2),
+    projected_cac_p50 DECIMAL(15,2),
+    projected_cac_p90 DECIMAL(15,2),
+    PRIMARY KEY (run_id, scenario)
+);
+
+-- Daily spend plan and predicted orders per scenario
+CREATE TABLE IF NOT EXISTS forecast_daily (
+    run_id UUID NOT NULL REFERENCES forecast_runs(run_id) ON DELETE CASCADE,
+    scenario VARCHAR(100) NOT NULL,
+    date DATE NOT NULL,
+    weekday VARCHAR(10),
+    spend DECIMAL(15,2),
+    pred_orders DOUBLE PRECISION,
+    PRIMARY KEY (run_id, scenario, date)
+);
+
+-- Rolling-origin CV accuracy by horizon (prophet performance_metrics)
+CREATE TABLE IF NOT EXISTS forecast_cv_metrics (
+    run_id UUID NOT NULL REFERENCES forecast_runs(run_id) ON DELETE CASCADE,
+    horizon_days INTEGER NOT NULL,
+    mse DOUBLE PRECISION,
+    rmse DOUBLE PRECISION,
+    mae DOUBLE PRECISION,
+    mape DOUBLE PRECISION,
+    mdape DOUBLE PRECISION,
+    smape DOUBLE PRECISION,
+    coverage DOUBLE PRECISION,
+    PRIMARY KEY (run_id, horizon_days)
+);
+
+-- Latest complete run lookups
+CREATE INDEX IF NOT EXISTS idx_forecast_runs_status_created_at ON forecast_runs(status, created_at DESC);
+
+-- Add comments for documentation
+COMMENT ON TABLE forecast_runs IS 'One row per CAC forecast run; status becomes complete once all its rows are loaded';
+COMMENT ON TABLE forecast_scenarios IS 'Scenario totals per run: spend, predicted orders, projected CAC and their P10/P50/P90';
+COMMENT ON TABLE forecast_daily IS 'Daily spend and predicted orders per run and scenario';
+COMMENT ON TABLE forecast_cv_metrics IS 'Cross-validation accuracy (rmse, mape, mae, ...) per run and horizon day';
+
+-- The most recent complete run and its rows, for dashboards
+CREATE OR REPLACE VIEW latest_forecast_run AS
+SELECT * FROM forecast_runs WHERE status = 'complete' ORDER BY created_at DESC LIMIT 1;
+
+CREATE OR REPLACE VIEW latest_forecast_scenarios AS
+SELECT s.* FROM forecast_scenarios s JOIN latest_forecast_run r USING (run_id);
+
+CREATE OR REPLACE VIEW latest_forecast_daily AS
+SELECT d.* FROM forecast_daily d JOIN latest_forecast_run r USING (run_id);
+
+CREATE OR REPLACE VIEW latest_forecast_cv_metrics AS
+SELECT m.* FROM forecast_cv_metrics m JOIN latest_forecast_run r USING (run_id);
+
+-- Mark a run complete, then keep the newest p_keep complete runs (all when NULL) and
+-- drop loads abandoned for over a day; returns the number of runs removed
+CREATE OR REPLACE FUNCTION complete_forecast_run(p_run_id UUID, p_keep INTEGER DEFAULT 30)
+RETURNS INTEGER AS $$
+DECLARE
+    pruned INTEGER;
+BEGIN
+    UPDATE forecast_runs SET status = 'complete', completed_at = NOW() WHERE run_id = p_run_id;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'forecast run % does not exist', p_run_id;
+    END IF;
+
+    DELETE FROM forecast_runs
+    WHERE (status = 'complete' AND run_id NOT IN (
+              SELECT run_id FROM forecast_runs WHERE status = 'complete'
+              ORDER BY created_at DESC LIMIT p_keep))
+       OR (status = 'loading' AND created_at < NOW() - INTERVAL '1 day');
+    GET DIAGNOSTICS pruned = ROW_COUNT;
+    RETURN pruned;
+END;
+$$ language 'plpgsql';
+
 -- Grant permissions to the user
 GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA public TO eightsleep_user;
 GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA public TO eightsleep_user;
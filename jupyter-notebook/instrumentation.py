@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Pipeline Instrumentation
+Nested timing spans (wall time, rows, memory growth) around the import and
+forecast stages, a per-run JSON/CSV timing report, and optional
+cProfile/pyinstrument profiling of chosen stages
+"""
+
+import contextvars
+import cProfile
+import csv
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+from datetime import datetime, timezone
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+# Profiles of --profile stages are written here
+PROFILE_DIR = 'profiles'
+
+# Innermost open span of the current thread/task
+current_span = contextvars.ContextVar('current_span', default=None)
+
+
+def rss_bytes():
+    """Current process RSS"""
+    return psutil.Process().memory_info().rss
+
+
+def process_peak_rss_bytes():
+    """Process high-water RSS so far (not a per-stage peak: it never goes down)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Linux reports KiB
+
+
+@dataclass
+class Span:
+    """One timed stage; path joins the names of the enclosing spans with '/'"""
+    name: str
+    path: str
+    offset: float  # seconds since the run started
+    seconds: float = 0.0
+    rows: int = None
+    rss_growth_bytes: int = None  # RSS at span end minus RSS at span start
+    process_peak_rss_bytes: int = None
+    peak_traced_bytes: int = None
+    thread: str = None
+    attrs: dict = field(default_factory=dict)
+    traced_peak: int = field(default=0, repr=False)  # running max while children reset the tracemalloc peak
+    traced_concurrent: bool = field(default=False, repr=False)  # overlapped a span on another branch
+    parent: 'Span' = field(default=None, repr=False)
+
+
+class Recorder:
+    """Collects the spans of one run"""
+
+    def __init__(self):
+        self.reset()
+        self.recording = False  # spans outside a configured run are timed but not kept
+
+    def reset(self, trace_memory=False, profile=(), profiler='cprofile', profile_dir=PROFILE_DIR):
+        """Start a new run.
+
+        trace_memory adds each span's peak Python/NumPy allocation (tracemalloc,
+        noticeably slower); `profile` names the stages to run under `profiler`.
+        tracemalloc's peak is process-wide, so spans that overlap a span outside
+        their own ancestry (thread pool stages) get no traced peak; only the
+        enclosing span does. Run with one worker for per-stage peaks.
+        """
+        if profiler not in PROFILERS:
+            raise ValueError(f"profiler must be one of {PROFILERS}, got {profiler!r}")
+        self.spans = []
+        self.recording = True
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        self.trace_memory = trace_memory
+        self.profile = set(profile or ())
+        self.profiler = profiler
+        self.profile_dir = profile_dir
+        self.lock = threading.Lock()
+        self.open_spans = {}  # id -> open Span, tracked while tracing memory
+        self.warned_concurrent = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def open_traced(self, span):
+        """Track an open span; True when a span outside its ancestry is open too"""
+        ancestors, parent = set(), span.parent
+        while parent is not None:
+            ancestors.add(id(parent))
+            parent = parent.parent
+        with self.lock:
+            others = [s for key, s in self.open_spans.items() if key not in ancestors]
+            for s in others:
+                s.traced_concurrent = span.traced_concurrent = True
+            self.open_spans[id(span)] = span
+            if others and not self.warned_concurrent:
+                self.warned_concurrent = True
+                logger.warning("--trace-memory: stages ran concurrently, so they get no traced peak "
+                               "(tracemalloc's peak is process-wide); run with one worker for per-stage peaks")
+        return bool(others)
+
+    def close_traced(self, span):
+        with self.lock:
+            self.open_spans.pop(id(span), None)
+
+    def record(self, span):
+        if not self.recording:
+            return
+        with self.lock:
+            self.spans.append(span)
+
+
+recorder = Recorder()
+
+
+def configure(trace_memory=False, profile=(), profiler='cprofile', profile_dir=PROFILE_DIR):
+    """Reset the module recorder for a new run; spans are only kept from here until finish()"""
+    recorder.reset(trace_memory, profile, profiler, profile_dir)
+
+
+# ---- Profiling ----
+
+def start_profiler(span):
+    """Start the configured profiler for a --profile stage, or return None"""
+    if span.name not in recorder.profile and span.path not in recorder.profile:
+        return None
+    if recorder.profiler == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning("pyinstrument is not installed; falling back to cProfile")
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler is already active (nested --profile stages)
+        return None
+    return profiler
+
+
+def stop_profiler(profiler, span):
+    """Stop a stage's profiler, save its output and log the hottest functions"""
+    os.makedirs(recorder.profile_dir, exist_ok=True)
+    stem = os.path.join(recorder.profile_dir, f"{span.path.replace('/', '.')}-{int(span.offset * 1000)}")
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        profiler.dump_stats(stem + '.prof')
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(15)
+        logger.info(f"Profile of {span.path} ({stem}.prof):\n{out.getvalue()}")
+    else:
+        profiler.stop()
+        with open(stem + '.html', 'w') as f:
+            f.write(profiler.output_html())
+        logger.info(f"Profile of {span.path} ({stem}.html):\n{profiler.output_text()}")
+
+
+# ---- Spans ----
+
+@contextmanager
+def span(name, rows=None, **attrs):
+    """Time a stage: `with span("copy", table=t) as s: ...; s.rows = n`"""
+    parent = current_span.get()
+    s = Span(name, f"{parent.path}/{name}" if parent else name, time.perf_counter() - recorder.started,
+             rows=rows, thread=threading.current_thread().name, attrs=attrs, parent=parent)
+    tracing = recorder.trace_memory and tracemalloc.is_tracing()
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        if parent is not None:
+            parent.traced_peak = max(parent.traced_peak, peak)
+        # reset_peak() is process-wide: with another branch open it would cut that branch's peak short
+        if not recorder.open_traced(s):
+            # Bank the parent's peak so far, then measure this span from the current level
+            tracemalloc.reset_peak()
+            s.traced_peak = current
+    token = current_span.set(s)
+    profiler = start_profiler(s)
+    rss_start = rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield s
+    finally:
+        s.seconds = time.perf_counter() - start
+        if profiler is not None:
+            stop_profiler(profiler, s)
+        current_span.reset(token)
+        s.rss_growth_bytes = rss_bytes() - rss_start
+        s.process_peak_rss_bytes = process_peak_rss_bytes()
+        if tracing:
+            recorder.close_traced(s)
+            peak = max(s.traced_peak, tracemalloc.get_traced_memory()[1])
+            s.peak_traced_bytes = None if s.traced_concurrent else peak
+            if parent is not None:
+                parent.traced_peak = max(parent.traced_peak, peak)
+        recorder.record(s)
+
+
+def timed(name=None, rows=None):
+    """Decorator running a function inside a span; rows(result) -> rows processed"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__) as s:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    s.rows = rows(result)
+                return result
+        return wrapper
+    return decorate
+
+
+def in_context(func):
+    """Bind func to the caller's span, for work submitted to a thread pool"""
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+# ---- Reports ----
+
+def stage_summary(spans=None):
+    """Per span path: calls, total seconds, rows, rows/s, largest RSS growth of one call and
+    memory peaks, in first-seen order"""
+    stages = {}
+    for s in sorted(spans if spans is not None else recorder.spans, key=lambda s: s.offset):
+        stage = stages.setdefault(s.path, {'stage': s.path, 'calls': 0, 'seconds': 0.0, 'rows': None,
+                                           'rows_per_second': None, 'rss_growth_bytes': None,
+                                           'process_peak_rss_bytes': 0, 'peak_traced_bytes': None})
+        stage['calls'] += 1
+        stage['seconds'] += s.seconds
+        if s.rows is not None:
+            stage['rows'] = (stage['rows'] or 0) + s.rows
+        if s.rss_growth_bytes is not None:
+            stage['rss_growth_bytes'] = max(stage['rss_growth_bytes'] if stage['rss_growth_bytes'] is not None
+                                            else s.rss_growth_bytes, s.rss_growth_bytes)
+        stage['process_peak_rss_bytes'] = max(stage['process_peak_rss_bytes'], s.process_peak_rss_bytes or 0)
+        if s.peak_traced_bytes is not None:
+            stage['peak_traced_bytes'] = max(stage['peak_traced_bytes'] or 0, s.peak_traced_bytes)
+    for stage in stages.values():
+        stage['seconds'] = round(stage['seconds'], 6)
+        if stage['rows'] is not None and stage['seconds'] > 0:
+            stage['rows_per_second'] = round(stage['rows'] / stage['seconds'], 1)
+    return list(stages.values())
+
+
+def write_report(path):
+    """Write the run's timings: per-stage rows to .csv, or stages plus raw spans to .json"""
+    stages = stage_summary()
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(stages[0]) if stages else ['stage'])
+            writer.writeheader()
+            writer.writerows(stages)
+    else:
+        spans = [{f.name: getattr(s, f.name) for f in fields(s) if f.repr} for s in recorder.spans]
+        with open(path, 'w') as f:
+            json.dump({'started_at': recorder.started_at, 'argv': sys.argv, 'pid': os.getpid(),
+                       'stages': stages, 'spans': spans}, f, indent=2, default=str)
+    logger.info(f"Wrote timing report to {path}")
+
+
+def log_report():
+    """Log the stage table"""
+    stages = stage_summary()
+    if not stages:
+        return
+    logger.info("\nStage timings:")
+    for stage in stages:
+        rows = f"{stage['rows']:>10,} rows" if stage['rows'] is not None else ' ' * 15
+        growth = stage['rss_growth_bytes'] or 0
+        logger.info(f"  {stage['stage']:<50} {stage['calls']:>4}x {stage['seconds']:>9.3f}s {rows} "
+                    f"RSS {growth / 2**20:>+7,.0f} MB (process peak {stage['process_peak_rss_bytes'] / 2**20:,.0f} MB)")
+
+
+# ---- CLI ----
+
+def add_arguments(parser):
+    """--timings/--trace-memory/--profile/--profiler options shared by the scripts"""
+    group = parser.add_argument_group('instrumentation')
+    group.add_argument('--timings', metavar='PATH', help="write a per-stage timing report (.json or .csv)")
+    group.add_argument('--trace-memory', action='store_true',
+                       help="record each stage's peak Python/NumPy allocation with tracemalloc (slower; "
+                            "stages that run concurrently get none, so use one worker)")
+    group.add_argument('--profile', action='append', default=[], metavar='STAGE',
+                       help=f"profile this stage name or path (repeatable); output goes to {PROFILE_DIR}/")
+    group.add_argument('--profiler', choices=PROFILERS, default='cprofile')
+
+
+def configure_from_args(args):
+    configure(args.trace_memory, args.profile, args.profiler)
+
+
+def finish(args):
+    """Log the stage table, write --timings and stop keeping spans"""
+    log_report()
+    if args.timings:
+        write_report(args.timings)
+    recorder.recording = False
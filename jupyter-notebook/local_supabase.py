@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Local Supabase Stand-in
+Postgres-backed fake of the supabase-py client surface used by
+migrations/import_data.py, so imports can be run and benchmarked offline
+"""
+
+import asyncio
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+# PostgREST caps un-limited selects at this many rows (Supabase default)
+MAX_ROWS = 1000
+
+FILTER_OPERATORS = {'eq': '=', 'neq': '<>', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+
+@dataclass
+class APIResponse:
+    """Subset of postgrest.APIResponse"""
+    data: list = field(default_factory=list)
+    count: int = None
+
+
+def wire(payload):
+    """JSON round-trip, as a request/response body would take"""
+    return json.loads(json.dumps(payload, default=str))
+
+
+class QueryBuilder:
+    """supabase.table(name) request builder; executes against Postgres"""
+
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.method = None
+        self.columns = '*'
+        self.count = None
+        self.rows = None
+        self.on_conflict = None
+        self.filters = []
+        self.ordering = []
+        self.row_limit = None
+
+    # ---- Request methods ----
+
+    def select(self, columns='*', count=None):
+        self.method, self.columns, self.count = 'select', columns, count
+        return self
+
+    def insert(self, rows):
+        self.method, self.rows = 'insert', rows
+        return self
+
+    def upsert(self, rows, on_conflict=None):
+        self.method, self.rows, self.on_conflict = 'upsert', rows, on_conflict
+        return self
+
+    def delete(self):
+        self.method = 'delete'
+        return self
+
+    # ---- Modifiers ----
+
+    def filter(self, column, operator, value):
+        self.filters.append((column, FILTER_OPERATORS[operator], value))
+        return self
+
+    def eq(self, column, value):
+        return self.filter(column, 'eq', value)
+
+    def neq(self, column, value):
+        return self.filter(column, 'neq', value)
+
+    def gt(self, column, value):
+        return self.filter(column, 'gt', value)
+
+    def gte(self, column, value):
+        return self.filter(column, 'gte', value)
+
+    def lt(self, column, value):
+        return self.filter(column, 'lt', value)
+
+    def lte(self, column, value):
+        return self.filter(column, 'lte', value)
+
+    def order(self, column, desc=False):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, size):
+        self.row_limit = size
+        return self
+
+    # ---- Execution ----
+
+    def where(self):
+        """WHERE clause and params for the collected filters"""
+        if not self.filters:
+            return sql.SQL(''), []
+        clauses = [sql.SQL('{} {} %s').format(sql.Identifier(column), sql.SQL(operator))
+                   for column, operator, _ in self.filters]
+        return sql.SQL(' WHERE ') + sql.SQL(' AND ').join(clauses), [value for _, _, value in self.filters]
+
+    def execute(self):
+        return self.client.request(self)
+
+    def run(self, cursor):
+        """Execute the request on a cursor; returns an APIResponse"""
+        table = sql.Identifier(self.table)
+        where, params = self.where()
+        if self.method == 'select':
+            columns = (sql.SQL('*') if self.columns == '*' else
+                       sql.SQL(', ').join(sql.Identifier(c.strip()) for c in self.columns.split(',')))
+            query = sql.SQL('SELECT {} FROM {}').format(columns, table) + where
+            if self.ordering:
+                query += sql.SQL(' ORDER BY ') + sql.SQL(', ').join(
+                    sql.SQL('{} {}').format(sql.Identifier(c), sql.SQL('DESC' if desc else 'ASC'))
+                    for c, desc in self.ordering)
+            query += sql.SQL(' LIMIT %s')
+            cursor.execute(query, params + [min(self.row_limit or MAX_ROWS, MAX_ROWS)])
+            data = [dict(row) for row in cursor.fetchall()]
+            count = None
+            if self.count:
+                cursor.execute(sql.SQL('SELECT COUNT(*) AS n FROM {}').format(table) + where, params)
+                count = cursor.fetchone()['n']
+            return APIResponse(data, count)
+
+        if self.method == 'delete':
+            cursor.execute(sql.SQL('DELETE FROM {}').format(table) + where, params)
+            return APIResponse([], cursor.rowcount)
+
+        rows = wire(self.rows)
+        if not rows:
+            return APIResponse([])
+        columns = list(rows[0])
+        query = sql.SQL('INSERT INTO {} ({}) VALUES %s').format(
+            table, sql.SQL(', ').join(map(sql.Identifier, columns)))
+        if self.method == 'upsert':
+            keys = [c.strip() for c in self.on_conflict.split(',')]
+            updates = [c for c in columns if c not in keys]
+            query += sql.SQL(' ON CONFLICT ({}) DO UPDATE SET {}').format(
+                sql.SQL(', ').join(map(sql.Identifier, keys)),
+                sql.SQL(', ').join(sql.SQL('{0} = EXCLUDED.{0}').format(sql.Identifier(c)) for c in updates))
+        execute_values(cursor, query.as_string(cursor), [tuple(row.get(c) for c in columns) for row in rows],
+                       page_size=len(rows))
+        # Like Prefer: return=minimal
+        return APIResponse([])
+
+
+class RpcRequest:
+    """supabase.rpc(name, params) request"""
+
+    def __init__(self, client, function, params):
+        self.client = client
+        self.function = function
+        self.params = params or {}
+
+    def execute(self):
+        return self.client.request(self)
+
+    def run(self, cursor):
+        params = wire(self.params)
+        arguments = sql.SQL(', ').join(sql.SQL('{} => %s').format(sql.Identifier(name)) for name in params)
+        cursor.execute(sql.SQL('SELECT * FROM {}({})').format(sql.Identifier(self.function), arguments),
+                       list(params.values()))
+        if not cursor.description:
+            return APIResponse([])
+        rows = wire([dict(row) for row in cursor.fetchall()])
+        if [column.name for column in cursor.description] == [self.function]:
+            # Scalar functions come back as the bare value, as PostgREST returns them
+            return APIResponse(rows[0][self.function] if rows else None)
+        return APIResponse(rows)
+
+
+def run_request(conn, query):
+    """Run one request on a connection in its own transaction"""
+    with conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        response = query.run(cursor)
+    if isinstance(query, QueryBuilder) and query.method == 'select':
+        response.data = wire(response.data)
+    return response
+
+
+class LocalSupabase:
+    """Drop-in for supabase.Client backed by a Postgres database (e.g. one built from init-local-db.sql).
+
+    Each execute() runs in its own transaction, like a PostgREST request;
+    `latency` seconds are added per request to model the network round-trip.
+    """
+
+    def __init__(self, dsn, latency=0.0):
+        self.conn = psycopg2.connect(dsn)
+        self.latency = latency
+        self.requests = 0
+
+    def table(self, name):
+        return QueryBuilder(self, name)
+
+    def rpc(self, function, params=None):
+        return RpcRequest(self, function, params)
+
+    def request(self, query):
+        """Run one request in its own transaction"""
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return run_request(self.conn, query)
+
+    def close(self):
+        self.conn.close()
+
+
+class AsyncLocalSupabase(LocalSupabase):
+    """Drop-in for supabase.AsyncClient: execute() is awaitable and requests run
+    concurrently in worker threads over a pool of `max_connections` connections.
+    """
+
+    def __init__(self, dsn, latency=0.0, max_connections=4):
+        self.pool = ThreadedConnectionPool(1, max_connections, dsn)
+        # getconn() raises rather than waits when the pool is exhausted
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.latency = latency
+        self.requests = 0
+
+    async def request(self, query):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await asyncio.to_thread(self.run_pooled, query)
+
+    def run_pooled(self, query):
+        with self.slots:
+            conn = self.pool.getconn()
+            try:
+                return run_request(conn, query)
+            finally:
+                self.pool.putconn(conn)
+
+    def close(self):
+        self.pool.closeall()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Marketing-Mix Model
+Geometric-adstock + Hill-saturation response curves for the paid channels,
+fitted jointly on monthly orders. Every (decay, half-saturation) combination
+across channels is scored with batched normal-equation solves over a process pool,
+and a leave-one-out rerun of the search reports the out-of-sample error.
+"""
+
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+from instrumentation import span
+from wbr_store import load_cube
+
+logger = logging.getLogger(__name__)
+
+# Share of last month's adstock carried into this month
+DECAYS = np.linspace(0.0, 0.8, 9)
+
+# Half-saturation points as multiples of the channel's mean monthly spend
+HALF_SATURATIONS = np.linspace(0.25, 3.0, 12)
+
+HILL_SLOPE = 1.0
+
+# Ridge penalty per observation on the channel coefficients; keeps near-collinear curves solvable
+RIDGE_ALPHA = 1e-4
+
+# Combinations scored per task (each task holds a few (N, P, P) arrays)
+CHUNK_COMBOS = 50_000
+
+# Below this in-sample R^2 (or a leave-one-out R^2 <= 0) the curves are not trusted
+MIN_R2 = 0.3
+
+
+# ---- Response curves ----
+
+def geometric_adstock(spend, decays):
+    """(decays, T) carry-over of a (T,) spend series: a[t] = (1 - d) * spend[t] + d * a[t - 1].
+
+    Normalized so a constant spend has adstock equal to the spend; the series
+    starts at its first month, as if that spend had been running before.
+    """
+    spend = np.asarray(spend, dtype=float)
+    decays = np.asarray(decays, dtype=float)[:, None]
+    adstock = np.empty((len(decays), len(spend)))
+    adstock[:, 0] = spend[0]
+    for t in range(1, len(spend)):  # recurrence over months, vectorized over the decay grid
+        adstock[:, t] = (1 - decays[:, 0]) * spend[t] + decays[:, 0] * adstock[:, t - 1]
+    return adstock
+
+
+def hill(x, half, slope=HILL_SLOPE):
+    """Saturating response in [0, 1): x^k / (x^k + half^k)"""
+    x = np.maximum(x, 0.0) ** slope
+    return x / (x + half ** slope)
+
+
+def hill_derivative(x, half, slope=HILL_SLOPE):
+    x = np.maximum(x, 1e-12)
+    return slope * x ** (slope - 1) * half ** slope / (x ** slope + half ** slope) ** 2
+
+
+def channel_features(spend, decays=DECAYS, half_saturations=HALF_SATURATIONS, slope=HILL_SLOPE):
+    """(decays * halves, T) saturated adstock of one channel for every grid point, plus the absolute halves"""
+    adstock = geometric_adstock(spend, decays)                          # (D, T)
+    halves = np.asarray(half_saturations) * max(np.mean(spend), 1e-9)  # (H,)
+    features = hill(adstock[:, None, :], halves[None, :, None], slope)  # (D, H, T)
+    return features.reshape(-1, len(spend)), halves
+
+
+# ---- Grid search ----
+
+@dataclass
+class GridMoments:
+    """Sufficient statistics of every channel's grid, shared with the workers"""
+    counts: tuple       # grid points per channel
+    sums: list          # [channel] (G,) sum over months of each feature
+    cross: list         # [channel][channel] (G_i, G_j) feature dot products
+    targets: list       # [channel] (G,) feature . y
+    n: int
+    y_sum: float
+    y_sq: float
+    alpha: float
+
+
+def grid_moments(features, y, alpha=RIDGE_ALPHA):
+    return GridMoments(counts=tuple(len(f) for f in features),
+                       sums=[f.sum(axis=1) for f in features],
+                       cross=[[fi @ fj.T for fj in features] for fi in features],
+                       targets=[f @ y for f in features],
+                       n=len(y), y_sum=float(y.sum()), y_sq=float(y @ y), alpha=alpha)
+
+
+def search_grid(moments, pool=None, chunk_combos=CHUNK_COMBOS):
+    """(sse, flat combo index, [intercept, betas...]) of the best combo with non-negative betas"""
+    total = int(np.prod(moments.counts))
+    bounds = [(lo, min(lo + chunk_combos, total)) for lo in range(0, total, chunk_combos)]
+    if pool is None or len(bounds) == 1:
+        results = [score_combos(moments, lo, hi) for lo, hi in bounds]
+    else:
+        futures = [pool.submit(score_combos, moments, lo, hi) for lo, hi in bounds]
+        results = [future.result() for future in futures]
+    sse, combo, beta, _ = min((r for r in results if r[3]), key=lambda r: r[0])
+    return sse, combo, beta
+
+
+def loo_predictions(features, y, alpha=RIDGE_ALPHA, pool=None, chunk_combos=CHUNK_COMBOS):
+    """Each month predicted by a grid search run without it.
+
+    The search is part of every fold, so the error also covers picking the
+    decays and half-saturations, which the in-sample R^2 cannot.
+    """
+    pred = np.empty(len(y))
+    counts = [len(f) for f in features]
+    for t in range(len(y)):
+        keep = np.arange(len(y)) != t
+        _, combo, beta = search_grid(grid_moments([f[:, keep] for f in features], y[keep], alpha), pool, chunk_combos)
+        idx = np.unravel_index(combo, counts)
+        pred[t] = beta[0] + sum(b * f[g, t] for b, f, g in zip(beta[1:], features, idx))
+    return pred
+
+
+def score_combos(moments, start, stop):
+    """SSE and coefficients of combos start..stop of the flattened grid, in one batched solve.
+
+    Returns (best sse, combo index, [intercept, betas...], found) for the
+    best combo whose channel coefficients are all >= 0; found is False when
+    the chunk has none.
+    """
+    idx = np.unravel_index(np.arange(start, stop), moments.counts)
+    n_combos, p = stop - start, len(moments.counts) + 1
+    A = np.empty((n_combos, p, p))
+    b = np.empty((n_combos, p))
+    A[:, 0, 0] = moments.n
+    b[:, 0] = moments.y_sum
+    for i, gi in enumerate(idx):
+        A[:, 0, i + 1] = A[:, i + 1, 0] = moments.sums[i][gi]
+        b[:, i + 1] = moments.targets[i][gi]
+        for j, gj in enumerate(idx):
+            A[:, i + 1, j + 1] = moments.cross[i][j][gi, gj]
+
+    penalty = moments.alpha * moments.n * np.eye(p)
+    penalty[0, 0] = 0.0
+    beta = np.linalg.solve(A + penalty, b[:, :, None])[:, :, 0]
+    # ||y - X beta||^2 from the moments, without forming X
+    sse = moments.y_sq - 2 * np.einsum('np,np->n', beta, b) + np.einsum('np,npq,nq->n', beta, A, beta)
+
+    valid = (beta[:, 1:] >= -1e-9).all(axis=1)
+    best = int(np.argmin(np.where(valid, sse, np.inf)))
+    return float(sse[best]), start + best, beta[best], bool(valid.any())
+
+
+@dataclass
+class MarketingMix:
+    """Fitted response curves: orders = intercept + sum_c beta_c * hill(adstock_c(spend_c))"""
+    channels: list
+    decay: np.ndarray
+    half_saturation: np.ndarray  # in spend units
+    slope: float
+    intercept: float
+    beta: np.ndarray
+    mean_spend: np.ndarray
+    sse: float
+    r2: float
+    combos: int
+    seconds: float
+    loo_r2: float = np.nan    # 1 - PRESS / SS_tot of the leave-one-out predictions
+    loo_rmse: float = np.nan
+    grid_edges: list = field(default_factory=list)  # chosen parameters on an open edge of the grid
+
+    def warnings(self, min_r2=MIN_R2):
+        """Reasons not to trust the fitted curves (empty when the fit looks usable)"""
+        reasons = []
+        if not self.r2 >= min_r2:
+            reasons.append(f"in-sample R^2 {self.r2:.3f} is below {min_r2}")
+        if not np.isnan(self.loo_r2) and self.loo_r2 <= 0:
+            reasons.append(f"leave-one-out R^2 {self.loo_r2:.3f}: no better than predicting the mean")
+        reasons.extend(f"{edge}, so the best value may lie outside the grid" for edge in self.grid_edges)
+        return reasons
+
+    def parameters(self):
+        return pd.DataFrame({"channel": self.channels, "decay": self.decay, "half_saturation": self.half_saturation,
+                             "beta": self.beta, "mean_spend": self.mean_spend})
+
+    def response(self, channel, spend):
+        """Steady-state monthly orders from `spend` per month on one channel"""
+        i = self.channels.index(channel)
+        spend = np.asarray(spend, dtype=float)
+        if self.beta[i] == 0:  # channel dropped from the model
+            return np.zeros_like(spend)
+        return self.beta[i] * hill(spend, self.half_saturation[i], self.slope)
+
+    def marginal_cac(self, channel, spend):
+        """Spend per extra order at a steady monthly `spend` (inf where the curve is flat)"""
+        i = self.channels.index(channel)
+        marginal = self.beta[i] * hill_derivative(np.asarray(spend, dtype=float), self.half_saturation[i], self.slope)
+        with np.errstate(divide="ignore"):
+            return np.where(marginal > 0, 1.0 / marginal, np.inf)
+
+    def curves(self, points=50, max_ratio=3.0):
+        """Long channel/spend/orders/average_cac/marginal_cac table from 0 to max_ratio x mean spend"""
+        frames = []
+        for i, channel in enumerate(self.channels):
+            spend = np.linspace(0, max_ratio * self.mean_spend[i], points + 1)[1:]
+            orders = self.response(channel, spend)
+            with np.errstate(divide="ignore"):
+                average = np.where(orders > 0, spend / orders, np.inf)
+            frames.append(pd.DataFrame({"channel": channel, "spend": spend, "orders": orders,
+                                        "average_cac": average, "marginal_cac": self.marginal_cac(channel, spend)}))
+        return pd.concat(frames, ignore_index=True)
+
+
+def fit_mmm(spend, orders, decays=DECAYS, half_saturations=HALF_SATURATIONS, slope=HILL_SLOPE,
+            alpha=RIDGE_ALPHA, workers=None, chunk_combos=CHUNK_COMBOS, loo=True):
+    """Grid-search decay and half-saturation per channel for a months x channels spend frame.
+
+    Every combination of the channels' grid points is scored, (len(decays) *
+    len(half_saturations) + 1) ** channels fits in total, split into chunks of
+    batched solves across `workers` processes (1 = in-process). The extra grid
+    point per channel is an all-zero curve, which the ridge penalty turns into
+    beta = 0, so channels without a positive response drop out of the model.
+    With `loo`, the search is rerun once per left-out month for loo_r2/loo_rmse.
+    """
+    if alpha <= 0:
+        raise ValueError("alpha must be > 0 (the channel-off grid points need the ridge penalty)")
+    spend = spend.fillna(0.0)
+    y = np.asarray(orders, dtype=float)
+    channels = list(spend.columns)
+    start = time.perf_counter()
+    features, halves = zip(*(channel_features(spend[c].to_numpy(dtype=float), decays, half_saturations, slope)
+                             for c in channels))
+    features = [np.vstack([f, np.zeros((1, len(y)))]) for f in features]  # last point: channel off
+    moments = grid_moments(features, y, alpha)
+    total = int(np.prod(moments.counts))
+
+    in_process = workers == 1 or total <= chunk_combos
+    with nullcontext() if in_process else ProcessPoolExecutor(max_workers=workers) as pool:
+        with span("grid_search", rows=total, channels=len(channels)):
+            sse, combo, beta = search_grid(moments, pool, chunk_combos)
+        seconds = time.perf_counter() - start
+        if loo:
+            with span("loo", rows=total * len(y), folds=len(y)):
+                loo_pred = loo_predictions(features, y, alpha, pool, chunk_combos)
+    best = np.asarray(np.unravel_index(combo, moments.counts))
+    off = best == len(decays) * len(half_saturations)
+    decay_idx, half_idx = np.divmod(np.where(off, 0, best), len(half_saturations))
+    ss_tot = float(((y - y.mean()) ** 2).sum())
+    if off.any():
+        logger.info(f"No positive response for {[c for c, o in zip(channels, off) if o]}")
+    # Decay 0 is a real floor (no carry-over); the other grid ends are arbitrary cut-offs
+    edges = []
+    for channel, o, d, h in zip(channels, off, decay_idx, half_idx):
+        if o:
+            continue
+        if d == len(decays) - 1:
+            edges.append(f"{channel} decay {decays[d]:g} is the grid maximum")
+        if h in (0, len(half_saturations) - 1):
+            edges.append(f"{channel} half-saturation {half_saturations[h]:g}x mean spend is the grid "
+                         f"{'minimum' if h == 0 else 'maximum'}")
+    mix = MarketingMix(channels, np.where(off, np.nan, np.asarray(decays)[decay_idx]),
+                       np.array([np.nan if o else halves[i][h] for i, (h, o) in enumerate(zip(half_idx, off))]),
+                       slope, float(beta[0]), np.where(off, 0.0, beta[1:]), spend.mean().to_numpy(), sse,
+                       1 - sse / ss_tot if ss_tot > 0 else np.nan, total, seconds, grid_edges=edges)
+    if loo:
+        press = float(((y - loo_pred) ** 2).sum())
+        mix.loo_r2 = 1 - press / ss_tot if ss_tot > 0 else np.nan
+        mix.loo_rmse = float(np.sqrt(press / len(y)))
+    logger.info(f"Scored {total:,} combinations over {len(channels)} channels in {seconds:.2f}s "
+                f"({total / seconds:,.0f}/s), R^2 {mix.r2:.3f}"
+                + (f", leave-one-out R^2 {mix.loo_r2:.3f} ({len(y)} more searches in "
+                   f"{time.perf_counter() - start - seconds:.2f}s)" if loo else ""))
+    for reason in mix.warnings():
+        logger.warning(f"MMM fit not reliable: {reason}")
+    return mix
+
+
+# ---- Data ----
+
+def load_channel_data(data_dir=".", target="last_click_orders"):
+    """(months x paid channels spend, total monthly `target` across all channels)"""
+    cube = load_cube("channel_performance", data_dir)
+    spend = cube.to_pandas("spend")
+    paid = [channel for channel in spend.columns if spend[channel].fillna(0).gt(0).any()]
+    orders = cube.sum("channel").to_pandas(target)[target].fillna(0.0)
+    return spend[paid], orders
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Adstock/saturation marketing-mix model of the paid channels")
+    parser.add_argument('--data-dir', default=".", help="folder holding channel_performance.csv")
+    parser.add_argument('--workers', type=int, help="process pool size (default: one per CPU)")
+    parser.add_argument('--points', type=int, default=50, help="spend levels per marginal CAC curve")
+    parser.add_argument('--output', default="mmm_curves.csv")
+    parser.add_argument('--no-loo', action='store_true', help="skip the leave-one-out error (one search per month)")
+    parser.add_argument('--force', action='store_true', help="write the curves even when the fit is not reliable")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    instrumentation.configure_from_args(args)
+    spend, orders = load_channel_data(args.data_dir)
+    mix = fit_mmm(spend, orders, workers=args.workers, loo=not args.no_loo)
+
+    loo = "" if args.no_loo else f", leave-one-out R^2 {mix.loo_r2:.3f}, RMSE {mix.loo_rmse:,.1f} orders/month"
+    print(f"\n📈 MMM over {len(orders)} months, {mix.combos:,} grid combinations in {mix.seconds:.2f}s "
+          f"(R^2 {mix.r2:.3f}{loo})")
+    print(mix.parameters().to_string(index=False))
+    at_mean = {channel: float(mix.marginal_cac(channel, mix.mean_spend[i])) for i, channel in enumerate(mix.channels)}
+    print("Marginal CAC at mean spend: " + ", ".join(f"{c} {v:,.0f}" for c, v in at_mean.items()))
+    if mix.warnings() and not args.force:
+        print(f"⚠️  Not writing {args.output}: the fit is not reliable (see the warnings above; --force writes it anyway)")
+    else:
+        curves = mix.curves(args.points)
+        curves.to_csv(args.output, index=False)
+        print(f"✅ Wrote {len(curves)} curve points to {os.path.abspath(args.output)}")
+    instrumentation.finish(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Fitted Model Store
+Caches fitted CAC forecast models on disk, keyed on the training data and
+hyperparameters, and warm-starts Prophet refits from the previous fit
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+import joblib
+import pandas as pd
+
+import forecasting as fc
+from instrumentation import span
+
+logger = logging.getLogger(__name__)
+
+# Fitted models live here, relative to the working directory
+MODEL_STORE_DIR = ".model_store"
+
+# Fits kept per model family + params; older ones are deleted when a new fit is stored
+KEEP_MODELS = 5
+
+
+def frame_sha256(df):
+    """Hex SHA-256 of a DataFrame's values (index ignored)"""
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+
+def params_key(kind, params):
+    """Hash of a model family and its hyperparameters (plus library version)"""
+    if kind == "prophet":
+        import prophet
+        version = prophet.__version__
+    else:
+        import sklearn
+        version = sklearn.__version__
+    payload = json.dumps({"kind": kind, "params": params, "regressors": fc.REGRESSORS, "version": version},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def model_paths(store_dir, kind, params_hash, data_hash):
+    """(model file, 'latest fit' pointer) for one model family + params"""
+    ext = ".json" if kind == "prophet" else ".joblib"
+    model_path = os.path.join(store_dir, f"{kind}-{params_hash}-{data_hash[:16]}{ext}")
+    latest_path = os.path.join(store_dir, f"{kind}-{params_hash}.latest.json")
+    return model_path, latest_path
+
+
+def write_atomic(path, write):
+    """Run write(tmp_path) then move the result into place"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write(path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def read_latest(latest_path):
+    """Pointer to the most recent fit, or None"""
+    try:
+        with open(latest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def record_latest(latest_path, model_path, history, data_hash, seconds, warm):
+    """Point the params' 'latest fit' at model_path"""
+    meta = {"model": os.path.basename(model_path), "sha256": data_hash, "rows": len(history),
+            "last_ds": str(history["ds"].max()), "fit_seconds": round(seconds, 3), "warm_start": warm}
+
+    def write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(meta, f, indent=2)
+    write_atomic(latest_path, write)
+
+
+def prune_models(store_dir, kind, params_hash, keep=KEEP_MODELS):
+    """Delete all but the `keep` most recently used fits of one model family + params"""
+    prefix = f"{kind}-{params_hash}-"
+    paths = [os.path.join(store_dir, name) for name in os.listdir(store_dir)
+             if name.startswith(prefix) and not name.endswith(".tmp")]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[max(keep, 1):]:
+        os.remove(path)
+        logger.info(f"Pruned old model {path}")
+
+
+def stan_init(m):
+    """Fitted parameters of a Prophet model, usable as fit(init=...) for a warm start"""
+    res = {}
+    for pname in ["k", "m", "sigma_obs"]:
+        res[pname] = m.params[pname][0][0]
+    for pname in ["delta", "beta"]:
+        res[pname] = m.params[pname][0]
+    return res
+
+
+def load_prophet(path):
+    """Deserialize a Prophet model written by save_prophet"""
+    from prophet.serialize import model_from_json
+    with open(path) as f:
+        return model_from_json(f.read())
+
+
+def save_prophet(path, m):
+    """Serialize a fitted Prophet model with Prophet's JSON serializer"""
+    from prophet.serialize import model_to_json
+
+    def write(tmp):
+        with open(tmp, "w") as f:
+            f.write(model_to_json(m))
+    write_atomic(path, write)
+
+
+def load_or_fit_prophet(history, params=None, store_dir=MODEL_STORE_DIR, warm_start=True, keep=KEEP_MODELS):
+    """Fitted Prophet model for `history`, from the store when the data and params are unchanged.
+
+    Otherwise the model is refit, warm-started from the latest stored fit with
+    the same params (e.g. after a few days were appended), and stored; only the
+    `keep` most recently used fits with these params are kept.
+    """
+    params = params or fc.PROPHET_PARAMS
+    train = history.rename(columns={"orders": "y"})[["ds", "y", *fc.REGRESSORS]].reset_index(drop=True)
+    data_hash = frame_sha256(train)
+    params_hash = params_key("prophet", params)
+    model_path, latest_path = model_paths(store_dir, "prophet", params_hash, data_hash)
+
+    start = time.perf_counter()
+    if os.path.exists(model_path):
+        with span("load_model", rows=len(train), model="prophet"):
+            m = load_prophet(model_path)
+        os.utime(model_path)  # most recently used, for prune_models
+        logger.info(f"Loaded cached Prophet model {model_path} in {time.perf_counter() - start:.3f}s")
+        return m
+
+    init = None
+    latest = read_latest(latest_path) if warm_start else None
+    if latest and os.path.exists(os.path.join(store_dir, latest["model"])):
+        init = stan_init(load_prophet(os.path.join(store_dir, latest["model"])))
+
+    m = fc.make_prophet(params)
+    try:
+        with span("fit", rows=len(train), model="prophet", warm_start=init is not None):
+            m.fit(train, init=init) if init else m.fit(train)
+    except Exception:
+        if init is None:
+            raise
+        # Shapes can change (e.g. a new seasonality); fall back to a cold start
+        logger.warning("Warm start failed; refitting from scratch")
+        m = fc.make_prophet(params).fit(train)
+        init = None
+    seconds = time.perf_counter() - start
+
+    save_prophet(model_path, m)
+    record_latest(latest_path, model_path, train, data_hash, seconds, init is not None)
+    prune_models(store_dir, "prophet", params_hash, keep)
+    logger.info(f"Fitted Prophet on {len(train)} rows in {seconds:.2f}s"
+                f"{' (warm start from ' + latest['last_ds'] + ')' if init else ''}; saved to {model_path}")
+    return m
+
+
+def load_or_fit_ridge(history, alpha=1.0, store_dir=MODEL_STORE_DIR, keep=KEEP_MODELS):
+    """Fitted fallback Ridge model for `history`, cached with joblib (`keep` fits per alpha)"""
+    train = history[["ds", "spend", "orders"]].reset_index(drop=True)
+    data_hash = frame_sha256(train)
+    params_hash = params_key("ridge", {"alpha": alpha})
+    model_path, latest_path = model_paths(store_dir, "ridge", params_hash, data_hash)
+    if os.path.exists(model_path):
+        os.utime(model_path)
+        return joblib.load(model_path)
+
+    start = time.perf_counter()
+    model = fc.fit_ridge(train, alpha)
+    write_atomic(model_path, lambda tmp: joblib.dump(model, tmp))
+    record_latest(latest_path, model_path, train, data_hash, time.perf_counter() - start, False)
+    prune_models(store_dir, "ridge", params_hash, keep)
+    return model
+
+
+def clear_store(store_dir=MODEL_STORE_DIR):
+    """Delete every stored model"""
+    if not os.path.isdir(store_dir):
+        return
+    for name in os.listdir(store_dir):
+        os.remove(os.path.join(store_dir, name))
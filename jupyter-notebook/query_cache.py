@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - DuckDB Query Result Cache
+Serves repeated analytics queries from an in-memory LRU or an on-disk Parquet
+tier, keyed on the normalized SQL and the fingerprints of the tables it reads
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import pandas as pd
+
+import analytics_db
+from cleaning import SCHEMAS
+from data_access import source_path
+
+logger = logging.getLogger(__name__)
+
+# On-disk tier, relative to the working directory
+QUERY_CACHE_DIR = '.query_cache'
+
+# Results kept in memory
+DEFAULT_MEMORY_ITEMS = 64
+
+# Least recently used Parquet files are deleted beyond this many bytes
+DEFAULT_MAX_DISK_BYTES = 256 * 1024 * 1024
+
+# Quoted literals/identifiers are kept verbatim when normalizing SQL
+QUOTED_PATTERN = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+# -- line and /* block */ comments, matched together with quoted text so markers inside quotes are kept
+COMMENT_PATTERN = re.compile(QUOTED_PATTERN.pattern + r"|--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+
+def normalize_sql(sql):
+    """Lower-case, comment-free, single-spaced SQL (quoted text untouched) so reformatted queries share a key"""
+    sql = COMMENT_PATTERN.sub(lambda m: m.group(1) or ' ', sql)
+    parts = QUOTED_PATTERN.split(sql.strip().rstrip(';'))
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r'\s+', ' ', parts[i]).lower()
+    return ''.join(parts).strip()
+
+
+def referenced_tables(sql):
+    """Source tables named in a query"""
+    return [table_name for table_name in SCHEMAS if re.search(rf'\b{table_name}\b', sql, re.IGNORECASE)]
+
+
+@dataclass
+class CacheStats:
+    """Hit/miss counters of one QueryCache"""
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / total if total else 0.0
+
+
+class CachedResult:
+    """Stand-in for a DuckDB result, so analytics_db query functions run unchanged through the cache"""
+
+    def __init__(self, df):
+        self.df = df
+
+    def fetchdf(self):
+        return self.df
+
+
+class QueryCache:
+    """Cached `con.execute(sql, params).fetchdf()` for the analytics database.
+
+    A key covers the normalized SQL, the parameters and, for every source
+    table the query names, the CSV's mtime/size and the table's last build,
+    so editing a CSV or rebuilding a table misses the cache automatically.
+    With auto_refresh, tables whose CSV changed are rebuilt before each lookup.
+    """
+
+    def __init__(self, con=None, data_dir='.', cache_dir=QUERY_CACHE_DIR, memory_items=DEFAULT_MEMORY_ITEMS,
+                 max_disk_bytes=DEFAULT_MAX_DISK_BYTES, auto_refresh=True):
+        self.con = con if con is not None else analytics_db.connect(data_dir=data_dir)
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.auto_refresh = auto_refresh
+        self.memory = OrderedDict()
+        self.stats = CacheStats()
+
+    def fingerprint(self, table_name):
+        """What the cached result of a query on table_name depends on"""
+        path = source_path(table_name, self.data_dir)
+        stat = os.stat(path) if os.path.exists(path) else None
+        try:
+            built = self.con.execute(f"SELECT sha256, built_at FROM {analytics_db.SOURCES_TABLE} "
+                                     f"WHERE table_name = ?", [table_name]).fetchone()
+        except Exception:  # no build record (e.g. a plain in-memory connection)
+            built = None
+        return [stat.st_mtime_ns, stat.st_size] if stat else None, built
+
+    def key(self, sql, params=None):
+        """Cache key of a query"""
+        payload = json.dumps({'sql': normalize_sql(sql), 'params': params,
+                              'sources': {table_name: self.fingerprint(table_name)
+                                          for table_name in referenced_tables(sql)}},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def query(self, sql, params=None):
+        """Result of a query as a DataFrame, from memory, disk or DuckDB"""
+        if self.auto_refresh:
+            analytics_db.refresh(self.con, self.data_dir)
+        key = self.key(sql, params)
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.stats.memory_hits += 1
+            return self.memory[key].copy()
+
+        path = os.path.join(self.cache_dir, key + '.parquet')
+        if os.path.exists(path):
+            df = pd.read_parquet(path)
+            os.utime(path)  # mtime doubles as last use for eviction
+            self.stats.disk_hits += 1
+        else:
+            df = self.con.execute(sql, params).fetchdf()
+            self.stats.misses += 1
+            self.write_disk(path, df)
+
+        self.memory[key] = df
+        if len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+        return df.copy()
+
+    def execute(self, sql, params=None):
+        """DuckDB-style entry point: cache.execute(sql, params).fetchdf()"""
+        return CachedResult(self.query(sql, params))
+
+    def write_disk(self, path, df):
+        """Store a result in the Parquet tier, then evict down to max_disk_bytes"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        try:
+            df.to_parquet(path + '.tmp')
+        except Exception as e:  # e.g. object columns Arrow can't type; keep it in memory only
+            logger.debug(f"Not caching result on disk: {e}")
+            return
+        os.replace(path + '.tmp', path)
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used Parquet files until the tier fits in max_disk_bytes"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.parquet'):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total -= size
+
+    def clear(self):
+        """Drop both tiers"""
+        self.memory.clear()
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def __repr__(self):
+        return (f"QueryCache(memory={len(self.memory)}, memory_hits={self.stats.memory_hits}, "
+                f"disk_hits={self.stats.disk_hits}, misses={self.stats.misses}, "
+                f"hit_rate={self.stats.hit_rate:.0%})")
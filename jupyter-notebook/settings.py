@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Settings
+Backend connections and data paths shared by the CLI and import scripts,
+read from eightsleep.toml with EIGHTSLEEP_* / SUPABASE_* environment overrides
+"""
+
+import copy
+import os
+import tomllib
+
+CONFIG_FILE = 'eightsleep.toml'
+
+BACKENDS = ('supabase', 'local-postgres', 'duckdb')
+
+DEFAULTS = {
+    'backend': 'local-postgres',
+    'paths': {
+        'data_dir': '.',  # folder holding the source CSVs
+    },
+    'local-postgres': {
+        'host': 'localhost',
+        'port': 5433,
+        'database': 'eightsleep_local',
+        'user': 'eightsleep_user',
+        'password': 'eightsleep_password',
+    },
+    'supabase': {
+        'url': 'https://lmokzxpktcchregvavna.supabase.co',
+        'key': '',
+    },
+    'duckdb': {
+        'path': 'eightsleep.duckdb',
+    },
+}
+
+# Environment variable -> (section, key); section None means a top-level key
+ENVIRONMENT = {
+    'EIGHTSLEEP_BACKEND': (None, 'backend'),
+    'EIGHTSLEEP_DATA_DIR': ('paths', 'data_dir'),
+    'EIGHTSLEEP_PG_HOST': ('local-postgres', 'host'),
+    'EIGHTSLEEP_PG_PORT': ('local-postgres', 'port'),
+    'EIGHTSLEEP_PG_DATABASE': ('local-postgres', 'database'),
+    'EIGHTSLEEP_PG_USER': ('local-postgres', 'user'),
+    'EIGHTSLEEP_PG_PASSWORD': ('local-postgres', 'password'),
+    'SUPABASE_URL': ('supabase', 'url'),
+    'SUPABASE_KEY': ('supabase', 'key'),
+    'EIGHTSLEEP_DUCKDB_PATH': ('duckdb', 'path'),
+}
+
+
+def load_settings(path=None):
+    """DEFAULTS, overlaid with the config file and then the environment.
+
+    The file is `path`, else $EIGHTSLEEP_CONFIG, else ./eightsleep.toml if it
+    exists. Relative paths in the file are resolved against the file's folder.
+    """
+    settings = copy.deepcopy(DEFAULTS)
+    path = path or os.environ.get('EIGHTSLEEP_CONFIG') or (CONFIG_FILE if os.path.exists(CONFIG_FILE) else None)
+    if path:
+        with open(path, 'rb') as f:
+            overrides = tomllib.load(f)
+        base = os.path.dirname(os.path.abspath(path))
+        for key, value in overrides.items():
+            if isinstance(value, dict):
+                settings.setdefault(key, {}).update(value)
+            else:
+                settings[key] = value
+        for section, key in (('paths', 'data_dir'), ('duckdb', 'path')):
+            if key in overrides.get(section, {}):
+                settings[section][key] = os.path.join(base, os.path.expanduser(settings[section][key]))
+
+    for name, (section, key) in ENVIRONMENT.items():
+        if name in os.environ:
+            (settings if section is None else settings[section])[key] = os.environ[name]
+    if settings['backend'] not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}, got {settings['backend']!r}")
+    return settings
+
+
+def postgres_dsn(settings):
+    """libpq connection string of the local-postgres backend"""
+    pg = settings['local-postgres']
+    return (f"host={pg['host']} port={pg['port']} dbname={pg['database']} "
+            f"user={pg['user']} password={pg['password']}")
+
+
+def postgres_url(settings):
+    """postgresql:// URL of the local-postgres backend (SQLAlchemy, bench_import --dsn)"""
+    pg = settings['local-postgres']
+    return f"postgresql://{pg['user']}:{pg['password']}@{pg['host']}:{pg['port']}/{pg['database']}"
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Import Verification
+Row counts and sample rows of the imported tables from Supabase, local
+PostgreSQL or the DuckDB database. Only the chosen backend's driver is
+imported, so `cli.py verify` starts without pandas.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Columns shown per table, as in import_summary() (007_create_import_summary_function.sql).
+# Same tables as cleaning.SCHEMAS, which is not imported here because it pulls in pandas.
+SAMPLE_COLUMNS = {
+    'channel_performance': ('channel', 'spend', 'visitors'),
+    'wbr_global_data': ('date', 'daily_spend', 'orders'),
+    'wbr_regional_data': ('date', 'customer_type', 'region', 'bookings'),
+}
+
+SAMPLE_ROWS = 3
+
+
+def log_import_summary(summary):
+    """Log the row counts and sample rows returned by import_summary()"""
+    logger.info(f"Channel Performance: {summary['channel_performance']['count']} rows")
+    logger.info(f"WBR Global Data: {summary['wbr_global_data']['count']} rows")
+    logger.info(f"WBR Regional Data: {summary['wbr_regional_data']['count']} rows")
+
+    logger.info("\nSample Channel Performance:")
+    for row in summary['channel_performance']['sample']:
+        logger.info(f"  {row['channel']}: ${row['spend']} - {row['visitors']} visitors")
+
+    logger.info("\nSample WBR Global Data:")
+    for row in summary['wbr_global_data']['sample']:
+        logger.info(f"  {row['date']}: ${row['daily_spend']} - {row['orders']} orders")
+
+    logger.info("\nSample WBR Regional Data:")
+    for row in summary['wbr_regional_data']['sample']:
+        logger.info(f"  {row['date']} - {row['customer_type']} - {row['region']}: ${row['bookings']}")
+
+
+def postgres_summary(dsn, sample_rows=SAMPLE_ROWS):
+    """import_summary() of a PostgreSQL database, over one psycopg2 connection"""
+    import psycopg2
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT import_summary(%s)", [sample_rows])
+        summary = cursor.fetchone()[0]
+    conn.close()
+    return summary
+
+
+def supabase_summary(url, key, sample_rows=SAMPLE_ROWS):
+    """import_summary() of the Supabase project, in one RPC call"""
+    from supabase import create_client
+    return create_client(url, key).rpc('import_summary', {'p_sample_rows': sample_rows}).execute().data
+
+
+def duckdb_summary(db_path, sample_rows=SAMPLE_ROWS):
+    """import_summary()-shaped counts and samples of the analytics DuckDB database"""
+    import duckdb
+    summary = {}
+    with duckdb.connect(db_path, read_only=True) as con:
+        for table_name, columns in SAMPLE_COLUMNS.items():
+            count = con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+            # LIMIT inlined: binding a parameter makes duckdb import pandas
+            rows = con.execute(f"SELECT {', '.join(columns)} FROM {table_name} LIMIT {int(sample_rows)}").fetchall()
+            summary[table_name] = {'count': count, 'sample': [dict(zip(columns, row)) for row in rows]}
+    return summary
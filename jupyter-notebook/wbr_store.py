@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Compact WBR Store
+Dense date-indexed NumPy cubes of the WBR tables: one contiguous float64 block
+per measure, indexed by day (or month) offset and dictionary-encoded dimension
+codes, with vectorized slicing, rolling windows and weekday group-bys
+"""
+
+import logging
+import warnings
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from cleaning import CURRENCY, INTEGER, SCHEMAS
+from data_access import load_table
+
+try:
+    import pyarrow as pa
+except ImportError:  # to_arrow() needs pyarrow
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# 1970-01-01 (day offset 0) was a Thursday
+EPOCH_WEEKDAY = 3
+
+
+@dataclass(frozen=True)
+class CubeSpec:
+    """Dimensions and period unit ('D' days, 'M' months) of one table's cube"""
+    dims: tuple = ()
+    unit: str = 'D'
+
+
+CUBES = {
+    'wbr_global_data': CubeSpec(),
+    'wbr_regional_data': CubeSpec(dims=('region', 'customer_type')),
+    'channel_performance': CubeSpec(dims=('channel',), unit='M'),
+}
+
+
+def numeric_columns(table_name):
+    """Currency/integer columns of a table, in schema order"""
+    return tuple(column.name for column in SCHEMAS[table_name].columns if column.kind in (CURRENCY, INTEGER))
+
+
+class WbrCube:
+    """values[measure, period, *dims] for one WBR table.
+
+    Period i is `start + i` in `unit`; position j along a dimension is the
+    label categories[d][j], so labels are stored once and cells are addressed by
+    integer code. Cells without a source row are NaN (`present` is False).
+    Date slices and single-label selections are views, not copies.
+    """
+
+    def __init__(self, values, start, measures, dims=(), categories=(), unit='D', present=None):
+        self.values = values
+        self.start = np.datetime64(start, unit)
+        self.measures = tuple(measures)
+        self.dims = tuple(dims)
+        self.categories = tuple(pd.Index(c) for c in categories)
+        self.unit = unit
+        self.present = present if present is not None else ~np.isnan(values).all(axis=0)
+
+    @classmethod
+    def from_frame(cls, df, date_column, dims=(), measures=None, unit='D'):
+        """Build a cube from a long DataFrame; rows sharing a period and labels are summed"""
+        measures = tuple(measures or [c for c in df.columns
+                                      if c != date_column and c not in dims and pd.api.types.is_numeric_dtype(df[c])])
+        dates = pd.to_datetime(df[date_column]).to_numpy().astype(f'datetime64[{unit}]')
+        codes, categories = [], []
+        for dim in dims:
+            dim_codes, labels = pd.factorize(df[dim], sort=True)
+            codes.append(dim_codes)
+            categories.append(labels)
+        keep = ~np.isnat(dates)
+        for dim_codes in codes:
+            keep &= dim_codes >= 0
+        if not keep.all():
+            logger.info(f"Skipping {int((~keep).sum())} rows without a date or dimension label")
+        if not keep.any():
+            raise ValueError("no rows with a date and every dimension label")
+
+        start = dates[keep].min()
+        offsets = (dates[keep] - start).astype(np.int64)
+        shape = (int(offsets.max()) + 1, *(len(labels) for labels in categories))
+        cells = np.ravel_multi_index((offsets, *(dim_codes[keep] for dim_codes in codes)), shape)
+        size = int(np.prod(shape))
+
+        # One bincount per measure sums duplicates and scatters into the dense layout
+        present = np.bincount(cells, minlength=size) > 0
+        values = np.empty((len(measures), size))
+        for k, name in enumerate(measures):
+            column = df[name].to_numpy(dtype=float, na_value=np.nan)[keep]
+            observed = ~np.isnan(column)
+            totals = np.bincount(cells[observed], weights=column[observed], minlength=size)
+            counts = np.bincount(cells[observed], minlength=size)
+            values[k] = np.where(counts > 0, totals, np.nan)
+        return cls(values.reshape(len(measures), *shape), start, measures, dims, categories, unit,
+                   present.reshape(shape))
+
+    # ---- Layout ----
+
+    @property
+    def periods(self):
+        return self.values.shape[1]
+
+    @property
+    def shape(self):
+        """(periods, *dimension sizes) of each measure block"""
+        return self.values.shape[1:]
+
+    @property
+    def dates(self):
+        """datetime64[unit] label of every period"""
+        return self.start + np.arange(self.periods)
+
+    @property
+    def index(self):
+        return pd.DatetimeIndex(self.dates.astype('datetime64[ns]'), name='date')
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.present.nbytes
+
+    def measure(self, name):
+        """(periods, *dims) block of one measure (a view)"""
+        return self.values[self.measures.index(name)]
+
+    def offset(self, date):
+        """Period offset of a date (may fall outside the cube)"""
+        return int((np.datetime64(pd.Timestamp(date), self.unit) - self.start).astype(np.int64))
+
+    def code(self, dim, label):
+        """Dictionary code of a dimension label"""
+        return self.categories[self.dims.index(dim)].get_loc(label)
+
+    def weekday(self):
+        """Day of week code (0 = Monday) of every period"""
+        if self.unit != 'D':
+            raise ValueError("weekdays need a daily cube")
+        return (self.dates.astype(np.int64) + EPOCH_WEEKDAY) % 7
+
+    # ---- Selection ----
+
+    def slice(self, start=None, end=None, measures=None, **labels):
+        """Sub-cube for an inclusive date range, some measures and dimension labels.
+
+        A single label drops its dimension (cube.slice(region="US")); a list keeps it.
+        """
+        first = 0 if start is None else max(self.offset(start), 0)
+        last = self.periods if end is None else min(self.offset(end) + 1, self.periods)
+        last = max(last, first)
+        unknown = set(labels) - set(self.dims)
+        if unknown:
+            raise ValueError(f"unknown dimensions {sorted(unknown)}; cube has {self.dims}")
+
+        index, dims, categories = [slice(first, last)], [], []
+        for dim, labels_of_dim in zip(self.dims, self.categories):
+            if dim not in labels:
+                index.append(slice(None))
+                dims.append(dim)
+                categories.append(labels_of_dim)
+            elif np.ndim(labels[dim]) == 0:
+                index.append(labels_of_dim.get_loc(labels[dim]))
+            else:
+                positions = labels_of_dim.get_indexer(labels[dim])
+                if (positions < 0).any():
+                    raise KeyError(f"unknown {dim} labels in {labels[dim]}")
+                index.append(positions)
+                dims.append(dim)
+                categories.append(labels_of_dim[positions])
+        # Fancy indexes only combine cleanly one axis at a time
+        values, present = self.values, self.present
+        for axis, position in enumerate(index):
+            if isinstance(position, np.ndarray):
+                values = np.take(values, position, axis=axis + 1)
+                present = np.take(present, position, axis=axis)
+                index[axis] = slice(None)
+        values = values[(slice(None), *index)]
+        present = present[tuple(index)]
+
+        if measures is not None:
+            names = [measures] if isinstance(measures, str) else list(measures)
+            values = values[[self.measures.index(name) for name in names]]
+        else:
+            names = self.measures
+        return WbrCube(values, self.start + first, names, dims, categories, self.unit, present)
+
+    # ---- Aggregation ----
+
+    def sum(self, *dims):
+        """Cube summed over the named dimensions (all of them by default); all-missing cells stay NaN"""
+        dims = dims or self.dims
+        axes = tuple(self.dims.index(dim) + 1 for dim in dims)
+        kept = [(dim, labels) for dim, labels in zip(self.dims, self.categories) if dim not in dims]
+        values = np.nansum(self.values, axis=tuple(a + 1 for a in axes))
+        present = self.present.any(axis=axes)
+        values[:, ~present] = np.nan
+        return WbrCube(values, self.start, self.measures, [dim for dim, _ in kept],
+                       [labels for _, labels in kept], self.unit, present)
+
+    def rolling(self, measure, window, how='sum', min_periods=None):
+        """Trailing `window`-period sum or mean of a measure via cumulative sums.
+
+        Like pandas rolling(): a period is NaN until `min_periods` (default:
+        window) non-missing values are in its window.
+        """
+        if how not in ('sum', 'mean'):
+            raise ValueError(f"how must be 'sum' or 'mean', got {how!r}")
+        x = self.measure(measure)
+        observed = ~np.isnan(x)
+        zeros = np.zeros((1, *x.shape[1:]))
+        totals = np.concatenate([zeros, np.cumsum(np.where(observed, x, 0.0), axis=0)])
+        counts = np.concatenate([zeros, np.cumsum(observed, axis=0)])
+        ends = np.arange(1, len(x) + 1)
+        begins = np.maximum(ends - window, 0)
+        totals = totals[ends] - totals[begins]
+        counts = counts[ends] - counts[begins]
+        if how == 'mean':
+            totals = totals / np.maximum(counts, 1)
+        return np.where(counts >= (window if min_periods is None else min_periods), totals, np.nan)
+
+    def by_weekday(self, measure, func=np.nanmedian, last=None):
+        """func over each weekday's values, shape (7, *dims) indexed by weekday code.
+
+        The periods are padded with NaN to whole Monday-Sunday weeks and reshaped to
+        (weeks, 7, *dims), so every weekday is reduced in one call. `last` keeps only
+        the trailing `last` days.
+        """
+        x = self.measure(measure)
+        weekday = self.weekday()
+        if last is not None:
+            x, weekday = x[-last:], weekday[-last:]
+        if len(x) == 0:
+            return np.full((7, *x.shape[1:]), np.nan)
+        before = int(weekday[0])
+        after = (-(before + len(x))) % 7
+        padded = np.pad(x, [(before, after)] + [(0, 0)] * (x.ndim - 1), constant_values=np.nan)
+        with warnings.catch_warnings():
+            # Weekdays without data give 'All-NaN slice' warnings and a NaN result
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return func(padded.reshape(-1, 7, *x.shape[1:]), axis=0)
+
+    # ---- Conversion ----
+
+    def to_pandas(self, measure=None):
+        """Wide DataFrame sharing the cube's memory.
+
+        Without dimensions: one column per measure. With dimensions: one
+        measure, one column per label combination (a MultiIndex for several).
+        """
+        if not self.dims:
+            if measure is None:
+                return pd.DataFrame(self.values.T, index=self.index, columns=list(self.measures), copy=False)
+            return pd.DataFrame(self.measure(measure).reshape(-1, 1), index=self.index, columns=[measure],
+                                copy=False)
+        if measure is None:
+            raise ValueError(f"pick one of {self.measures} for a cube with dimensions {self.dims}")
+        if len(self.dims) == 1:
+            columns = pd.Index(self.categories[0], name=self.dims[0])
+        else:
+            columns = pd.MultiIndex.from_product(self.categories, names=self.dims)
+        return pd.DataFrame(self.measure(measure).reshape(self.periods, -1), index=self.index, columns=columns,
+                            copy=False)
+
+    def to_arrow(self, observed=False):
+        """Long Arrow table: date, dictionary-encoded dimensions, then the measures.
+
+        Measure columns wrap the cube's buffers without copying; observed=True
+        drops cells without a source row (which copies).
+        """
+        if pa is None:
+            raise ImportError("to_arrow() needs pyarrow")
+        cells = int(np.prod(self.shape))
+        grid = np.indices(self.shape, dtype=np.int32).reshape(len(self.shape), cells)
+        days = (self.dates.astype('datetime64[D]').astype(np.int64)).astype(np.int32)
+        columns = {'date': pa.array(days[grid[0]], type=pa.date32())}
+        for dim, labels, codes in zip(self.dims, self.categories, grid[1:]):
+            columns[dim] = pa.DictionaryArray.from_arrays(codes, pa.array(labels.to_numpy()))
+        for name in self.measures:
+            columns[name] = pa.array(np.ascontiguousarray(self.measure(name)).reshape(cells))
+        table = pa.table(columns)
+        if observed:
+            table = table.filter(pa.array(self.present.reshape(cells)))
+        return table
+
+    def __repr__(self):
+        dims = ', '.join(f"{dim}={len(labels)}" for dim, labels in zip(self.dims, self.categories))
+        end = self.start + (self.periods - 1)
+        return (f"WbrCube({self.start}..{end}, periods={self.periods}{', ' + dims if dims else ''}, "
+                f"measures={list(self.measures)}, {self.nbytes / 2**10:,.0f} KiB)")
+
+
+def load_cube(table_name, data_dir='.', since=None, filename=None):
+    """Cube of one WBR table, read through the Parquet cache"""
+    if table_name not in CUBES:
+        raise ValueError(f"no cube layout for {table_name}; expected one of {list(CUBES)}")
+    spec = CUBES[table_name]
+    df = load_table(table_name, data_dir, since=since, filename=filename)
+    return WbrCube.from_frame(df, SCHEMAS[table_name].date_column, spec.dims, numeric_columns(table_name),
+                              spec.unit)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+EightSleep Business Case - Streaming Weekday Statistics
+Per-weekday spend template and inverse-CAC weights, updated in O(new rows)
+as days arrive instead of re-grouping the whole history
+"""
+
+import heapq
+import logging
+from bisect import bisect_left, insort
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+class RunningMedian:
+    """Exact median of a growing sample: max-heap of the low half, min-heap of the high half"""
+
+    def __init__(self):
+        self.low = []   # negated values
+        self.high = []
+
+    def __len__(self):
+        return len(self.low) + len(self.high)
+
+    def add(self, value):
+        if self.low and value > -self.low[0]:
+            heapq.heappush(self.high, value)
+        else:
+            heapq.heappush(self.low, -value)
+        # Rebalance so len(low) is len(high) or len(high) + 1
+        if len(self.low) > len(self.high) + 1:
+            heapq.heappush(self.high, -heapq.heappop(self.low))
+        elif len(self.high) > len(self.low):
+            heapq.heappush(self.low, -heapq.heappop(self.high))
+
+    def extend(self, values):
+        """Add many values; a batch larger than the sample rebuilds both heaps from a sort"""
+        if len(values) <= len(self):
+            for value in values:
+                self.add(value)
+            return
+        merged = np.sort(np.concatenate([-np.asarray(self.low), np.asarray(self.high), values]))
+        split = (len(merged) + 1) // 2
+        self.low = list(-merged[:split][::-1])  # descending negated == ascending heap
+        self.high = list(merged[split:])        # a sorted list is already a min-heap
+
+    def median(self):
+        if not self.low:
+            return np.nan
+        if len(self.low) > len(self.high):
+            return -self.low[0]
+        return (-self.low[0] + self.high[0]) / 2
+
+
+class WindowedMedian:
+    """Median of the values dated within a sliding window (sorted list + arrival-order deque)"""
+
+    def __init__(self):
+        self.arrivals = deque()  # (date, value), oldest first
+        self.values = []         # same values, sorted
+
+    def add(self, date, value):
+        self.arrivals.append((date, value))
+        insort(self.values, value)
+
+    def evict_before(self, cutoff):
+        while self.arrivals and self.arrivals[0][0] < cutoff:
+            _, value = self.arrivals.popleft()
+            del self.values[bisect_left(self.values, value)]
+
+    def median(self):
+        n = len(self.values)
+        if n == 0:
+            return np.nan
+        mid = n // 2
+        return self.values[mid] if n % 2 else (self.values[mid - 1] + self.values[mid]) / 2
+
+
+class WeekdayStats:
+    """Incremental per-weekday statistics behind the scenario builder.
+
+    Tracks the all-history median CAC and the last-`window_days` median spend
+    for each dayofweek code (0 = Monday). update() only touches rows newer
+    than the last one seen.
+    """
+
+    def __init__(self, window_days=28):
+        self.window_days = window_days
+        self.last_ds = None
+        self.seen = np.zeros(7, dtype=bool)
+        self.cac = [RunningMedian() for _ in range(7)]
+        self.spend = [WindowedMedian() for _ in range(7)]
+
+    @classmethod
+    def from_history(cls, data, window_days=28):
+        stats = cls(window_days)
+        stats.update(data)
+        return stats
+
+    def update(self, rows):
+        """Add ds/spend/cac rows dated after the last update; returns the number of rows added"""
+        ds = pd.to_datetime(rows["ds"]).to_numpy()
+        order = np.argsort(ds, kind="stable")
+        ds = ds[order]
+        if self.last_ds is not None:
+            keep = ds > self.last_ds
+            if not keep.all():
+                logger.info(f"Skipping {int((~keep).sum())} rows at or before {self.last_ds}")
+            order, ds = order[keep], ds[keep]
+        if len(ds) == 0:
+            return 0
+
+        dow = pd.DatetimeIndex(ds).dayofweek.to_numpy()
+        spend = rows["spend"].to_numpy(dtype=float)[order]
+        cac = rows["cac"].to_numpy(dtype=float)[order]
+        self.last_ds = ds[-1]
+        cutoff = self.last_ds - np.timedelta64(self.window_days - 1, "D")
+        # Only rows inside the new window can reach the spend medians
+        in_window = ds >= cutoff
+        for code in np.unique(dow):
+            day = dow == code
+            self.seen[code] = True
+            self.cac[code].extend(cac[day & ~np.isnan(cac)])
+            recent = day & in_window & ~np.isnan(spend)
+            for date, value in zip(ds[recent], spend[recent]):
+                self.spend[code].add(date, value)
+        for window in self.spend:
+            window.evict_before(cutoff)
+        return len(ds)
+
+    def cac_medians(self):
+        """Median CAC per dayofweek code (NaN where no data)"""
+        return np.array([running.median() for running in self.cac])
+
+    def spend_medians(self):
+        """Median spend per dayofweek code over the window (NaN where no data)"""
+        return np.array([window.median() for window in self.spend])
+
+    def weights(self):
+        """Inverse median CAC per dayofweek code, normalized to sum to 1 (NaN where no data)"""
+        medians = self.cac_medians()
+        with np.errstate(divide="ignore"):
+            w = np.where(medians == 0, np.nan, 1.0 / medians)
+        # Weekdays without a usable CAC get the median weight
+        if not np.isnan(w).all():
+            w[self.seen & np.isnan(w)] = np.nanmedian(w)
+        return w / np.nansum(w)
+
+    def wmap(self):
+        """Weekday name -> inverse-CAC weight, as used by the scenario builder"""
+        w = self.weights()
+        return {WEEKDAYS[code]: w[code] for code in range(7) if self.seen[code]}
+
+    def base_spend(self):
+        """Weekday name -> median spend over the window, as used by the scenario builder"""
+        medians = self.spend_medians()
+        return {WEEKDAYS[code]: medians[code] for code in range(7) if self.spend[code].values}
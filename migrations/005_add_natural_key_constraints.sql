@@ -0,0 +1,26 @@
+-- Migration: Add natural key constraints
+-- Description: Unique keys used as upsert conflict targets by import_data.py,
+-- so reloads can upsert in place instead of deleting every row first
+
+-- Remove duplicate natural keys left by earlier loads (keep the newest row)
+DELETE FROM channel_performance a
+USING channel_performance b
+WHERE a.channel = b.channel AND a.month = b.month AND a.id < b.id;
+
+DELETE FROM wbr_global_data a
+USING wbr_global_data b
+WHERE a.date = b.date AND a.id < b.id;
+
+DELETE FROM wbr_regional_data a
+USING wbr_regional_data b
+WHERE a.date = b.date AND a.region = b.region AND a.customer_type = b.customer_type AND a.id < b.id;
+
+-- Add unique constraints on the natural keys
+ALTER TABLE channel_performance
+    ADD CONSTRAINT uq_channel_performance_channel_month UNIQUE (channel, month);
+
+ALTER TABLE wbr_global_data
+    ADD CONSTRAINT uq_wbr_global_data_date UNIQUE (date);
+
+ALTER TABLE wbr_regional_data
+    ADD CONSTRAINT uq_wbr_regional_data_date_region_customer_type UNIQUE (date, region, customer_type);
@@ -0,0 +1,176 @@
+-- Migration: Create rollup tables for dashboards
+-- Description: Pre-aggregated weekly/monthly rollups so Metabase cards read a few
+-- hundred rows instead of re-aggregating daily data. The import scripts call the
+-- refresh_*_rollups() functions after each load, passing the first loaded date,
+-- so only the affected weeks/months are recomputed.
+-- Note: channel_performance is reported monthly, so its rollup is monthly only.
+
+-- Channel KPIs by month
+CREATE TABLE IF NOT EXISTS rollup_channel_monthly (
+    month DATE NOT NULL,
+    channel VARCHAR(100) NOT NULL,
+    spend DECIMAL(15,2),
+    visitors BIGINT,
+    orders BIGINT,
+    revenue DECIMAL(15,2),
+    cac DECIMAL(15,2),
+    roi DECIMAL(15,4),
+    aov DECIMAL(15,2),
+    PRIMARY KEY (month, channel)
+);
+
+-- Global spend/orders/bookings by week and by month
+CREATE TABLE IF NOT EXISTS rollup_global_weekly (
+    week_start DATE PRIMARY KEY,
+    days INTEGER,
+    spend DECIMAL(15,2),
+    orders BIGINT,
+    bookings DECIMAL(15,2),
+    visitors BIGINT,
+    cac DECIMAL(15,2),
+    aov DECIMAL(15,2)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_global_monthly (
+    month DATE PRIMARY KEY,
+    days INTEGER,
+    spend DECIMAL(15,2),
+    orders BIGINT,
+    bookings DECIMAL(15,2),
+    visitors BIGINT,
+    cac DECIMAL(15,2),
+    aov DECIMAL(15,2)
+);
+
+-- Regional bookings/orders/units by region x customer type, by week and by month
+CREATE TABLE IF NOT EXISTS rollup_regional_weekly (
+    week_start DATE NOT NULL,
+    region VARCHAR(10) NOT NULL,
+    customer_type VARCHAR(100) NOT NULL,
+    bookings DECIMAL(15,2),
+    orders BIGINT,
+    units BIGINT,
+    aov DECIMAL(15,2),
+    PRIMARY KEY (week_start, region, customer_type)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_regional_monthly (
+    month DATE NOT NULL,
+    region VARCHAR(10) NOT NULL,
+    customer_type VARCHAR(100) NOT NULL,
+    bookings DECIMAL(15,2),
+    orders BIGINT,
+    units BIGINT,
+    aov DECIMAL(15,2),
+    PRIMARY KEY (month, region, customer_type)
+);
+
+-- Add comments for documentation
+COMMENT ON TABLE rollup_channel_monthly IS 'Monthly channel KPIs (CAC = spend/orders, ROI = revenue/spend, AOV = revenue/orders)';
+COMMENT ON TABLE rollup_global_weekly IS 'Weekly (Monday start) totals of wbr_global_data';
+COMMENT ON TABLE rollup_global_monthly IS 'Monthly totals of wbr_global_data';
+COMMENT ON TABLE rollup_regional_weekly IS 'Weekly (Monday start) totals of wbr_regional_data by region and customer type';
+COMMENT ON TABLE rollup_regional_monthly IS 'Monthly totals of wbr_regional_data by region and customer type';
+
+-- Refresh functions: recompute every period touching p_from or later (NULL = full rebuild)
+CREATE OR REPLACE FUNCTION refresh_channel_rollups(p_from DATE DEFAULT NULL)
+RETURNS VOID AS $$
+DECLARE
+    month_from DATE := COALESCE(date_trunc('month', p_from)::DATE, '-infinity'::DATE);
+BEGIN
+    DELETE FROM rollup_channel_monthly WHERE month >= month_from;
+    INSERT INTO rollup_channel_monthly (month, channel, spend, visitors, orders, revenue, cac, roi, aov)
+    SELECT
+        date_trunc('month', month)::DATE,
+        channel,
+        SUM(spend),
+        SUM(visitors),
+        SUM(last_click_orders),
+        SUM(last_click_revenue),
+        SUM(spend) / NULLIF(SUM(last_click_orders), 0),
+        SUM(last_click_revenue) / NULLIF(SUM(spend), 0),
+        SUM(last_click_revenue) / NULLIF(SUM(last_click_orders), 0)
+    FROM channel_performance
+    WHERE month >= month_from
+    GROUP BY 1, 2;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION refresh_global_rollups(p_from DATE DEFAULT NULL)
+RETURNS VOID AS $$
+DECLARE
+    week_from DATE := COALESCE(date_trunc('week', p_from)::DATE, '-infinity'::DATE);
+    month_from DATE := COALESCE(date_trunc('month', p_from)::DATE, '-infinity'::DATE);
+BEGIN
+    DELETE FROM rollup_global_weekly WHERE week_start >= week_from;
+    INSERT INTO rollup_global_weekly (week_start, days, spend, orders, bookings, visitors, cac, aov)
+    SELECT
+        date_trunc('week', date)::DATE,
+        COUNT(*),
+        SUM(daily_spend),
+        SUM(orders),
+        SUM(bookings),
+        SUM(visitors),
+        SUM(daily_spend) / NULLIF(SUM(orders), 0),
+        SUM(bookings) / NULLIF(SUM(orders), 0)
+    FROM wbr_global_data
+    WHERE date >= week_from
+    GROUP BY 1;
+
+    DELETE FROM rollup_global_monthly WHERE month >= month_from;
+    INSERT INTO rollup_global_monthly (month, days, spend, orders, bookings, visitors, cac, aov)
+    SELECT
+        date_trunc('month', date)::DATE,
+        COUNT(*),
+        SUM(daily_spend),
+        SUM(orders),
+        SUM(bookings),
+        SUM(visitors),
+        SUM(daily_spend) / NULLIF(SUM(orders), 0),
+        SUM(bookings) / NULLIF(SUM(orders), 0)
+    FROM wbr_global_data
+    WHERE date >= month_from
+    GROUP BY 1;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION refresh_regional_rollups(p_from DATE DEFAULT NULL)
+RETURNS VOID AS $$
+DECLARE
+    week_from DATE := COALESCE(date_trunc('week', p_from)::DATE, '-infinity'::DATE);
+    month_from DATE := COALESCE(date_trunc('month', p_from)::DATE, '-infinity'::DATE);
+BEGIN
+    DELETE FROM rollup_regional_weekly WHERE week_start >= week_from;
+    INSERT INTO rollup_regional_weekly (week_start, region, customer_type, bookings, orders, units, aov)
+    SELECT
+        date_trunc('week', date)::DATE,
+        region,
+        customer_type,
+        SUM(bookings),
+        SUM(orders),
+        SUM(units),
+        SUM(bookings) / NULLIF(SUM(orders), 0)
+    FROM wbr_regional_data
+    WHERE date >= week_from
+    GROUP BY 1, 2, 3;
+
+    DELETE FROM rollup_regional_monthly WHERE month >= month_from;
+    INSERT INTO rollup_regional_monthly (month, region, customer_type, bookings, orders, units, aov)
+    SELECT
+        date_trunc('month', date)::DATE,
+        region,
+        customer_type,
+        SUM(bookings),
+        SUM(orders),
+        SUM(units),
+        SUM(bookings) / NULLIF(SUM(orders), 0)
+    FROM wbr_regional_data
+    WHERE date >= month_from
+    GROUP BY 1, 2, 3;
+END;
+$$ language 'plpgsql';
+
+-- Initial build
+SELECT refresh_channel_rollups();
+SELECT refresh_global_rollups();
+SELECT refresh_regional_rollups();
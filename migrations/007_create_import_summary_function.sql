@@ -0,0 +1,24 @@
+-- Migration: Create import summary function
+-- Description: Row counts and sample rows for every source table in one call,
+-- so the import scripts verify a load with a single round-trip
+
+CREATE OR REPLACE FUNCTION import_summary(p_sample_rows INTEGER DEFAULT 3)
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'channel_performance', json_build_object(
+            'count', (SELECT COUNT(*) FROM channel_performance),
+            'sample', (SELECT COALESCE(json_agg(s), '[]'::JSON) FROM (
+                SELECT channel, spend, visitors FROM channel_performance LIMIT p_sample_rows) s)
+        ),
+        'wbr_global_data', json_build_object(
+            'count', (SELECT COUNT(*) FROM wbr_global_data),
+            'sample', (SELECT COALESCE(json_agg(s), '[]'::JSON) FROM (
+                SELECT date, daily_spend, orders FROM wbr_global_data LIMIT p_sample_rows) s)
+        ),
+        'wbr_regional_data', json_build_object(
+            'count', (SELECT COUNT(*) FROM wbr_regional_data),
+            'sample', (SELECT COALESCE(json_agg(s), '[]'::JSON) FROM (
+                SELECT date, customer_type, region, bookings FROM wbr_regional_data LIMIT p_sample_rows) s)
+        )
+    );
+$$ language 'sql' STABLE;
@@ -0,0 +1,104 @@
+-- Migration: Create forecast tables
+-- Description: CAC forecast runs written back by forecast_writer.py: one row per run,
+-- plus its scenario summaries, daily scenario forecasts and cross-validation metrics,
+-- all tagged with the run id. A run is visible to the latest_* views once
+-- complete_forecast_run() marks it complete; that call also prunes old runs.
+
+CREATE TABLE IF NOT EXISTS forecast_runs (
+    run_id UUID PRIMARY KEY,
+    status VARCHAR(20) NOT NULL DEFAULT 'loading' CHECK (status IN ('loading', 'complete')),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    completed_at TIMESTAMP WITH TIME ZONE,
+    model VARCHAR(20),
+    history_start DATE,
+    history_end DATE,
+    forecast_start DATE,
+    horizon_days INTEGER,
+    params JSONB
+);
+
+-- Scenario totals with bootstrapped P10/P50/P90 orders and CAC
+CREATE TABLE IF NOT EXISTS forecast_scenarios (
+    run_id UUID NOT NULL REFERENCES forecast_runs(run_id) ON DELETE CASCADE,
+    scenario VARCHAR(100) NOT NULL,
+    horizon_days INTEGER,
+    total_spend DECIMAL(15,2),
+    pred_orders DECIMAL(15,1),
+    projected_cac DECIMAL(15,2),
+    pred_orders_p10 DECIMAL(15,1),
+    pred_orders_p50 DECIMAL(15,1),
+    pred_orders_p90 DECIMAL(15,1),
+    projected_cac_p10 DECIMAL(15,2),
+    projected_cac_p50 DECIMAL(15,2),
+    projected_cac_p90 DECIMAL(15,2),
+    PRIMARY KEY (run_id, scenario)
+);
+
+-- Daily spend plan and predicted orders per scenario
+CREATE TABLE IF NOT EXISTS forecast_daily (
+    run_id UUID NOT NULL REFERENCES forecast_runs(run_id) ON DELETE CASCADE,
+    scenario VARCHAR(100) NOT NULL,
+    date DATE NOT NULL,
+    weekday VARCHAR(10),
+    spend DECIMAL(15,2),
+    pred_orders DOUBLE PRECISION,
+    PRIMARY KEY (run_id, scenario, date)
+);
+
+-- Rolling-origin CV accuracy by horizon (prophet performance_metrics)
+CREATE TABLE IF NOT EXISTS forecast_cv_metrics (
+    run_id UUID NOT NULL REFERENCES forecast_runs(run_id) ON DELETE CASCADE,
+    horizon_days INTEGER NOT NULL,
+    mse DOUBLE PRECISION,
+    rmse DOUBLE PRECISION,
+    mae DOUBLE PRECISION,
+    mape DOUBLE PRECISION,
+    mdape DOUBLE PRECISION,
+    smape DOUBLE PRECISION,
+    coverage DOUBLE PRECISION,
+    PRIMARY KEY (run_id, horizon_days)
+);
+
+-- Latest complete run lookups
+CREATE INDEX IF NOT EXISTS idx_forecast_runs_status_created_at ON forecast_runs(status, created_at DESC);
+
+-- Add comments for documentation
+COMMENT ON TABLE forecast_runs IS 'One row per CAC forecast run; status becomes complete once all its rows are loaded';
+COMMENT ON TABLE forecast_scenarios IS 'Scenario totals per run: spend, predicted orders, projected CAC and their P10/P50/P90';
+COMMENT ON TABLE forecast_daily IS 'Daily spend and predicted orders per run and scenario';
+COMMENT ON TABLE forecast_cv_metrics IS 'Cross-validation accuracy (rmse, mape, mae, ...) per run and horizon day';
+
+-- The most recent complete run and its rows, for dashboards
+CREATE OR REPLACE VIEW latest_forecast_run AS
+SELECT * FROM forecast_runs WHERE status = 'complete' ORDER BY created_at DESC LIMIT 1;
+
+CREATE OR REPLACE VIEW latest_forecast_scenarios AS
+SELECT s.* FROM forecast_scenarios s JOIN latest_forecast_run r USING (run_id);
+
+CREATE OR REPLACE VIEW latest_forecast_daily AS
+SELECT d.* FROM forecast_daily d JOIN latest_forecast_run r USING (run_id);
+
+CREATE OR REPLACE VIEW latest_forecast_cv_metrics AS
+SELECT m.* FROM forecast_cv_metrics m JOIN latest_forecast_run r USING (run_id);
+
+-- Mark a run complete, then keep the newest p_keep complete runs (all when NULL) and
+-- drop loads abandoned for over a day; returns the number of runs removed
+CREATE OR REPLACE FUNCTION complete_forecast_run(p_run_id UUID, p_keep INTEGER DEFAULT 30)
+RETURNS INTEGER AS $$
+DECLARE
+    pruned INTEGER;
+BEGIN
+    UPDATE forecast_runs SET status = 'complete', completed_at = NOW() WHERE run_id = p_run_id;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'forecast run % does not exist', p_run_id;
+    END IF;
+
+    DELETE FROM forecast_runs
+    WHERE (status = 'complete' AND run_id NOT IN (
+              SELECT run_id FROM forecast_runs WHERE status = 'complete'
+              ORDER BY created_at DESC LIMIT p_keep))
+       OR (status = 'loading' AND created_at < NOW() - INTERVAL '1 day');
+    GET DIAGNOSTICS pruned = ROW_COUNT;
+    RETURN pruned;
+END;
+$$ language 'plpgsql';
@@ -5,10 +5,25 @@ Imports all CSV datasets into Supabase database
 """
 
 import pandas as pd
+import argparse
+import asyncio
+import math
 import os
-from supabase import create_client, Client
+import sys
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from supabase import acreate_client, AsyncClient
 import logging
 
+# Shared cleaning schemas live next to the notebooks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'jupyter-notebook'))
+from cleaning import SCHEMAS
+from data_access import DEFAULT_MEMORY_LIMIT, iter_table
+import instrumentation
+from instrumentation import span
+from verification import log_import_summary
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,167 +32,303 @@ logger = logging.getLogger(__name__)
 SUPABASE_URL = "https://lmokzxpktcchregvavna.supabase.co"
 SUPABASE_KEY = "YOUR_SUPABASE_ANON_KEY"  # Get this from your Supabase dashboard
 
-def create_supabase_client() -> Client:
-    """Create Supabase client"""
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
-
-def clean_currency_column(df, column_name):
-    """Clean currency columns by removing $ and , and converting to float"""
-    if column_name in df.columns:
-        df[column_name] = df[column_name].astype(str).str.replace('$', '').str.replace(',', '')
-        df[column_name] = pd.to_numeric(df[column_name], errors='coerce')
-    return df
-
-def clean_numeric_column(df, column_name):
-    """Clean numeric columns by removing , and converting to int"""
-    if column_name in df.columns:
-        df[column_name] = df[column_name].astype(str).str.replace(',', '')
-        df[column_name] = pd.to_numeric(df[column_name], errors='coerce').astype('Int64')
-    return df
-
-def import_channel_performance(supabase: Client):
+# Rows per upsert request; keeps request bodies well under the PostgREST limits
+DEFAULT_BATCH_SIZE = 1000
+
+# Upsert/RPC requests in flight at once across all tables
+DEFAULT_CONCURRENCY = 4
+
+# Source CSVs are read from here
+DATASETS_DIR = 'datasets'
+
+# Dashboard rollup refresh function per source table (see 006_create_rollup_tables.sql)
+ROLLUP_FUNCTIONS = {
+    'channel_performance': 'refresh_channel_rollups',
+    'wbr_global_data': 'refresh_global_rollups',
+    'wbr_regional_data': 'refresh_regional_rollups',
+}
+
+@dataclass
+class ImportStats:
+    """Row count and wall time for one table load"""
+    table: str
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else float('inf')
+
+async def create_supabase_client() -> AsyncClient:
+    """Create async Supabase client"""
+    return await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+
+def to_json_value(value):
+    """Convert a pandas/numpy cell into a JSON-serializable value"""
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        # Timestamps only come from DATE columns
+        return value.date().isoformat()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        # numpy scalars
+        value = value.item()
+        if isinstance(value, float) and math.isnan(value):
+            return None
+    return value
+
+def iter_record_batches(df, batch_size):
+    """Yield lists of at most batch_size records without materializing the whole table"""
+    columns = list(df.columns)
+    batch = []
+    for row in df.itertuples(index=False, name=None):
+        batch.append({column: to_json_value(value) for column, value in zip(columns, row)})
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def upsert_dataframe(supabase: AsyncClient, table_name, df, batch_size=DEFAULT_BATCH_SIZE, full_refresh=False,
+                           concurrency=DEFAULT_CONCURRENCY, limiter=None, key_columns=None):
+    """Upsert a cleaned DataFrame in concurrent batches, keyed on the table's natural key.
+
+    Up to `concurrency` batches are sent at once; a shared `limiter`
+    (asyncio.Semaphore) bounds the requests in flight across tables.
+    key_columns overrides the conflict target (e.g. for tables outside SCHEMAS).
+    """
+    key_columns = list(key_columns or SCHEMAS[table_name].natural_key)
+    limiter = limiter or asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+
+    # Postgres rejects an upsert that touches the same key twice in one statement,
+    # and deduplicated batches can't conflict with each other, so they can be sent in any order
+    df = df.drop_duplicates(subset=key_columns, keep='last')
+
+    if full_refresh:
+        async with limiter:
+            with span('delete'):
+                await supabase.table(table_name).delete().neq('id', 0).execute()
+
+    on_conflict = ','.join(key_columns)
+    batches = iter_record_batches(df, batch_size)
+    rows = 0
+
+    async def send_batches():
+        # Workers pull from the shared generator, so only the batches in flight are materialized
+        nonlocal rows
+        for batch in batches:
+            async with limiter:
+                await supabase.table(table_name).upsert(batch, on_conflict=on_conflict).execute()
+            rows += len(batch)
+            logger.debug(f"  {table_name}: {rows}/{len(df)} rows")
+
+    await asyncio.gather(*(send_batches() for _ in range(max(concurrency, 1))))
+
+    return ImportStats(table_name, rows, time.perf_counter() - start)
+
+async def upsert_chunks(supabase: AsyncClient, table_name, chunks, batch_size=DEFAULT_BATCH_SIZE, full_refresh=False,
+                        concurrency=DEFAULT_CONCURRENCY, limiter=None):
+    """Upsert an iterable of cleaned chunks (see data_access.iter_table) one after another.
+
+    Each chunk is read in a worker thread and finished before the next one,
+    so only one chunk is in memory and later rows still win over earlier ones
+    with the same key.
+    """
+    start = time.perf_counter()
+    rows = 0
+    first = True
+    chunks = iter(chunks)
+    while (df := await asyncio.to_thread(next, chunks, None)) is not None:
+        with span('upsert', rows=len(df)):
+            stats = await upsert_dataframe(supabase, table_name, df, batch_size, full_refresh and first,
+                                           concurrency, limiter)
+        rows += stats.rows
+        first = False
+    if full_refresh and first:
+        # Nothing to load, but the table is still emptied
+        async with (limiter or asyncio.Semaphore(1)):
+            await supabase.table(table_name).delete().neq('id', 0).execute()
+    return ImportStats(table_name, rows, time.perf_counter() - start)
+
+async def refresh_rollups(supabase: AsyncClient, table_name, since=None, limiter=None):
+    """Recompute the dashboard rollups fed by a table, from `since` (all periods when None)"""
+    function = ROLLUP_FUNCTIONS[table_name]
+    async with (limiter or asyncio.Semaphore(1)):
+        with span('refresh_rollups'):
+            await supabase.rpc(function, {'p_from': since.isoformat() if since else None}).execute()
+    logger.info(f"Refreshed {function}" + (f" from {since}" if since else ""))
+
+async def get_latest_loaded_date(supabase: AsyncClient, table_name):
+    """Return the most recent date/month already loaded into a table, or None if it is empty"""
+    column = SCHEMAS[table_name].date_column
+    result = await supabase.table(table_name).select(column).order(column, desc=True).limit(1).execute()
+    if not result.data:
+        return None
+    return date.fromisoformat(result.data[0][column])
+
+async def get_incremental_start(supabase: AsyncClient, table_name, resync_days=0):
+    """First date to (re)load in incremental mode.
+
+    The latest loaded period is always re-synced so partially loaded days and
+    months are completed; resync_days widens that window to catch restatements.
+    """
+    latest = await get_latest_loaded_date(supabase, table_name)
+    if latest is None:
+        logger.info(f"  {table_name} is empty, loading full history")
+        return None
+    start = latest - timedelta(days=resync_days)
+    logger.info(f"  {table_name}: latest loaded {latest}, loading rows from {start}")
+    return start
+
+def report_throughput(stats):
+    """Log rows/s per table"""
+    logger.info("\nImport throughput:")
+    for stat in stats:
+        logger.info(f"  {stat.table}: {stat.rows} rows in {stat.seconds:.2f}s ({stat.rows_per_second:,.0f} rows/s)")
+
+async def import_channel_performance(supabase: AsyncClient, batch_size=DEFAULT_BATCH_SIZE, full_refresh=False, since=None,
+                                     concurrency=DEFAULT_CONCURRENCY, limiter=None, skip_rollups=False,
+                                     memory_limit=DEFAULT_MEMORY_LIMIT, data_dir=None):
     """Import channel performance data"""
     logger.info("Importing channel performance data...")
     
-    # Read CSV
-    df = pd.read_csv('datasets/channel_performance.csv')
-    
-    # Clean data
-    df = clean_currency_column(df, 'Spend')
-    df = clean_currency_column(df, 'Last Click Revenue')
-    df['Month'] = pd.to_datetime(df['Month']).dt.date
-    
-    # Rename columns to match database
-    df = df.rename(columns={
-        'Channel': 'channel',
-        'Spend': 'spend',
-        'Month': 'month',
-        'Visitors': 'visitors',
-        'Last Click Add To Cart': 'last_click_add_to_cart',
-        'Last Click Orders': 'last_click_orders',
-        'Last Click Revenue': 'last_click_revenue',
-        'Last Click Email Captures': 'last_click_email_captures',
-        'Email capture conversions 30 day window': 'email_capture_conversions_30_day',
-        'Email capture conversions 60 day window': 'email_capture_conversions_60_day'
-    })
-    
-    # Convert to records and insert
-    records = df.to_dict('records')
-    
-    # Clear existing data
-    supabase.table('channel_performance').delete().neq('id', 0).execute()
-    
-    # Insert new data
-    result = supabase.table('channel_performance').insert(records).execute()
-    logger.info(f"Imported {len(records)} channel performance records")
-
-def import_wbr_global_data(supabase: Client):
-    """Import WBR global data"""
-    logger.info("Importing WBR global data...")
+    # Stream the cleaned CSV in chunks under the memory ceiling, from the Parquet cache when unchanged
+    chunks = iter_table('channel_performance', data_dir or DATASETS_DIR, since, memory_limit=memory_limit)
     
-    # Read CSV
-    df = pd.read_csv('datasets/wbr_Global_data.csv')
+    # Upsert each chunk in concurrent batches keyed on the natural key
+    with span('channel_performance') as s:
+        stats = await upsert_chunks(supabase, 'channel_performance', chunks, batch_size, full_refresh, concurrency, limiter)
+        s.rows = stats.rows
+    logger.info(f"Imported {stats.rows} channel performance records")
     
-    # Clean data
-    df = clean_currency_column(df, 'Daily Spend')
-    df = clean_currency_column(df, 'Bookings')
-    df['Date'] = pd.to_datetime(df['Date']).dt.date
-    df = clean_numeric_column(df, 'Visitors')
-    
-    # Rename columns to match database
-    df = df.rename(columns={
-        'Date': 'date',
-        'Daily Spend': 'daily_spend',
-        'Orders': 'orders',
-        'Bookings': 'bookings',
-        'Visitors': 'visitors'
-    })
+    # Refresh this table's dashboard rollups for the loaded periods only
+    if not skip_rollups:
+        await refresh_rollups(supabase, 'channel_performance', since, limiter)
+    return stats
+
+async def import_wbr_global_data(supabase: AsyncClient, batch_size=DEFAULT_BATCH_SIZE, full_refresh=False, since=None,
+                                 concurrency=DEFAULT_CONCURRENCY, limiter=None, skip_rollups=False,
+                                 memory_limit=DEFAULT_MEMORY_LIMIT, data_dir=None):
+    """Import WBR global data"""
+    logger.info("Importing WBR global data...")
     
-    # Convert to records and insert
-    records = df.to_dict('records')
+    # Stream the cleaned CSV in chunks under the memory ceiling, from the Parquet cache when unchanged
+    chunks = iter_table('wbr_global_data', data_dir or DATASETS_DIR, since, memory_limit=memory_limit)
     
-    # Clear existing data
-    supabase.table('wbr_global_data').delete().neq('id', 0).execute()
+    # Upsert each chunk in concurrent batches keyed on the natural key
+    with span('wbr_global_data') as s:
+        stats = await upsert_chunks(supabase, 'wbr_global_data', chunks, batch_size, full_refresh, concurrency, limiter)
+        s.rows = stats.rows
+    logger.info(f"Imported {stats.rows} WBR global records")
     
-    # Insert new data
-    result = supabase.table('wbr_global_data').insert(records).execute()
-    logger.info(f"Imported {len(records)} WBR global records")
+    # Refresh this table's dashboard rollups for the loaded periods only
+    if not skip_rollups:
+        await refresh_rollups(supabase, 'wbr_global_data', since, limiter)
+    return stats
 
-def import_wbr_regional_data(supabase: Client):
+async def import_wbr_regional_data(supabase: AsyncClient, batch_size=DEFAULT_BATCH_SIZE, full_refresh=False, since=None,
+                                   concurrency=DEFAULT_CONCURRENCY, limiter=None, skip_rollups=False,
+                                   memory_limit=DEFAULT_MEMORY_LIMIT, data_dir=None):
     """Import WBR regional data"""
     logger.info("Importing WBR regional data...")
     
-    # Read CSV
-    df = pd.read_csv('datasets/wbr_regional_data.csv')
-    
-    # Clean data - remove empty columns
-    df = df.dropna(how='all', axis=1)
+    # Stream the cleaned CSV in chunks under the memory ceiling, from the Parquet cache when unchanged
+    chunks = iter_table('wbr_regional_data', data_dir or DATASETS_DIR, since, memory_limit=memory_limit)
     
-    # Clean currency columns
-    df = clean_currency_column(df, 'Bookings')
+    # Upsert each chunk in concurrent batches keyed on the natural key
+    with span('wbr_regional_data') as s:
+        stats = await upsert_chunks(supabase, 'wbr_regional_data', chunks, batch_size, full_refresh, concurrency, limiter)
+        s.rows = stats.rows
+    logger.info(f"Imported {stats.rows} WBR regional records")
     
-    # Convert date
-    df['Date'] = pd.to_datetime(df['Date']).dt.date
-    
-    # Rename columns to match database
-    df = df.rename(columns={
-        'Date': 'date',
-        'Customer Type': 'customer_type',
-        'Region': 'region',
-        'Bookings': 'bookings',
-        'Orders': 'orders',
-        'Units': 'units'
-    })
-    
-    # Convert to records and insert
-    records = df.to_dict('records')
-    
-    # Clear existing data
-    supabase.table('wbr_regional_data').delete().neq('id', 0).execute()
-    
-    # Insert new data
-    result = supabase.table('wbr_regional_data').insert(records).execute()
-    logger.info(f"Imported {len(records)} WBR regional records")
+    # Refresh this table's dashboard rollups for the loaded periods only
+    if not skip_rollups:
+        await refresh_rollups(supabase, 'wbr_regional_data', since, limiter)
+    return stats
+
+async def import_all(supabase: AsyncClient, batch_size=DEFAULT_BATCH_SIZE, full_refresh=False, since=None,
+                     concurrency=DEFAULT_CONCURRENCY, skip_rollups=False, memory_limit=DEFAULT_MEMORY_LIMIT,
+                     data_dir=None):
+    """Import every table concurrently; at most `concurrency` requests are in flight overall"""
+    since = since or {}
+    limiter = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*(
+        import_table(supabase, batch_size, full_refresh, since.get(table_name), concurrency, limiter, skip_rollups,
+                     memory_limit, data_dir)
+        for table_name, import_table in (('channel_performance', import_channel_performance),
+                                         ('wbr_global_data', import_wbr_global_data),
+                                         ('wbr_regional_data', import_wbr_regional_data))
+    ))
 
-def verify_import(supabase: Client):
+async def verify_import(supabase: AsyncClient):
     """Verify the data import"""
     logger.info("Verifying data import...")
     
-    # Check row counts
-    channel_count = supabase.table('channel_performance').select('*', count='exact').execute()
-    global_count = supabase.table('wbr_global_data').select('*', count='exact').execute()
-    regional_count = supabase.table('wbr_regional_data').select('*', count='exact').execute()
-    
-    logger.info(f"Channel Performance: {channel_count.count} rows")
-    logger.info(f"WBR Global Data: {global_count.count} rows")
-    logger.info(f"WBR Regional Data: {regional_count.count} rows")
+    # Counts and samples for every table in one round-trip (007_create_import_summary_function.sql)
+    with span('verify'):
+        result = await supabase.rpc('import_summary', {'p_sample_rows': 3}).execute()
+    log_import_summary(result.data)
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Import EightSleep CSV datasets into Supabase")
+    parser.add_argument('--data-dir', default=DATASETS_DIR,
+                        help=f"folder holding the source CSVs (default: {DATASETS_DIR})")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"rows per upsert request (default: {DEFAULT_BATCH_SIZE})")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--full-refresh', action='store_true',
+                      help="delete all existing rows before loading")
+    mode.add_argument('--incremental', action='store_true',
+                      help="only load rows on or after the latest loaded date/month of each table")
+    parser.add_argument('--resync-days', type=int, default=0,
+                        help="with --incremental, also re-load this many days before the latest loaded date")
+    parser.add_argument('--skip-rollups', action='store_true',
+                        help="do not refresh the dashboard rollup tables after loading")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"requests in flight at once across all tables (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument('--memory-limit', type=int, default=DEFAULT_MEMORY_LIMIT // 2**20,
+                        help="MB one chunk may use on its way from CSV to Supabase, per table "
+                             f"(default: {DEFAULT_MEMORY_LIMIT // 2**20})")
+    instrumentation.add_arguments(parser)
+    return parser.parse_args(argv)
+
+async def run_import(args):
+    """Load every table concurrently, then verify"""
+    # Create Supabase client
+    supabase = await create_supabase_client()
     
-    # Show sample data
-    logger.info("\nSample Channel Performance:")
-    sample = supabase.table('channel_performance').select('*').limit(3).execute()
-    for row in sample.data:
-        logger.info(f"  {row['channel']}: ${row['spend']} - {row['visitors']} visitors")
+    # Work out where each table's delta starts
+    since = {table_name: None for table_name in SCHEMAS}
+    if args.incremental:
+        logger.info("Incremental mode: checking latest loaded dates...")
+        starts = await asyncio.gather(*(get_incremental_start(supabase, table_name, args.resync_days)
+                                        for table_name in SCHEMAS))
+        since = dict(zip(SCHEMAS, starts))
     
-    logger.info("\nSample WBR Global Data:")
-    sample = supabase.table('wbr_global_data').select('*').limit(3).execute()
-    for row in sample.data:
-        logger.info(f"  {row['date']}: ${row['daily_spend']} - {row['orders']} orders")
+    # Import all datasets (and refresh their rollups) concurrently
+    with span('import'):
+        stats = await import_all(supabase, args.batch_size, args.full_refresh, since,
+                                 args.concurrency, args.skip_rollups, args.memory_limit * 2**20,
+                                 args.data_dir)
+    report_throughput(stats)
     
-    logger.info("\nSample WBR Regional Data:")
-    sample = supabase.table('wbr_regional_data').select('*').limit(3).execute()
-    for row in sample.data:
-        logger.info(f"  {row['date']} - {row['customer_type']} - {row['region']}: ${row['bookings']}")
+    # Verify import
+    await verify_import(supabase)
 
-def main():
+def main(argv=None):
     """Main import function"""
+    args = parse_args(argv)
+    instrumentation.configure_from_args(args)
     logger.info("Starting EightSleep data import...")
     
     # Check if CSV files exist
-    required_files = [
-        'datasets/channel_performance.csv',
-        'datasets/wbr_Global_data.csv',
-        'datasets/wbr_regional_data.csv'
-    ]
+    required_files = [os.path.join(args.data_dir, schema.filename) for schema in SCHEMAS.values()]
     
     for file_path in required_files:
         if not os.path.exists(file_path):
@@ -185,22 +336,15 @@ def main():
             return
     
     try:
-        # Create Supabase client
-        supabase = create_supabase_client()
-        
-        # Import all datasets
-        import_channel_performance(supabase)
-        import_wbr_global_data(supabase)
-        import_wbr_regional_data(supabase)
-        
-        # Verify import
-        verify_import(supabase)
+        asyncio.run(run_import(args))
         
         logger.info("✅ Data import completed successfully!")
         
     except Exception as e:
         logger.error(f"❌ Import failed: {str(e)}")
         raise
+    finally:
+        instrumentation.finish(args)
 
 if __name__ == "__main__":
     main()